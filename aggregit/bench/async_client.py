@@ -0,0 +1,70 @@
+"""
+Async client benchmark.
+
+Compare the time for the PR report with the REST backend, one PR at a time and
+with a thread pool, and with the async backend, against a fake GitHub server
+which adds latency to each response.
+
+Usage:
+    $ cd aggregit
+    $ python -m bench.async_client
+    $ python -m bench.async_client REPOS PRS LATENCY_MS
+
+The defaults are 10 repos of 30 PRs and 50ms of latency. Needs the `aiohttp`
+package for the async backend.
+
+Each run is in a new process, with the same config as in `bench.reports`, so
+that only the clients are compared.
+"""
+import sys
+
+from bench.fake_github import FakeGitHub
+from bench.reports import DEFAULT_RATE_LIMIT, run_report
+
+RUNS = (
+    ("rest", 1),
+    ("rest", 8),
+    ("async", 1),
+)
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    repos, prs, latency_ms = (int(arg) for arg in args) if args else (10, 30, 50)
+
+    server = FakeGitHub(
+        repos=repos,
+        prs=prs,
+        latency=latency_ms / 1000,
+        rate_limit=DEFAULT_RATE_LIMIT,
+    )
+    base_url = server.start()
+
+    print(f"Repos: {repos} - PRs per repo: {prs} - latency: {latency_ms}ms")
+    print()
+    print("Backend | Workers | Requests | Seconds | Requests/s")
+    print("---     | ---     | ---      | ---     | ---")
+
+    for backend, workers in RUNS:
+        requests_before = server.requests
+        seconds, _ = run_report(
+            base_url,
+            server.org,
+            "pr_report",
+            {"PR_BACKEND": backend, "PR_WORKERS": workers},
+        )
+
+        requests = server.requests - requests_before
+        workers_label = workers if backend == "rest" else "-"
+        print(
+            f"{backend:7} | {workers_label:>7} | {requests:8,d} | {seconds:7.2f}"
+            f" | {requests / seconds:10.1f}"
+        )
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
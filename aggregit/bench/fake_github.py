@@ -0,0 +1,889 @@
+"""
+Fake GitHub API server.
+
+Serve synthetic orgs, repos, PRs, reviews, branches and commits over HTTP, so
+that the reports and clients can be measured without using GitHub.
+
+Usage:
+    from bench.fake_github import FakeGitHub
+
+    server = FakeGitHub(seed=1, repos=2, prs=50, latency=0.05)
+    base_url = server.start()
+    ...
+    print(server.requests)
+    server.stop()
+
+    server = FakeGitHub.from_profile("large", latency=0.02)
+
+Or serve a profile on a port, to point the reports at it with `BASE_URL` in
+the local config:
+
+    $ cd aggregit
+    $ python -m bench.fake_github
+    $ python -m bench.fake_github PROFILE PORT
+
+The data is generated from the seed and sizes, so it is the same on each run.
+Each response waits for the latency first, to stand in for the network. Only
+the endpoints and fields used by this project are served, for the REST API and
+the GraphQL queries in `lib.graphql`.
+
+Listings are paged with Link headers, with at most `max_per_page` items per
+page. A search for PRs supports the qualifiers used by the PR report, and only
+gives the first 1,000 results like the Search API. Responses have rate limit
+headers for the core, search and graphql resources,
+and a request after the limit is used up gets a rate limit error until the
+window resets. Responses have an ETag, so that a conditional request gets a
+304 response, which does not count against the rate limit.
+"""
+
+import collections
+import datetime
+import hashlib
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+DEFAULT_PER_PAGE = 30
+MAX_SEARCH_RESULTS = 1000
+# Check of a PR's state for each state qualifier of a search.
+SEARCH_STATES = {
+    "open": lambda state: state == "open",
+    "closed": lambda state: state != "open",
+    "merged": lambda state: state == "merged",
+}
+START_TIME = datetime.datetime(2020, 1, 1)
+PR_STATES = ("open", "closed", "merged")
+REVIEW_STATES = ("APPROVED", "COMMENTED", "CHANGES_REQUESTED", "DISMISSED")
+GRAPHQL_PR_STATES = {"open": "OPEN", "closed": "CLOSED", "merged": "MERGED"}
+
+# Sizes of generated data. The PRs and commits are for each repo.
+PROFILES = {
+    "tiny": dict(repos=2, prs=20, commits=100, users=5),
+    "small": dict(repos=5, prs=200, commits=500, users=20),
+    "medium": dict(repos=10, prs=1000, commits=2000, users=50),
+    "large": dict(repos=10, prs=5000, commits=5000, users=200),
+}
+
+
+def format_datetime(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ") if value else None
+
+
+class FakeGitHub:
+    """
+    Fake GitHub API server, run in a background thread.
+    """
+
+    def __init__(
+        self,
+        seed=1,
+        repos=2,
+        prs=20,
+        commits=100,
+        users=5,
+        latency=0.0,
+        org="fake-org",
+        max_per_page=100,
+        rate_limit=5000,
+        rate_limit_window=3600,
+    ):
+        """
+        :param seed: Seed for generating data.
+        :param repos: Count of repos in the org.
+        :param prs: Count of PRs in each repo.
+        :param commits: Count of commits on the master branch of each repo.
+        :param users: Count of users who are members of the org.
+        :param latency: Seconds to wait before each response.
+        :param org: Login of the org which owns the repos.
+        :param max_per_page: Max items on a page of a listing.
+        :param rate_limit: Requests allowed for each resource in a window.
+        :param rate_limit_window: Seconds until the rate limit resets.
+        """
+        self.seed = seed
+        self.latency = latency
+        self.org = org
+        self.max_per_page = max_per_page
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.logins = [f"user-{index}" for index in range(users)]
+
+        self.base_url = None
+        self.requests = 0
+        self.rate_limited = 0
+        self._used = {}
+        self._reset_time = None
+        self._lock = threading.Lock()
+        self._server = None
+
+        self.repos = {
+            f"repo-{index}": self._build_repo(f"repo-{index}", prs, commits)
+            for index in range(repos)
+        }
+
+    @classmethod
+    def from_profile(cls, profile, **kwargs):
+        """
+        Create a server with the sizes of a profile in `PROFILES`.
+
+        :param profile: Name of the profile, e.g. "small".
+        :param kwargs: Other arguments for the server, such as the latency.
+        """
+        return cls(**dict(PROFILES[profile], **kwargs))
+
+    def _build_repo(self, name, pr_count, commit_count):
+        """
+        Generate a repo with a linear master branch, a feature branch which
+        was merged, a topic branch with a few commits of its own and PRs which
+        each have a run of the master commits.
+        """
+        rnd = random.Random(f"{self.seed}-{name}")
+        commits = []
+        parent = None
+
+        for index in range(commit_count):
+            sha = hashlib.sha1(f"{self.seed}-{name}-{index}".encode()).hexdigest()
+            commits.append(
+                {
+                    "sha": sha,
+                    "author": rnd.choice(self.logins),
+                    "date": START_TIME + datetime.timedelta(hours=6 * index),
+                    "parents": [parent] if parent else [],
+                    "additions": rnd.randrange(200),
+                    "deletions": rnd.randrange(100),
+                    "files": rnd.randrange(1, 10),
+                }
+            )
+            parent = sha
+
+        prs = []
+        for number in range(1, pr_count + 1):
+            created = START_TIME + datetime.timedelta(hours=number)
+            updated = created + datetime.timedelta(hours=rnd.randrange(24 * 60))
+            state = rnd.choice(PR_STATES)
+            size = rnd.randrange(1, 6)
+            start = rnd.randrange(max(commit_count - size, 1))
+            prs.append(
+                {
+                    "number": number,
+                    "author": rnd.choice(self.logins),
+                    "created": created,
+                    "updated": updated,
+                    "closed": updated if state != "open" else None,
+                    "state": state,
+                    "commits": [c["sha"] for c in commits[start : start + size]],
+                    "reviews": [
+                        (
+                            rnd.choice(self.logins),
+                            rnd.choice(REVIEW_STATES),
+                            created + datetime.timedelta(hours=1),
+                        )
+                        for _ in range(rnd.randrange(4))
+                    ],
+                    "ticket": f"ABC-{number}" if rnd.random() < 0.5 else None,
+                }
+            )
+
+        branches = {"master": commits[-1]["sha"]} if commits else {}
+        if len(commits) > 5:
+            branches["feature"] = commits[-5]["sha"]
+
+            fork_point = commits[len(commits) // 2]
+            parent = fork_point["sha"]
+            for index in range(3):
+                sha = hashlib.sha1(f"{self.seed}-{name}-topic-{index}".encode())
+                commits.append(
+                    dict(
+                        fork_point,
+                        sha=sha.hexdigest(),
+                        author=rnd.choice(self.logins),
+                        date=fork_point["date"] + datetime.timedelta(hours=index + 1),
+                        parents=[parent],
+                    )
+                )
+                parent = commits[-1]["sha"]
+            branches["topic"] = parent
+
+        return {
+            "name": name,
+            "commits": {c["sha"]: c for c in commits},
+            "prs": prs,
+            "branches": branches,
+        }
+
+    def start(self, port=0):
+        """
+        Start serving on a local port.
+
+        :param port: Port number, or zero to use a free port.
+
+        :return: Base URL of the server.
+        """
+        fake = self
+
+        class Handler(RequestHandler):
+            server_fake = fake
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count_request(self, resource, conditional=False):
+        """
+        Count a request against the rate limit of a resource.
+
+        :param resource: Rate limit resource, e.g. "core".
+        :param conditional: If the request gets a 304 response, which is not
+            counted against the rate limit.
+
+        :return: dict of rate limit headers for the response, and whether the
+            request is over the limit.
+        """
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            if self._reset_time is None or now >= self._reset_time:
+                self._reset_time = int(now) + self.rate_limit_window
+                self._used = {}
+
+            used = self._used.get(resource, 0)
+            is_limited = used >= self.rate_limit
+            if is_limited:
+                self.rate_limited += 1
+            elif not conditional:
+                used = self._used[resource] = used + 1
+
+        headers = {
+            "X-RateLimit-Limit": self.rate_limit,
+            "X-RateLimit-Remaining": max(self.rate_limit - used, 0),
+            "X-RateLimit-Reset": self._reset_time,
+            "X-RateLimit-Used": used,
+            "X-RateLimit-Resource": resource,
+        }
+
+        return headers, is_limited
+
+    def rate_limit_json(self):
+        """
+        Return the body of the rate limit endpoint.
+        """
+        with self._lock:
+            used = dict(self._used)
+
+        resources = {
+            resource: {
+                "limit": self.rate_limit,
+                "remaining": max(self.rate_limit - used.get(resource, 0), 0),
+                "reset": self._reset_time,
+                "used": used.get(resource, 0),
+            }
+            for resource in ("core", "search", "graphql")
+        }
+
+        return {"resources": resources, "rate": resources["core"]}
+
+    # JSON for API resources.
+
+    def user_json(self, login, full=False):
+        data = {
+            "login": login,
+            "id": int(hashlib.sha1(login.encode()).hexdigest()[:6], 16),
+            "type": "Organization" if login == self.org else "User",
+            "url": f"{self.base_url}/users/{login}",
+            "html_url": f"https://github.com/{login}",
+        }
+        if full:
+            data["name"] = self.display_name(login)
+
+        return data
+
+    @staticmethod
+    def display_name(login):
+        """
+        Return the name of a user, which is not set for some users.
+        """
+        return None if login.endswith("0") else login.title()
+
+    def repo_json(self, repo):
+        full_name = f"{self.org}/{repo['name']}"
+
+        return {
+            "id": int(hashlib.sha1(full_name.encode()).hexdigest()[:6], 16),
+            "name": repo["name"],
+            "full_name": full_name,
+            "owner": self.user_json(self.org),
+            "private": False,
+            "html_url": f"https://github.com/{full_name}",
+            "url": f"{self.base_url}/repos/{full_name}",
+            "default_branch": "master",
+        }
+
+    def commit_json(self, repo, commit, full=False):
+        full_name = f"{self.org}/{repo['name']}"
+        date = format_datetime(commit["date"])
+        data = {
+            "sha": commit["sha"],
+            "url": f"{self.base_url}/repos/{full_name}/commits/{commit['sha']}",
+            "html_url": f"https://github.com/{full_name}/commit/{commit['sha']}",
+            "author": self.user_json(commit["author"]),
+            "committer": self.user_json(commit["author"]),
+            "commit": {
+                "message": f"Change {commit['sha'][:7]}",
+                "author": {"name": commit["author"], "date": date},
+                "committer": {"name": commit["author"], "date": date},
+            },
+            "parents": [{"sha": sha} for sha in commit["parents"]],
+        }
+        if full:
+            total = commit["additions"] + commit["deletions"]
+            data["stats"] = {
+                "additions": commit["additions"],
+                "deletions": commit["deletions"],
+                "total": total,
+            }
+            data["files"] = [
+                {"filename": f"src/file_{index}.py", "status": "modified"}
+                for index in range(commit["files"])
+            ]
+
+        return data
+
+    def pr_json(self, repo, pr, full=False):
+        full_name = f"{self.org}/{repo['name']}"
+        title = f"Change number {pr['number']}"
+        if pr["ticket"]:
+            title = f"{pr['ticket']} {title}"
+        merged = pr["state"] == "merged"
+
+        data = {
+            "number": pr["number"],
+            "title": title,
+            "body": (
+                f"Fixes https://jira.example.com/browse/ABC-{pr['number']}"
+                if pr["ticket"]
+                else "No ticket."
+            ),
+            "state": "open" if pr["state"] == "open" else "closed",
+            "user": self.user_json(pr["author"]),
+            "assignees": [],
+            "html_url": f"https://github.com/{full_name}/pull/{pr['number']}",
+            "url": f"{self.base_url}/repos/{full_name}/pulls/{pr['number']}",
+            "head": {"ref": f"feature-{pr['number']}", "sha": pr["commits"][-1]},
+            "base": {"ref": "master", "sha": pr["commits"][0]},
+            "created_at": format_datetime(pr["created"]),
+            "updated_at": format_datetime(pr["updated"]),
+            "closed_at": format_datetime(pr["closed"]),
+            "merged_at": format_datetime(pr["closed"]) if merged else None,
+        }
+        if full:
+            commits = [repo["commits"][sha] for sha in pr["commits"]]
+            data.update(
+                merged=merged,
+                merged_by=self.user_json(self.logins[0]) if merged else None,
+                commits=len(commits),
+                comments=pr["number"] % 4,
+                changed_files=sum(c["files"] for c in commits),
+                additions=sum(c["additions"] for c in commits),
+                deletions=sum(c["deletions"] for c in commits),
+            )
+
+        return data
+
+    def issue_json(self, repo, pr):
+        """
+        Return a PR as a search result, which has the fields of an issue.
+        """
+        full_name = f"{self.org}/{repo['name']}"
+        data = self.pr_json(repo, pr)
+
+        return {
+            "number": pr["number"],
+            "title": data["title"],
+            "state": data["state"],
+            "user": data["user"],
+            "html_url": data["html_url"],
+            "url": f"{self.base_url}/repos/{full_name}/issues/{pr['number']}",
+            "repository_url": f"{self.base_url}/repos/{full_name}",
+            "pull_request": {"url": data["url"], "html_url": data["html_url"]},
+            "created_at": data["created_at"],
+            "updated_at": data["updated_at"],
+            "closed_at": data["closed_at"],
+        }
+
+    def search_prs(self, text):
+        """
+        Return the PRs which match a search query, most recently updated
+        first.
+
+        :param text: Search query, with `is:`, `author:`, `user:`, `repo:` and
+            `updated:` qualifiers. Values of the same qualifier are joined
+            with OR.
+
+        :return: List of tuples of repo and PR.
+        """
+        qualifiers = collections.defaultdict(set)
+        for term in text.split():
+            name, _, value = term.partition(":")
+            qualifiers[name].add(value)
+
+        states = qualifiers["is"] - {"pr"}
+        start = end = None
+        for value in qualifiers["updated"]:
+            if value.startswith(">="):
+                start = value[2:]
+            else:
+                start, end = value.split("..")
+        if end and len(end) == len("2020-01-01"):
+            end += "T23:59:59Z"
+
+        results = []
+        for repo in self.repos.values():
+            full_name = f"{self.org}/{repo['name']}"
+            if (qualifiers["repo"] and full_name not in qualifiers["repo"]) or (
+                qualifiers["user"] and self.org not in qualifiers["user"]
+            ):
+                continue
+
+            for pr in repo["prs"]:
+                updated = format_datetime(pr["updated"])
+                if (
+                    (qualifiers["author"] and pr["author"] not in qualifiers["author"])
+                    or not all(SEARCH_STATES[state](pr["state"]) for state in states)
+                    or (start and updated < start)
+                    or (end and updated > end)
+                ):
+                    continue
+                results.append((repo, pr))
+
+        results.sort(key=lambda result: result[1]["updated"], reverse=True)
+
+        return results
+
+    def review_json(self, index, review):
+        login, state, submitted = review
+
+        return {
+            "id": index + 1,
+            "user": self.user_json(login),
+            "state": state,
+            "body": "",
+            "submitted_at": format_datetime(submitted),
+        }
+
+    # JSON for GraphQL nodes.
+
+    def actor_node(self, login):
+        if login is None:
+            return None
+
+        return {"login": login, "name": self.display_name(login)}
+
+    def commit_node(self, repo, sha):
+        commit = repo["commits"][sha]
+        date = format_datetime(commit["date"])
+        author = {"user": self.actor_node(commit["author"])}
+
+        return {
+            "commit": {
+                "oid": sha,
+                "url": f"https://github.com/{self.org}/{repo['name']}/commit/{sha}",
+                "message": f"Change {sha[:7]}",
+                "additions": commit["additions"],
+                "deletions": commit["deletions"],
+                "authoredDate": date,
+                "committedDate": date,
+                "author": author,
+                "committer": author,
+            }
+        }
+
+    def reviews_node(self, pr, page_size, cursor):
+        start = int(cursor or 0)
+        end = start + page_size
+        nodes = [
+            {
+                "state": state,
+                "submittedAt": format_datetime(submitted),
+                "author": self.actor_node(login),
+            }
+            for login, state, submitted in pr["reviews"][start:end]
+        ]
+
+        return {
+            "pageInfo": {
+                "hasNextPage": end < len(pr["reviews"]),
+                "endCursor": str(end),
+            },
+            "nodes": nodes,
+        }
+
+    def pr_node(self, repo, pr, review_page_size):
+        data = self.pr_json(repo, pr, full=True)
+
+        return {
+            "id": f"{repo['name']}:{pr['number']}",
+            "number": pr["number"],
+            "title": data["title"],
+            "body": data["body"],
+            "url": data["html_url"],
+            "state": GRAPHQL_PR_STATES[pr["state"]],
+            "merged": data["merged"],
+            "mergedAt": data["merged_at"],
+            "closedAt": data["closed_at"],
+            "createdAt": data["created_at"],
+            "updatedAt": data["updated_at"],
+            "headRefName": data["head"]["ref"],
+            "baseRefName": data["base"]["ref"],
+            "changedFiles": data["changed_files"],
+            "additions": data["additions"],
+            "deletions": data["deletions"],
+            "author": self.actor_node(pr["author"]),
+            "mergedBy": self.actor_node(self.logins[0]) if data["merged"] else None,
+            "assignees": {"nodes": []},
+            "comments": {"totalCount": data["comments"]},
+            "commits": {"totalCount": data["commits"]},
+            "oldestCommit": {"nodes": [self.commit_node(repo, pr["commits"][0])]},
+            "latestCommit": {"nodes": [self.commit_node(repo, pr["commits"][-1])]},
+            "reviews": self.reviews_node(pr, review_page_size, None),
+        }
+
+    def graphql(self, text, variables):
+        """
+        Return the data for a query from `lib.graphql` or the org members
+        query of `lib.display_names`, chosen by the fields in the query.
+        """
+        cursor = variables.get("cursor")
+        start = int(cursor or 0)
+
+        if "membersWithRole" in text:
+            end = start + variables["pageSize"]
+            members = {
+                "pageInfo": {
+                    "hasNextPage": end < len(self.logins),
+                    "endCursor": str(end),
+                },
+                "nodes": [self.actor_node(login) for login in self.logins[start:end]],
+            }
+            return {"organization": {"membersWithRole": members}}
+
+        if "node(id" in text:
+            name, number = variables["id"].split(":")
+            pr = self.repos[name]["prs"][int(number) - 1]
+            reviews = self.reviews_node(pr, variables["reviewPageSize"], cursor)
+            return {"node": {"reviews": reviews}}
+
+        repo = self.repos[variables["name"]]
+        states = variables.get("states")
+        prs = [
+            pr
+            for pr in reversed(repo["prs"])
+            if not states or GRAPHQL_PR_STATES[pr["state"]] in states
+        ]
+        if "UPDATED_AT" in text:
+            prs.sort(key=lambda pr: pr["updated"], reverse=True)
+        end = start + variables["pageSize"]
+        nodes = [
+            self.pr_node(repo, pr, variables["reviewPageSize"]) for pr in prs[start:end]
+        ]
+        pull_requests = {
+            "pageInfo": {"hasNextPage": end < len(prs), "endCursor": str(end)},
+            "nodes": nodes,
+        }
+
+        return {"repository": {"pullRequests": pull_requests}}
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handle requests to the fake server. The `server_fake` attribute is set on
+    a subclass for each server.
+    """
+
+    server_fake = None
+    protocol_version = "HTTP/1.1"
+    # Buffer the headers and body of a response into one write, which avoids
+    # a delayed ACK on each response.
+    wbufsize = 64 * 1024
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, status=200, link=None):
+        body = json.dumps(data).encode()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        is_not_modified = status == 200 and self.headers.get("If-None-Match") == etag
+
+        rate_headers, is_limited = self.server_fake.count_request(
+            self.resource, conditional=is_not_modified
+        )
+        if is_limited:
+            status, is_not_modified = 403, False
+            body = json.dumps({"message": "API rate limit exceeded"}).encode()
+        elif is_not_modified:
+            status, body = 304, b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        for name, value in rate_headers.items():
+            self.send_header(name, str(value))
+        if link and not is_limited:
+            self.send_header("Link", link)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, items, query, to_json, wrap=None):
+        """
+        Send a page of a listing, with a Link header for the next and last
+        pages.
+
+        :param items: All items of the listing.
+        :param query: dict of query parameters of the request.
+        :param to_json: Function to convert an item on the page to JSON.
+        :param wrap: Optional function to convert the list of items on the
+            page to the body, for an endpoint which responds with an object.
+        """
+        max_per_page = self.server_fake.max_per_page
+        per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), max_per_page)
+        page = int(query.get("page", 1))
+        last_page = max((len(items) + per_page - 1) // per_page, 1)
+
+        links = []
+        base = f"{self.server_fake.base_url}{urllib.parse.urlsplit(self.path).path}"
+        for rel, number in (("next", page + 1), ("last", last_page)):
+            if page < last_page:
+                params = urllib.parse.urlencode(dict(query, page=number))
+                links.append(f'<{base}?{params}>; rel="{rel}"')
+
+        start = (page - 1) * per_page
+        data = [to_json(item) for item in items[start : start + per_page]]
+        if wrap:
+            data = wrap(data)
+        self.send_json(data, link=", ".join(links) or None)
+
+    def wait(self):
+        if self.server_fake.latency:
+            time.sleep(self.server_fake.latency)
+
+    def do_GET(self):
+        self.wait()
+        self.resource = "core"
+
+        fake = self.server_fake
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.strip("/").split("/")
+
+        try:
+            self.route(fake, parts, query)
+        except (KeyError, IndexError, ValueError):
+            self.send_json({"message": "Not Found"}, status=404)
+
+    def do_POST(self):
+        self.wait()
+        self.resource = "graphql"
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+
+        if self.path.rstrip("/") != "/graphql":
+            return self.send_json({"message": "Not Found"}, status=404)
+
+        try:
+            data = self.server_fake.graphql(request["query"], request["variables"])
+        except (KeyError, IndexError, ValueError) as e:
+            return self.send_json({"data": None, "errors": [{"message": repr(e)}]})
+        self.send_json({"data": data})
+
+    def route(self, fake, parts, query):
+        if parts == ["rate_limit"]:
+            return self.send_json(fake.rate_limit_json())
+
+        if parts == ["search", "issues"]:
+            return self.route_search(fake, query)
+
+        if parts[0] in ("orgs", "users") and len(parts) == 2:
+            return self.send_json(fake.user_json(parts[1], full=True))
+
+        if parts[0] in ("orgs", "users") and parts[2] == "repos":
+            return self.send_page(list(fake.repos.values()), query, fake.repo_json)
+
+        if parts[0] == "orgs" and parts[2] == "members":
+            return self.send_page(fake.logins, query, fake.user_json)
+
+        if parts[0] != "repos" or parts[1] != fake.org:
+            raise KeyError(parts[0])
+
+        return self.route_repo(fake, fake.repos[parts[2]], parts[3:], query)
+
+    def route_search(self, fake, query):
+        self.resource = "search"
+        results = fake.search_prs(query["q"]) if "is:pr" in query["q"] else []
+
+        per_page = int(query.get("per_page", DEFAULT_PER_PAGE))
+        if (int(query.get("page", 1)) - 1) * per_page >= MAX_SEARCH_RESULTS:
+            return self.send_json(
+                {"message": "Only the first 1000 search results are available"},
+                status=422,
+            )
+
+        return self.send_page(
+            results[:MAX_SEARCH_RESULTS],
+            query,
+            lambda result: fake.issue_json(*result),
+            wrap=lambda items: {
+                "total_count": len(results),
+                "incomplete_results": False,
+                "items": items,
+            },
+        )
+
+    def route_repo(self, fake, repo, rest, query):
+        if not rest:
+            return self.send_json(fake.repo_json(repo))
+        if rest[0] == "pulls":
+            return self.route_pulls(fake, repo, rest[1:], query)
+        if rest[0] == "branches":
+            return self.send_page(
+                list(repo["branches"].items()),
+                query,
+                lambda branch: {
+                    "name": branch[0],
+                    "commit": {"sha": branch[1]},
+                    "protected": False,
+                },
+            )
+        if rest[0] == "commits" and len(rest) == 2:
+            commit = repo["commits"][rest[1]]
+            return self.send_json(fake.commit_json(repo, commit, full=True))
+        if rest[0] == "commits":
+            return self.send_page(
+                self.history(repo, query),
+                query,
+                lambda commit: fake.commit_json(repo, commit),
+            )
+        if rest[0] == "compare":
+            return self.route_compare(fake, repo, rest[1], query)
+
+        raise KeyError(rest[0])
+
+    def route_compare(self, fake, repo, basehead, query):
+        """
+        Send the commits which are in the history of a head but not of a
+        base, oldest first, as the compare endpoint does.
+        """
+        base, head = basehead.split("...")
+        base_shas = {commit["sha"] for commit in self.history(repo, {"sha": base})}
+        ahead = [
+            commit
+            for commit in self.history(repo, {"sha": head})
+            if commit["sha"] not in base_shas
+        ]
+        ahead.reverse()
+
+        return self.send_page(
+            ahead,
+            query,
+            lambda commit: fake.commit_json(repo, commit),
+            wrap=lambda commits: {
+                "status": "ahead" if ahead else "identical",
+                "ahead_by": len(ahead),
+                "behind_by": 0,
+                "total_commits": len(ahead),
+                "commits": commits,
+                "files": [],
+            },
+        )
+
+    def route_pulls(self, fake, repo, rest, query):
+        if not rest:
+            prs = repo["prs"]
+            state = query.get("state", "open")
+            if state == "open":
+                prs = [pr for pr in prs if pr["state"] == "open"]
+            elif state == "closed":
+                prs = [pr for pr in prs if pr["state"] != "open"]
+
+            sort = query.get("sort", "created")
+            direction = query.get("direction", "desc" if sort == "created" else "asc")
+            key = "updated" if sort == "updated" else "created"
+            prs = sorted(prs, key=lambda pr: pr[key], reverse=direction == "desc")
+
+            return self.send_page(prs, query, lambda pr: fake.pr_json(repo, pr))
+
+        pr = repo["prs"][int(rest[0]) - 1]
+
+        if len(rest) == 1:
+            return self.send_json(fake.pr_json(repo, pr, full=True))
+        if rest[1] == "commits":
+            return self.send_page(
+                pr["commits"],
+                query,
+                lambda sha: fake.commit_json(repo, repo["commits"][sha]),
+            )
+        if rest[1] == "reviews":
+            return self.send_page(
+                list(enumerate(pr["reviews"])),
+                query,
+                lambda item: fake.review_json(*item),
+            )
+
+        raise KeyError(rest[1])
+
+    @staticmethod
+    def history(repo, query):
+        """
+        Return commits in the history of a branch or SHA, newest first.
+        """
+        sha = query.get("sha", "master")
+        sha = repo["branches"].get(sha, sha)
+        since = query.get("since")
+
+        commits = []
+        while sha:
+            commit = repo["commits"][sha]
+            if since and format_datetime(commit["date"]) < since:
+                break
+            commits.append(commit)
+            sha = commit["parents"][0] if commit["parents"] else None
+
+        return commits
+
+
+def main(args):
+    """
+    Main command-line function.
+
+    Serve a profile until interrupted.
+    """
+    profile = args[0] if args else "tiny"
+    port = int(args[1]) if len(args) > 1 else 8000
+
+    server = FakeGitHub.from_profile(profile)
+    base_url = server.start(port)
+    print(f"Serving profile {profile!r} for org {server.org!r} at {base_url}")
+    print("Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\nRequests: {server.requests:,d}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,135 @@
+"""
+Jira tickets benchmark.
+
+Compare the time to extract the Jira ticket of PRs with large synthetic
+descriptions, with the patterns used before and with `extract_jira_tickets`.
+
+Usage:
+    $ cd aggregit
+    $ python -m bench.jira_tickets
+    $ python -m bench.jira_tickets 1000
+
+The default is 200 PRs for each shape of description. Each description is
+about 50KB:
+
+    - "template" is a filled in template of many short lines, with a link to a
+      Jira dashboard on each section and the ticket URL near the top.
+    - "no ticket" is the same template with the ticket in the title instead.
+    - "one line" is a single long line, like a pasted log, with many Jira
+      links which are not to a ticket. The greedy URL pattern searches the
+      rest of the line again from each link.
+    - "capitals" is the template with the ticket in the title, after a long
+      run of capital letters like a pasted key. The ticket pattern searches
+      the rest of the run again from each letter.
+
+The count of PRs whose ticket differs from before is shown. Only a ticket past
+`JIRA_SCAN_CHARS` of a description, or in a URL after another ticket URL on
+the same line, is expected to differ.
+"""
+import re
+import sys
+import time
+
+import lib
+
+DEFAULT_COUNT = 200
+DESCRIPTION_SIZE = 50_000
+
+# Patterns used before the combined pattern.
+JIRA_TICKET_PATTERN = re.compile(r"[A-Z]+-\d+")
+JIRA_URL_PATTERN = re.compile(r"https:\/\/jira.+/browse/([A-Z]+-\d+)")
+
+DASHBOARD_URL = "https://jira.example.com/secure/Dashboard.jspa?selectPageId=10"
+SECTION = f"""
+## Checklist
+
+- [x] Tests added or updated
+- [x] Docs updated, see the [dashboard]({DASHBOARD_URL})
+- [ ] Release notes
+
+<!-- Describe how this was tested. Link to the test plan on the dashboard. -->
+"""
+
+
+def make_pr(shape, index):
+    """
+    Return the description and title of a synthetic PR.
+    """
+    ticket = f"ABC-{index}"
+
+    if shape == "one line":
+        link = f"{DASHBOARD_URL}&item={index} status=OK "
+        description = link * (DESCRIPTION_SIZE // len(link))
+
+        return description, f"{ticket} Fix the parser"
+
+    sections = SECTION * (DESCRIPTION_SIZE // len(SECTION))
+    if shape == "capitals":
+        key = "QWERTYUIOPASDFGHJKLZXCVBNM" * 100
+        description = f"New key:\n{key}\n{sections}"
+
+        return description, f"{ticket} Rotate the key"
+
+    if shape == "template":
+        description = f"Fixes https://jira.example.com/browse/{ticket}\n{sections}"
+
+        return description, "Fix the parser"
+
+    return sections, f"{ticket} Fix the parser"
+
+
+def extract_before(text):
+    """
+    Extract a ticket as before, with a search for a URL and then for a ticket.
+    """
+    match = JIRA_URL_PATTERN.search(text)
+    if match:
+        return match.group(1)
+
+    match = JIRA_TICKET_PATTERN.search(text)
+    if match:
+        return match.group()
+
+    return None
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+def run_before(prs):
+    return [
+        extract_before(description) or extract_before(title)
+        for description, title in prs
+    ]
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    count = int(args[0]) if args else DEFAULT_COUNT
+
+    print(f"PRs: {count:,d} for each shape")
+    print()
+    print("Shape     | Before ms/PR | Now ms/PR | Differ")
+    print("---       | ---          | ---       | ---")
+
+    for shape in ("template", "no ticket", "one line", "capitals"):
+        prs = [make_pr(shape, index) for index in range(count)]
+
+        before, before_time = timed(run_before, prs)
+        now, now_time = timed(lib.extract_jira_tickets, prs)
+
+        differ = sum(old != new for old, new in zip(before, now))
+        print(
+            f"{shape:9} | {before_time / count * 1000:12.3f}"
+            f" | {now_time / count * 1000:9.3f} | {differ:,d}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
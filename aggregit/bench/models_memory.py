@@ -0,0 +1,250 @@
+"""
+Models memory benchmark.
+
+Measure memory used by the report models for a synthetic dataset of PRs,
+compared with the previous layout of the models, which kept PyGithub user and
+file objects on plain instances.
+
+Usage:
+    $ cd aggregit
+    $ python -m bench.models_memory
+    $ python -m bench.models_memory 1000
+
+The PRs are built from synthetic GraphQL nodes, so no requests are made. Each
+PR has two commits with two changed files each, two reviews and one assignee.
+Memory is measured with `tracemalloc` as the size of the allocations still
+held after building the list of models.
+"""
+import datetime
+import gc
+import sys
+import tracemalloc
+
+from github.File import File
+from github.NamedUser import NamedUser
+
+from models import PullRequest
+
+DEFAULT_COUNT = 50_000
+USERS = 200
+
+
+def user_payload(index):
+    """
+    Return a synthetic user profile, with the fields of a full API response.
+    """
+    login = f"user-{index}"
+
+    return {
+        "login": login,
+        "id": index,
+        "node_id": f"MDQ6VXNlcj{index}",
+        "name": f"User {index}",
+        "avatar_url": f"https://avatars.githubusercontent.com/u/{index}?v=4",
+        "url": f"https://api.github.com/users/{login}",
+        "html_url": f"https://github.com/{login}",
+        "followers_url": f"https://api.github.com/users/{login}/followers",
+        "repos_url": f"https://api.github.com/users/{login}/repos",
+        "events_url": f"https://api.github.com/users/{login}/events{{/privacy}}",
+        "type": "User",
+        "site_admin": False,
+        "company": "My Org",
+        "location": "Earth",
+        "bio": "Synthetic user for a benchmark.",
+        "public_repos": index,
+        "followers": index,
+        "following": index,
+        "created_at": "2015-01-01T00:00:00Z",
+        "updated_at": "2020-01-01T00:00:00Z",
+    }
+
+
+def commit_node(pr_number, index, user):
+    date = datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=pr_number + index)
+    date = date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    return {
+        "commit": {
+            "oid": f"{pr_number:020x}{index:020x}",
+            "url": f"https://github.com/org/repo/commit/{pr_number}{index}",
+            "message": f"Change {index} for PR {pr_number}\n\nSome more detail.",
+            "additions": 10,
+            "deletions": 5,
+            "authoredDate": date,
+            "committedDate": date,
+            "author": {"user": {"login": user["login"], "name": user["name"]}},
+            "committer": {"user": {"login": user["login"], "name": user["name"]}},
+        }
+    }
+
+
+def pr_node(number, users):
+    """
+    Return a synthetic GraphQL PR node.
+    """
+    author = users[number % USERS]
+    reviewer = users[(number + 1) % USERS]
+    actor = {"login": author["login"], "name": author["name"]}
+    reviewer_actor = {"login": reviewer["login"], "name": reviewer["name"]}
+    date = (datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=number)).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+    return {
+        "id": f"PR_{number}",
+        "number": number,
+        "title": f"ABC-{number} Add feature number {number}",
+        "body": f"Implements https://jira.example.com/browse/ABC-{number}\n" * 5,
+        "url": f"https://github.com/org/repo/pull/{number}",
+        "state": "MERGED",
+        "merged": True,
+        "mergedAt": date,
+        "closedAt": date,
+        "createdAt": date,
+        "updatedAt": date,
+        "headRefName": f"feature/abc-{number}",
+        "baseRefName": "main",
+        "changedFiles": 4,
+        "additions": 20,
+        "deletions": 10,
+        "author": actor,
+        "mergedBy": reviewer_actor,
+        "assignees": {"nodes": [actor]},
+        "comments": {"totalCount": 3},
+        "commits": {"totalCount": 2},
+        "oldestCommit": {"nodes": [commit_node(number, 0, author)]},
+        "latestCommit": {"nodes": [commit_node(number, 1, author)]},
+        "reviews": {
+            "pageInfo": {"hasNextPage": False, "endCursor": None},
+            "nodes": [
+                {"state": state, "submittedAt": date, "author": reviewer_actor}
+                for state in ("COMMENTED", "APPROVED")
+            ],
+        },
+    }
+
+
+class LegacyModel:
+    """
+    Plain object with a `__dict__`, like the previous models.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def legacy_user(payload):
+    # Each model held its own PyGithub user object, completed with a request
+    # for the user's profile when the display name was used.
+    return NamedUser(None, {}, dict(payload), completed=True)
+
+
+def legacy_commit(commit, user):
+    files = [
+        File(
+            None,
+            {},
+            {
+                "filename": f"src/module_{i}.py",
+                "status": "modified",
+                "additions": 5,
+                "deletions": 2,
+                "changes": 7,
+                "patch": "@@ -1,3 +1,5 @@\n-old line\n+new line\n" * 5,
+            },
+            completed=True,
+        )
+        for i in range(2)
+    ]
+
+    return LegacyModel(
+        sha=commit.sha,
+        url=f"https://github.com/org/repo/commit/{commit.sha}",
+        author=legacy_user(user),
+        committer=legacy_user(user),
+        datetime=commit.datetime,
+        message="Change for a PR\n\nSome more detail.",
+        files=files,
+        additions=10,
+        deletions=5,
+    )
+
+
+def legacy_pr(pr, users, number):
+    author = users[number % USERS]
+    reviewer = users[(number + 1) % USERS]
+    attributes = {
+        name: getattr(pr, name)
+        for name in PullRequest.__slots__
+        if not name.startswith("_")
+    }
+    attributes.update(
+        author=legacy_user(author),
+        merged_by=legacy_user(reviewer),
+        assignees=[legacy_user(author)],
+        latest_commit=legacy_commit(pr.latest_commit, author),
+        oldest_commit=legacy_commit(pr.oldest_commit, author),
+        reviews=[
+            LegacyModel(
+                _state=review._state,
+                submitted_at=review.submitted_at,
+                reviewer=legacy_user(reviewer),
+            )
+            for review in pr.reviews
+        ],
+    )
+
+    return LegacyModel(**attributes)
+
+
+def measure(build):
+    """
+    Return bytes held by the result of a function.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del result
+    gc.collect()
+
+    return size
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    count = int(args[0]) if args else DEFAULT_COUNT
+    users = [user_payload(i) for i in range(USERS)]
+    nodes = [pr_node(number, users) for number in range(1, count + 1)]
+
+    def build_models():
+        return [PullRequest.from_graphql(node) for node in nodes]
+
+    def build_legacy():
+        return [
+            legacy_pr(PullRequest.from_graphql(node), users, node["number"])
+            for node in nodes
+        ]
+
+    print(f"PRs: {count:,d}")
+    print()
+    print("Layout   | Total MB | Bytes per PR")
+    print("---      | ---      | ---")
+
+    results = {}
+    for label, build in (("Previous", build_legacy), ("Current", build_models)):
+        size = measure(build)
+        results[label] = size
+        print(f"{label:8} | {size / 1024 / 1024:8.1f} | {size // count:12,d}")
+
+    print()
+    print(f"Reduction: {1 - results['Current'] / results['Previous']:.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
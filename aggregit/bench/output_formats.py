@@ -0,0 +1,157 @@
+"""
+Output formats benchmark.
+
+Compare the time to write a report in each output format, and the time to load
+it with pandas, for a synthetic report of 100,000 rows, or a given count.
+
+Usage:
+    $ cd aggregit
+    $ python -m bench.output_formats
+    $ python -m bench.output_formats 10000
+
+Needs the `pyarrow` and `pandas` packages. Rows are written through the report
+writers, in repos of 1,000 rows, so the time includes checkpoints. A CSV is
+loaded with its date columns parsed, which is needed to use them as dates.
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from lib.writers import WRITERS, open_writer
+
+DEFAULT_COUNT = 100_000
+ROWS_PER_REPO = 1_000
+
+# Columns like those of the PR report, with their types.
+COLUMNS = {
+    "Repo Name": None,
+    "PR ID": None,
+    "PR Title": None,
+    "Author": None,
+    "PR URL": None,
+    "Status": None,
+    "Merged/Closed Date": "date",
+    "PR Updated At": "date",
+    "PR Created At": "date",
+    "Latest Commit At": "date",
+    "Oldest Commit At": "date",
+    "Days Between Commits": "int",
+    "Commits": "int",
+    "Changed Files": "int",
+    "Added Lines": "int",
+    "Deleted Lines": "int",
+    "Changed Lines": "int",
+    "Comments": "int",
+    "Reviewers": None,
+    "Review Approved": "int",
+    "Review Dismissed": "int",
+    "Review Changes Requested": "int",
+    "Review Commented": "int",
+}
+
+
+def make_row(index):
+    """
+    Return a synthetic report row.
+    """
+    created = datetime.date(2020, 1, 1) + datetime.timedelta(days=index % 1000)
+    updated = created + datetime.timedelta(days=index % 30)
+
+    return {
+        "Repo Name": f"repo-{index // ROWS_PER_REPO}",
+        "PR ID": f"#{index}",
+        "PR Title": f"ABC-{index} Add feature number {index}",
+        "Author": f"User {index % 200}",
+        "PR URL": f"https://github.com/org/repo/pull/{index}",
+        "Status": "Merged" if index % 3 else "Open",
+        "Merged/Closed Date": updated if index % 3 else None,
+        "PR Updated At": updated,
+        "PR Created At": created,
+        "Latest Commit At": updated,
+        "Oldest Commit At": created,
+        "Days Between Commits": (updated - created).days + 1,
+        "Commits": index % 7 + 1,
+        "Changed Files": index % 20,
+        "Added Lines": index % 500,
+        "Deleted Lines": index % 100,
+        "Changed Lines": index % 500 + index % 100,
+        "Comments": index % 5,
+        "Reviewers": f"User {index % 7}, User {index % 11}",
+        "Review Approved": index % 2,
+        "Review Dismissed": 0,
+        "Review Changes Requested": index % 3 // 2,
+        "Review Commented": index % 4,
+    }
+
+
+def write(output_format, csv_path, rows):
+    """
+    Write rows in a format and return the path.
+    """
+    column_types = {name: kind for name, kind in COLUMNS.items() if kind}
+
+    with open_writer(
+        csv_path, COLUMNS, column_types, output_format=output_format
+    ) as writer:
+        for start in range(0, len(rows), ROWS_PER_REPO):
+            writer.write_repo(start, rows[start : start + ROWS_PER_REPO])
+
+    return writer.path
+
+
+def load(output_format, path):
+    """
+    Load an output file with pandas.
+    """
+    if output_format == "csv":
+        dates = [name for name, kind in COLUMNS.items() if kind == "date"]
+
+        return pd.read_csv(path, parse_dates=dates)
+    if output_format == "parquet":
+        return pd.read_parquet(path)
+
+    return pd.read_feather(path)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    count = int(args[0]) if args else DEFAULT_COUNT
+    rows = [make_row(index) for index in range(count)]
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "report.csv")
+
+        for output_format in WRITERS:
+            path, write_time = timed(write, output_format, csv_path, rows)
+            _, load_time = timed(load, output_format, path)
+            size = os.path.getsize(path)
+            results.append((output_format, write_time, load_time, size))
+
+    print()
+    print(f"Rows: {count:,d}")
+    print()
+    print("Format  | Write s | Load s | Size MB")
+    print("---     | ---     | ---    | ---")
+    for output_format, write_time, load_time, size in results:
+        print(
+            f"{output_format:7} | {write_time:7.2f} | {load_time:6.2f}"
+            f" | {size / 1024 / 1024:7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
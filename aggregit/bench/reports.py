@@ -0,0 +1,177 @@
+"""
+Reports benchmark.
+
+Run the PR report, with each backend, and the commit report against a local
+fake GitHub server, and show the wall time, count of requests, peak memory and
+requests per second of each.
+
+Usage:
+    $ cd aggregit
+    $ python -m bench.reports
+    $ python -m bench.reports PROFILE LATENCY_MS RATE_LIMIT
+
+The defaults are the "small" profile, with 10ms of latency and a rate limit
+which is not reached. The rate limit is for each minute, rather than each hour
+as on GitHub, so that a report which uses it up waits for a short time. See
+`PROFILES` in `bench.fake_github` for the sizes, such as "large" for 10 repos
+of 5,000 PRs. The server data comes from a fixed seed, so the counts of
+requests are the same on each run.
+
+Each report runs in a new process, so that nothing is shared between runs and
+the peak memory is that of the report alone. The response cache and stored
+display names are disabled, and the rate limit scheduler is set with a high
+rate, so that only the reports are compared. The async backend is skipped if
+`aiohttp` is not installed.
+"""
+import contextlib
+import importlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bench.fake_github import FakeGitHub
+
+DEFAULT_PROFILE = "small"
+DEFAULT_LATENCY_MS = 10
+DEFAULT_RATE_LIMIT = 1_000_000
+RATE_LIMIT_WINDOW = 60
+
+# Label, report module and config values for each run.
+RUNS = (
+    ("pr rest", "pr_report", {"PR_BACKEND": "rest", "PR_WORKERS": 8}),
+    ("pr graphql", "pr_report", {"PR_BACKEND": "graphql"}),
+    ("pr async", "pr_report", {"PR_BACKEND": "async"}),
+    ("commit", "commit_report", {}),
+)
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident memory of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # The value is in bytes on macOS and kilobytes on Linux.
+    if sys.platform == "darwin":
+        peak /= 1024
+
+    return peak / 1024
+
+
+def _run_in_child(base_url, org, report, values, directory, results):
+    """
+    Run a report in this process and put the time taken and peak memory on a
+    queue.
+    """
+    from etc import config
+
+    config.BASE_URL = base_url
+    config.BY_OWNER = True
+    config.REPO_OWNER = org
+    config.USERNAMES = None
+    config.MIN_DATE = None
+    config.PR_STATE = "all"
+    config.PR_WORKERS = 1
+    config.PR_INCREMENTAL = False
+    config.OUTPUT_FORMAT = "csv"
+    config.PR_CSV_PATH = os.path.join(directory, "pr_report.csv")
+    config.COMMIT_CSV_PATH = os.path.join(directory, "commit_report.csv")
+    config.CACHE_ENABLED = False
+    config.NAME_CACHE_ENABLED = False
+    config.NAME_CACHE_ORGS = []
+    config.RATE_LIMIT_PER_MINUTE = 1_000_000
+    config.RATE_LIMIT_BURST = 1_000_000
+    for name, value in values.items():
+        setattr(config, name, value)
+
+    module = importlib.import_module(report)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module.main()
+    results.put((time.perf_counter() - start, peak_rss_mb()))
+
+
+def run_report(base_url, org, report, values):
+    """
+    Run a report in a new process, against a server.
+
+    :param base_url: Base URL of the server.
+    :param org: Org to get repos for.
+    :param report: Name of the report module, e.g. "pr_report".
+    :param values: dict of config values to set for the run.
+
+    :return: Seconds taken by the report and peak memory of the process in MB.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = context.Process(
+            target=_run_in_child,
+            args=(base_url, org, report, values, directory, results),
+        )
+        process.start()
+        seconds, peak_mb = results.get()
+        process.join()
+
+    return seconds, peak_mb
+
+
+def is_available(values):
+    if values.get("PR_BACKEND") == "async":
+        return importlib.util.find_spec("aiohttp") is not None
+
+    return True
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    profile = args[0] if args else DEFAULT_PROFILE
+    latency_ms = int(args[1]) if len(args) > 1 else DEFAULT_LATENCY_MS
+    rate_limit = int(args[2]) if len(args) > 2 else DEFAULT_RATE_LIMIT
+
+    server = FakeGitHub.from_profile(
+        profile,
+        latency=latency_ms / 1000,
+        rate_limit=rate_limit,
+        rate_limit_window=RATE_LIMIT_WINDOW,
+    )
+    base_url = server.start()
+
+    print(
+        f"Profile: {profile} - latency: {latency_ms}ms - rate limit: {rate_limit:,d}/min"
+    )
+    print()
+    print("Report     | Seconds | Requests | Requests/s | Peak MB")
+    print("---        | ---     | ---      | ---        | ---")
+
+    for label, report, values in RUNS:
+        if not is_available(values):
+            print(f"{label:10} | skipped, as aiohttp is not installed")
+            continue
+
+        requests_before = server.requests
+        seconds, peak_mb = run_report(base_url, server.org, report, values)
+        requests = server.requests - requests_before
+
+        print(
+            f"{label:10} | {seconds:7.2f} | {requests:8,d} | {requests / seconds:10.1f}"
+            f" | {peak_mb:7.1f}"
+        )
+
+    if server.rate_limited:
+        print()
+        print(f"Requests over the rate limit: {server.rate_limited:,d}")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
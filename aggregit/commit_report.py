@@ -5,99 +5,524 @@ Create a report of GitHub commits across configured repos and available
 branches. The report is bound by the configured usernames, repos and minimum
 date. The result is written out to a CSV.
 """
+
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import github
 import lib
 from etc import config
+from lib import fetch_plan
+from lib.capture import CAPTURE
+from lib.connection import get_paginated
+from lib.entity_store import ENTITY_STORE
+from lib.profiler import PROFILER
+from lib.row_store import CommitIndex
+from lib.scheduler import SCHEDULER
+from lib.writers import open_writer
 from models import Commit
 
+HEADER = (
+    "Repo Owner",
+    "Repo Name",
+    "Branch",
+    "Commit SHA",
+    "Commit Modified",
+    "Commit Author",
+    "Changed Files",
+    "Added Lines",
+    "Deleted Lines",
+    "Changed Lines",
+)
+COLUMN_TYPES = {
+    "Commit Modified": "date",
+    "Changed Files": "int",
+    "Added Lines": "int",
+    "Deleted Lines": "int",
+    "Changed Lines": "int",
+}
+# Columns which need a request for each commit.
+COLUMN_PARTS = {
+    "stats": ("Changed Files", "Added Lines", "Deleted Lines", "Changed Lines"),
+}
+
+COLUMNS = fetch_plan.select_columns(HEADER, config.COMMIT_COLUMNS)
+PARTS = fetch_plan.parts_needed(COLUMNS, COLUMN_PARTS)
+
+
+def list_commits(repo, branch):
+    """
+    Get commits in the history of a branch, within the configured date range.
+
+    This is a bulk listing which gets up to 100 commits per request. Each
+    commit has the parent SHAs and author user, but not stats or files. The
+    API orders commits by date, most recent first.
 
-def traverse_commits(commit, seen_commits):
+    :param repo: GitHub repo object.
+    :param branch: GitHub branch object.
+
+    :return: PyGithub paginated list of commits. Requests are only made as the
+        list is iterated over.
     """
-    Get the details for a commit and all its parents.
+    params = {"sha": branch.name}
+    if config.MIN_DATE:
+        params["since"] = config.MIN_DATE.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    Return the details for the current commit and recursively return the
-    details of its parents. Note that there may be two parents such as a for a
-    merge commit. In that case, the tree path structure will be flattened out
-    when to the one parent line's commits followed by the other parent line's
-    commits, so order is not by time.
+    return get_paginated(github.Commit.Commit, repo, "/commits", params)
 
-    Skip any commits which are older than the configured minimum date.
 
-    For each commit which is returned, print a character to show progress.
+def compare_commits(repo, base_sha, branch):
+    """
+    Get the commits on a branch which are not in the history of a base commit,
+    within the configured date range.
+
+    This uses the compare endpoint with `base...head`, which gets up to 100
+    commits per request, so a feature branch usually needs one request no
+    matter how far back its history goes. The endpoint has no date filter, so
+    commits older than the configured minimum date are dropped here.
+
+    :param repo: GitHub repo object.
+    :param base_sha: SHA of the commit to compare with, such as the HEAD of
+        the default branch.
+    :param branch: GitHub branch object.
+
+    :return: List of GitHub commit objects, most recent first, or None if
+        the branch could not be compared, such as if it has no history in
+        common with the base.
+    """
+    path = f"/compare/{base_sha}...{branch.commit.sha}"
+    try:
+        commits = list(
+            PROFILER.iter_span(
+                "compare_commits",
+                get_paginated(github.Commit.Commit, repo, path, list_item="commits"),
+            )
+        )
+    except github.GithubException as e:
+        print(f"Could not compare branch. {type(e).__name__}: {str(e)}")
+
+        return None
 
-    :param commit: A GitHub commit object to report on.
-    :param seen_commits: Commit SHA values which have been seen before.
-        This should be a set a of str values. This variable is passed by
-        reference so additions to it take effect outside of the function.
-        The set is also past to recursive calls of the function, so that
-        one increasing history of seen commits is shared across calls.
+    if config.MIN_DATE:
+        commits = [
+            commit
+            for commit in commits
+            if commit.commit.committer.date >= config.MIN_DATE
+        ]
 
-        Note - this is setup to use short SHA values, created from getting
-        the first 8 characters only. This saves on memory and is sufficient
-        for comparing commits within a branch as collisions are unlikely.
+    # The endpoint orders commits oldest first.
+    commits.reverse()
 
-    :return: Generator which yields details for the current commit and then its
-        parent commits, within the configured date range. The commit objects are
-        returned as Commit instances, formatted using the PyGithub GitCommit
-        object given as an argument.
+    return commits
 
-        If the commit has multiple parents such as for a merge commit,
-        then both paths will be followed, one after the other.
 
-        When a commit has been seen, it is outside of the date range or it
-        has no parent commits (it is the initial commit), then None will be
-        returned. This will stop the generator.
+def traverse_commits(commits, head_sha, seen_commits):
     """
-    if commit.sha in seen_commits:
-        print("(skipping seen)", end="")
+    Walk from a branch's HEAD commit through its parents, using a listing.
 
-        return None
+    Commits are taken from a listing of the branch's history, rather than
+    requested one at a time. The walk starts at the HEAD commit and follows
+    parents. When a commit has been seen before, such as from a branch which
+    was walked earlier, its parents are not followed. A commit which appears
+    in the listing before any commit which has it as a parent is held back
+    until it is reached, so the walk does not depend on the listing order.
 
-    sha = commit.sha[:8]
-    seen_commits.update([sha])
+    Once there are no more parents to reach, the remaining pages of the
+    listing are not requested, so a branch which shares most of its history
+    with an earlier branch only needs one or two requests.
 
-    last_modified = lib.parse_datetime(commit.commit.last_modified)
-    if config.MIN_DATE and last_modified < config.MIN_DATE:
-        print("(skipping old)", end="")
+    Skip any commits which are older than the configured minimum date, as
+    these are excluded from the listing.
 
-        return None
+    For each commit which is returned, print a character to show progress.
 
-    print("-", end="")
-    yield Commit(commit)
+    :param commits: Iterable of GitHub commit objects for a branch, as
+        returned from `list_commits`.
+    :param head_sha: SHA of the commit at the HEAD of the branch.
+    :param seen_commits: Full commit SHA values which have been seen before.
+        This should be a set of str values or a `CommitIndex`. This variable
+        is passed by reference so additions to it take effect outside of the
+        function, so one history of seen commits can be shared across
+        branches, repos and runs.
+
+    :return: Generator which yields GitHub commit objects which have not been
+        seen before. If a commit has multiple parents such as for a merge
+        commit, then both paths will be followed.
+    """
+    pending = {head_sha}
+    held_back = {}
 
-    if len(commit.parents) >= 2:
-        print("(merge)", end="")
+    for listed_commit in commits:
+        if listed_commit.sha not in pending:
+            held_back[listed_commit.sha] = listed_commit
+            continue
 
-    for parent in commit.parents:
-        if len(commit.parents) >= 2:
-            print("\n<", end="")
+        to_visit = [listed_commit]
 
-        yield from traverse_commits(parent, seen_commits)
+        while to_visit:
+            commit = to_visit.pop()
+            pending.discard(commit.sha)
 
+            if commit.sha in seen_commits:
+                print("(skipping seen)", end="")
+                continue
 
+            seen_commits.add(commit.sha)
+
+            print("-", end="")
+            yield commit
+
+            if len(commit.parents) >= 2:
+                print("(merge)", end="")
+
+            for parent in commit.parents:
+                if parent.sha in seen_commits:
+                    continue
+
+                if parent.sha in held_back:
+                    to_visit.append(held_back.pop(parent.sha))
+                else:
+                    pending.add(parent.sha)
+
+        if not pending:
+            break
+
+
+def is_by_users(commit):
+    """
+    Check if a commit is by one of the configured users, if any are set.
+
+    This uses the author on the listed commit so needs no extra request.
+    Commits which have no author set are excluded when filtering.
+    """
+    if not config.USERNAMES:
+        return True
+
+    return bool(commit.author) and commit.author.login in config.USERNAMES
+
+
+@PROFILER.timed("to_row")
 def to_row(repo: github.Repository, branch: str, commit_data: Commit) -> dict:
     """
     Format input data around a single commit and return as a row for a CSV.
 
     :param repo: The repo the commit is in.
-    :param branch: The branch the commit is in.
+    :param branch: Name of the branch the commit is in.
     :param commit: Instance of Commit, containing data for a single commit.
 
     :return: Formatted dict of repo, branch and commit data for
-        a single commit.
+        a single commit, with only the configured columns.
     """
-    return {
+    out_row = {
         "Repo Owner": lib.display(repo.owner),
         "Repo Name": repo.name,
-        "Branch": branch.name,
+        "Branch": branch,
         "Commit SHA": commit_data.short_sha,
-        "Commit Modified": commit_data.last_modified.date(),
+        "Commit Modified": commit_data.datetime.date(),
         "Commit Author": lib.display(commit_data.author),
-        "Changed Files": commit_data.changed_files,
-        "Added Lines": commit_data.additions,
-        "Deleted Lines": commit_data.deletions,
-        "Changed Lines": commit_data.additions + commit_data.deletions,
     }
 
+    if "stats" in PARTS:
+        out_row.update(
+            {
+                "Changed Files": commit_data.changed_files,
+                "Added Lines": commit_data.additions,
+                "Deleted Lines": commit_data.deletions,
+                "Changed Lines": commit_data.additions + commit_data.deletions,
+            }
+        )
+
+    if len(COLUMNS) < len(HEADER):
+        out_row = {column: out_row[column] for column in COLUMNS}
+
+    return out_row
+
+
+def sort_branches(branches):
+    """
+    Order branches as master, then develop, then the others as listed.
+
+    :param branches: Iterable of GitHub branch objects.
+
+    :return: List of branches.
+    """
+    branch_list = []
+
+    for branch in branches:
+        if not branch_list:
+            branch_list.append(branch)
+        elif branch.name == "master":
+            branch_list.insert(0, branch)
+        elif branch.name in ("develop", "development"):
+            dev_insert_index = 1 if branch_list[0] == "master" else 0
+            branch_list.insert(dev_insert_index, branch)
+        else:
+            branch_list.append(branch)
+
+    return branch_list
+
+
+def plan_branches(repo, branches, index):
+    """
+    Choose how to get the new commits of each branch, and skip the branches
+    which have none.
+
+    The default branch is walked from its HEAD, then each other branch is
+    compared with the HEAD of the default branch, to get only the commits
+    which are on that branch.
+
+    A branch is skipped without a request if its HEAD is the same as when it
+    was last walked, including a stale branch with only commits older than
+    the minimum date, or if its HEAD was already seen, such as for a branch
+    which was merged.
+
+    :param repo: GitHub repo object.
+    :param branches: List of GitHub branch objects, in the order to walk them.
+    :param index: `CommitIndex` of commits which have been seen.
+
+    :return: Generator which yields a tuple of a branch and the SHA of the
+        commit to compare it with, or None to walk it.
+    """
+    default = next(
+        (branch for branch in branches if branch.name == repo.default_branch), None
+    )
+    if default is not None:
+        branches = [default] + [branch for branch in branches if branch is not default]
+    base_sha = default.commit.sha if default is not None else None
+
+    for branch in branches:
+        head_sha = branch.commit.sha
+
+        if index.head(branch.name) == head_sha:
+            print(f"BRANCH: {branch.name} - unchanged since the last run")
+            continue
+
+        if head_sha in index:
+            print(f"BRANCH: {branch.name} - no new commits")
+            index.set_head(branch.name, head_sha)
+            continue
+
+        yield branch, None if branch is default else base_sha
+
+
+def select_commits(repo, branches, index):
+    """
+    Get the new commits on the branches of a repo which are by the configured
+    users.
+
+    Commits which are in the index, from an earlier branch or repo or from an
+    earlier run, are not walked again. The HEAD of each branch is set in the
+    index once the branch has been walked.
+
+    :param repo: GitHub repo object.
+    :param branches: List of GitHub branch objects, in the order to walk them.
+    :param index: `CommitIndex` of commits which have been seen.
+
+    :return: Generator which yields a tuple of the branch name and the GitHub
+        commit object from the listing, for each selected commit.
+    """
+    for branch, base_sha in plan_branches(repo, branches, index):
+        print(f"BRANCH: {branch.name}")
+
+        listed_commits = None
+        if base_sha is not None:
+            print(f"Comparing with {base_sha[:8]}")
+            listed_commits = compare_commits(repo, base_sha, branch)
+        if listed_commits is None:
+            print("Fetching commits")
+            listed_commits = PROFILER.iter_span(
+                "list_commits", list_commits(repo, branch)
+            )
+        found = 0
+        selected = 0
+        for commit in traverse_commits(listed_commits, branch.commit.sha, index):
+            found += 1
+            if not is_by_users(commit):
+                continue
+
+            selected += 1
+            yield branch.name, commit
+        print(f"\nFound: {found}")
+
+        if config.USERNAMES:
+            print(f"After filtering: {selected}")
+        print()
+
+        index.set_head(branch.name, branch.commit.sha)
+
+
+def retry_commits(repo, index):
+    """
+    Get the commits of a repo which failed on an earlier run, so that their
+    rows are added now. These are in the index, so a walk of their branch
+    stops above them.
+
+    A commit which no longer exists, such as after a force push, is removed
+    from the failed commits. Any other error is reported and the commit is
+    tried again on the next run.
+
+    :param repo: GitHub repo object.
+    :param index: `CommitIndex` of commits which have been seen.
+
+    :return: Generator which yields a tuple of the branch name and the GitHub
+        commit object, for each failed commit.
+    """
+    failed = index.failed_commits()
+    if failed:
+        print(f"Retrying failed commits: {len(failed)}")
+
+    for sha, branch_name in failed:
+        try:
+            with fetch_plan.explicit():
+                commit = repo.get_commit(sha)
+        except github.UnknownObjectException:
+            print(f"Commit {sha[:8]} - no longer exists")
+            index.forget(sha)
+            continue
+        except Exception as e:
+            print(f"Could not fetch Commit. {type(e).__name__}: {str(e)}")
+            continue
+
+        yield branch_name, commit
+
+
+def safe_load_commit(commit):
+    """
+    Convert a commit to a Commit instance and fetch its stats if they are
+    needed, without raising an error.
+
+    :return: Tuple of the Commit instance and None if successful, otherwise
+        None and the error.
+    """
+    try:
+        commit_data = Commit(commit, with_stats="stats" in PARTS)
+        commit_data.load_stats()
+    except Exception as e:
+        return None, e
+
+    return commit_data, None
+
+
+def hydrate_commits(selected, workers):
+    """
+    Fetch the stats for selected commits.
+
+    Each commit needs a request for its stats, so when using more than one
+    worker, commits are loaded in a pool of threads. At most twice as many
+    commits as workers are queued at a time, and results are yielded in the
+    same order as the input, as for PRs in the PR report.
+
+    :param selected: Iterable of tuples of branch name and GitHub commit
+        object.
+    :param workers: Number of commits to fetch at the same time.
+
+    :return: Generator which yields a tuple of the branch name, the GitHub commit
+        object, and the Commit instance and error from `safe_load_commit`.
+    """
+    if workers == 1:
+        for branch, commit in selected:
+            yield (branch, commit, *safe_load_commit(commit))
+
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        for branch, commit in selected:
+            future = executor.submit(safe_load_commit, commit)
+            pending.append((branch, commit, future))
+
+            if len(pending) >= workers * 2:
+                branch, commit, future = pending.popleft()
+                yield (branch, commit, *future.result())
+
+        while pending:
+            branch, commit, future = pending.popleft()
+            yield (branch, commit, *future.result())
+
+
+def repo_rows(repo, index):
+    """
+    Get rows for the commits on all branches of a repo.
+
+    Commits which failed on an earlier run are fetched again before the new
+    commits. The rows of commits in the repo from earlier runs are yielded
+    after the new commits.
+
+    :param repo: GitHub repo object.
+    :param index: `CommitIndex` of commits which have been seen.
+
+    :return: Generator which yields a row for each commit. Commits which could
+        not be converted are reported and skipped, and marked in the index to
+        be tried again on the next run.
+    """
+    print(f"REPO: {repo.name}")
+    print(f"{SCHEDULER.summary()}\n")
+
+    filters = {
+        "usernames": sorted(config.USERNAMES or []),
+        "columns": list(COLUMNS),
+    }
+    index.start_repo(repo.full_name, filters, config.MIN_DATE)
+
+    branches = sort_branches(PROFILER.iter_span("get_branches", repo.get_branches()))
+    selected = itertools.chain(
+        retry_commits(repo, index), select_commits(repo, branches, index)
+    )
+
+    for branch_name, commit, commit_data, error in hydrate_commits(
+        selected, config.COMMIT_WORKERS
+    ):
+        if error is None:
+            try:
+                out_row = to_row(repo, branch_name, commit_data)
+            except Exception as e:
+                error = e
+
+        if error is not None:
+            # Report error without aborting.
+            print(f"Could not parse Commit. {type(error).__name__}: {str(error)}")
+            index.fail(commit.sha, branch_name)
+            continue
+
+        if ENTITY_STORE.writing:
+            ENTITY_STORE.save_commit(repo.id, branch_name, commit_data.to_store())
+
+        index.save_row(commit.sha, commit_data.datetime, out_row)
+        yield out_row
+
+    index.end_repo([branch.name for branch in branches])
+    if ENTITY_STORE.writing:
+        ENTITY_STORE.save_branches(
+            repo.id, [(branch.name, branch.commit.sha) for branch in branches]
+        )
+
+    yield from index.earlier_rows(repo.full_name, config.MIN_DATE)
+
+
+def stored_rows(repo):
+    """
+    Get rows for the commits of a repo from the entity store, by the
+    configured users and after the configured min date, with no requests.
+
+    :param repo: GitHub repo object, from the stored repos.
+
+    :return: Generator which yields a row for each commit, in the order they
+        were found. Commits which were stored without stats, when the
+        configured columns need them, are reported and skipped.
+    """
+    print(f"REPO: {repo.name}")
+
+    for branch, record in ENTITY_STORE.commits(
+        repo.id, config.USERNAMES, config.MIN_DATE
+    ):
+        if "stats" in PARTS and record["changed_files"] is None:
+            print(f"Commit {record['sha'][:8]} - not stored with: stats")
+            continue
+
+        yield to_row(repo, branch, Commit.from_store(record))
+
 
 def main() -> None:
     """
@@ -107,21 +532,39 @@ def main() -> None:
     details of a single commit including stats, metadata and the repo and branch
     labels.
 
-    For the configured repos, get all available branches. Start with
-    master, then develop, then the feature branches (leaving them
-    in alphabetical order). Get the stats across the commits by starting
-    with the HEAD commit and get its parents recursively. Skip commits older
-    than the min date. Once commits are fetched (each requiring a GET request),
-    then filter to just those by the configured users. Filter out commits
-    which have no author set.
+    For the configured repos, get all available branches. Start with the
+    default branch, then develop, then the feature branches (leaving them
+    in alphabetical order). Walk through the commits of the default branch by
+    starting with the HEAD commit and following its parents, using a paged
+    listing of the branch's history. For other branches, only get the commits
+    which are not on the default branch, by comparing them with it. Skip
+    branches which have not changed since the last run. Skip commits older
+    than the min date. Filter to just those by the configured users and
+    filter out commits which have no author set. Only
+    then fetch the stats for each remaining commit, which needs a GET request
+    per commit. This is skipped if no stats columns are configured. Use the
+    COMMIT_WORKERS value in the config to fetch stats for several commits at
+    once.
 
     We keep track of the SHA commit values seen when iterating through a branch
     (since a merge commit will have two histories which should have a common
     commit which they diverged from). Additionally, we keep track of SHA commit
-    values across branches in a repo, so that after we have traversed master
+    values across branches and repos, so that after we have traversed master
     all the way back to its initial commit (if the date range allows), then
     we only have to look at commits which are previously traversed branches
     when going through develop (if it exists) and any feature branches.
+
+    Use the COMMIT_INCREMENTAL value in the config to keep the seen commits
+    and their rows between runs, so that a run only walks the commits which
+    were added since the last run.
+
+    Use the ENTITY_STORE_MODE value in the config to save the fetched repos,
+    branches, commits and users to the entity store, or to report on the
+    stored ones instead of using the API.
+
+    Rows are written as they are produced, in the configured output format,
+    with a checkpoint after each repo. If the report fails, run it again to
+    skip the repos which were already written.
     """
     if config.MIN_DATE:
         print(f"Commit min date: {config.MIN_DATE}")
@@ -129,64 +572,45 @@ def main() -> None:
         print("No commit min date set")
     print()
 
-    out_data = []
-    for repo in lib.get_repos():
-        print(f"REPO: {repo.name}\n")
+    lib.prefetch_names()
 
-        seen_commits = set()
+    filters = {
+        "usernames": sorted(config.USERNAMES or []),
+        "min_date": str(config.MIN_DATE),
+        "columns": list(COLUMNS),
+    }
+    column_types = {
+        column: kind for column, kind in COLUMN_TYPES.items() if column in COLUMNS
+    }
+
+    index_path = config.COMMIT_INDEX_PATH if config.COMMIT_INCREMENTAL else ":memory:"
 
-        fetched_branches = repo.get_branches()
-        branch_list = []
+    with open_writer(
+        config.COMMIT_CSV_PATH, COLUMNS, column_types, filters
+    ) as writer, CommitIndex(index_path) as index:
+        with PROFILER.span("get_repos"):
+            repos = lib.get_repos()
 
-        for branch in fetched_branches:
-            if not branch_list:
-                branch_list.append(branch)
-            elif branch.name == "master":
-                branch_list.insert(0, branch)
-            elif branch.name in ("develop", "development"):
-                dev_insert_index = 1 if branch_list[0] == "master" else 0
-                branch_list.insert(dev_insert_index, branch)
+        for repo in PROFILER.iter_span("get_repos", repos):
+            if writer.is_done(repo.full_name):
+                print(f"REPO: {repo.name} - already written")
+                continue
+
+            if ENTITY_STORE.reading:
+                writer.write_repo(repo.full_name, stored_rows(repo))
             else:
-                branch_list.append(branch)
+                writer.write_repo(repo.full_name, repo_rows(repo, index))
 
-        for branch in branch_list:
-            print(f"BRANCH: {branch.name}")
+        print(SCHEDULER.summary())
+        print(SCHEDULER.usage())
+        print(lib.DISPLAY_NAMES.summary())
+        print(fetch_plan.COMPLETIONS.summary())
+        print(CAPTURE.summary())
+        lib.save_names()
 
-            print("Fetching commits")
-            commits = list(traverse_commits(branch.commit, seen_commits))
-            print(f"\nFound: {len(commits)}")
-
-            if config.USERNAMES:
-                commits = [
-                    x
-                    for x in commits
-                    if x.author and x.author.login in config.USERNAMES
-                ]
-                print(f"After filtering: {len(commits)}")
-
-            for commit in commits:
-                try:
-                    out_row = to_row(repo, branch, commit)
-                except Exception as e:
-                    # Report error without aborting.
-                    print(f"Could not parse Commit." f" {type(e).__name__}: {str(e)}")
-                else:
-                    out_data.append(out_row)
-            print()
-
-    header = (
-        "Repo Owner",
-        "Repo Name",
-        "Branch",
-        "Commit SHA",
-        "Commit Modified",
-        "Commit Author",
-        "Changed Files",
-        "Added Lines",
-        "Deleted Lines",
-        "Changed Lines",
-    )
-    lib.write_csv(config.COMMIT_CSV_PATH, header, out_data)
+    print()
+    print(PROFILER.summary())
+    PROFILER.save_trace("commit_report")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Compare PR report backends.
+
+Create the PR report rows for the configured repos and filters using both the
+REST and GraphQL APIs, then print any rows or values which differ. This is
+used to check that the GraphQL backend gives the same report as the REST
+backend. It uses a lot of requests, so limit the configured repos or min date
+before running it.
+
+Known differences:
+    - A bot's login has a "[bot]" suffix in the REST API but not in GraphQL.
+"""
+import lib
+import pr_report
+from etc import config
+
+
+def get_rows(selected):
+    """
+    Convert selected PRs to rows, keyed by repo name and PR ID.
+    """
+    rows = {}
+
+    for out_row, error in pr_report.hydrate_prs(selected, config.PR_WORKERS):
+        if error:
+            print(error, end="")
+        else:
+            rows[(out_row["Repo Name"], out_row["PR ID"])] = out_row
+
+    return rows
+
+
+def compare(rest_rows, graphql_rows):
+    """
+    Print differences between rows for each backend.
+
+    :return: Count of differences found.
+    """
+    differences = 0
+
+    for key in sorted(rest_rows.keys() | graphql_rows.keys()):
+        rest_row = rest_rows.get(key)
+        graphql_row = graphql_rows.get(key)
+
+        if rest_row is None or graphql_row is None:
+            missing = "GraphQL" if graphql_row is None else "REST"
+            print(f"{key[0]} {key[1]} - missing for {missing}")
+            differences += 1
+            continue
+
+        for column, rest_value in rest_row.items():
+            graphql_value = graphql_row.get(column)
+            if rest_value != graphql_value:
+                print(
+                    f"{key[0]} {key[1]} - {column}:"
+                    f" REST {rest_value!r} GraphQL {graphql_value!r}"
+                )
+                differences += 1
+
+    return differences
+
+
+def main():
+    """
+    Main command-line function.
+    """
+    repos = list(lib.get_repos())
+
+    print("### REST ###")
+    rest_rows = get_rows(pr_report.select_prs(repos))
+    print()
+
+    print("### GraphQL ###")
+    graphql_rows = get_rows(pr_report.select_prs_graphql(repos))
+    print()
+
+    print("### Differences ###")
+    differences = compare(rest_rows, graphql_rows)
+    print(f"PRs: {len(rest_rows):,d} REST, {len(graphql_rows):,d} GraphQL")
+    print(f"Differences: {differences:,d}")
+
+
+if __name__ == "__main__":
+    main()
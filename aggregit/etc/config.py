@@ -4,10 +4,18 @@ Config module.
 Test directly using:
 $ python -m etc.config
 """
+
 import datetime
 import os
 
 _VALID_PR_STATES = ("open", "closed", "merged", "all")
+_VALID_PR_BACKENDS = ("rest", "graphql", "async")
+_VALID_PR_DISCOVERY = ("list", "search")
+_VALID_OUTPUT_FORMATS = ("csv", "parquet", "feather")
+_VALID_TRACE_FORMATS = (None, "json", "chrome")
+_VALID_COMPLETION_MODES = ("count", "refuse")
+_VALID_ENTITY_STORE_MODES = (None, "write", "read")
+_VALID_CAPTURE_MODES = (None, "record", "replay")
 
 
 def parse_cutoff_date(value):
@@ -50,9 +58,20 @@ SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_PATH = os.path.join(SRC_DIR, "var")
 PR_CSV_PATH = os.path.join(OUTPUT_PATH, "pr_report.csv")
 COMMIT_CSV_PATH = os.path.join(OUTPUT_PATH, "commit_report.csv")
+CACHE_DIR = os.path.join(OUTPUT_PATH, "cache")
+PR_STORE_PATH = os.path.join(OUTPUT_PATH, "pr_report.sqlite")
+COMMIT_INDEX_PATH = os.path.join(OUTPUT_PATH, "commit_index.sqlite")
+NAME_CACHE_PATH = os.path.join(OUTPUT_PATH, "display_names.json")
+SHARD_DIR = os.path.join(OUTPUT_PATH, "shards")
+ENTITY_STORE_PATH = os.path.join(OUTPUT_PATH, "entities.sqlite")
+
+# Raw data of the repos to report on, which is set in the worker processes of
+# the sharded report runner instead of getting the repos again.
+SHARD_REPOS = None
 
 # Import, parse and validate user's local config in this config file.
 try:
+    from . import configlocal as _configlocal
     from .configlocal import (
         ACCESS_TOKEN,
         BY_OWNER,
@@ -67,12 +86,86 @@ except ImportError:
 
     raise ImportError(f"You need to create a local config file at: {f_path}.")
 
+# Optional values in the user's local config. These fallback to defaults, so
+# that a local config created from an older template still works.
+BASE_URL = getattr(_configlocal, "BASE_URL", "https://api.github.com")
+ACCESS_TOKENS = getattr(_configlocal, "ACCESS_TOKENS", None) or [ACCESS_TOKEN]
+CACHE_ENABLED = getattr(_configlocal, "CACHE_ENABLED", True)
+CACHE_MAX_AGE_DAYS = getattr(_configlocal, "CACHE_MAX_AGE_DAYS", 30)
+CACHE_MAX_SIZE_MB = getattr(_configlocal, "CACHE_MAX_SIZE_MB", 500)
+PR_WORKERS = getattr(_configlocal, "PR_WORKERS", 1)
+PR_INCREMENTAL = getattr(_configlocal, "PR_INCREMENTAL", False)
+PR_BACKEND = getattr(_configlocal, "PR_BACKEND", "rest")
+PR_DISCOVERY = getattr(_configlocal, "PR_DISCOVERY", "list")
+COMMIT_INCREMENTAL = getattr(_configlocal, "COMMIT_INCREMENTAL", False)
+COMMIT_WORKERS = getattr(_configlocal, "COMMIT_WORKERS", 1)
+RATE_LIMIT_PER_MINUTE = getattr(_configlocal, "RATE_LIMIT_PER_MINUTE", 900)
+RATE_LIMIT_BURST = getattr(_configlocal, "RATE_LIMIT_BURST", 100)
+RATE_LIMIT_RESERVE = getattr(_configlocal, "RATE_LIMIT_RESERVE", 0)
+NAME_CACHE_ENABLED = getattr(_configlocal, "NAME_CACHE_ENABLED", True)
+NAME_CACHE_TTL_DAYS = getattr(_configlocal, "NAME_CACHE_TTL_DAYS", 7)
+NAME_CACHE_ORGS = getattr(_configlocal, "NAME_CACHE_ORGS", [])
+OUTPUT_FORMAT = getattr(_configlocal, "OUTPUT_FORMAT", "csv")
+ASYNC_CONCURRENCY = getattr(_configlocal, "ASYNC_CONCURRENCY", 20)
+ASYNC_CONNECTIONS_PER_HOST = getattr(_configlocal, "ASYNC_CONNECTIONS_PER_HOST", 20)
+PROFILE_ENABLED = getattr(_configlocal, "PROFILE_ENABLED", True)
+PROFILE_TRACE_FORMAT = getattr(_configlocal, "PROFILE_TRACE_FORMAT", None)
+IMPLICIT_COMPLETIONS = getattr(_configlocal, "IMPLICIT_COMPLETIONS", "count")
+PR_COLUMNS = getattr(_configlocal, "PR_COLUMNS", None)
+COMMIT_COLUMNS = getattr(_configlocal, "COMMIT_COLUMNS", None)
+MAX_DATE = getattr(_configlocal, "MAX_DATE", None)
+ENTITY_STORE_MODE = getattr(_configlocal, "ENTITY_STORE_MODE", None)
+CAPTURE_MODE = getattr(_configlocal, "CAPTURE_MODE", None)
+CAPTURE_PATH = getattr(
+    _configlocal, "CAPTURE_PATH", os.path.join(OUTPUT_PATH, "capture.jsonl.gz")
+)
+CAPTURE_LATENCY = getattr(_configlocal, "CAPTURE_LATENCY", False)
+
 MIN_DATE = parse_cutoff_date(MIN_DATE)
+MAX_DATE = parse_cutoff_date(MAX_DATE)
 
 assert ACCESS_TOKEN, "Please set the ACCESS_TOKEN value in the local config" " file"
 assert (
     PR_STATE in _VALID_PR_STATES
 ), f"Expected one of {_VALID_PR_STATES!r} but got: {PR_STATE!r}"
+assert (
+    PR_BACKEND in _VALID_PR_BACKENDS
+), f"Expected one of {_VALID_PR_BACKENDS!r} but got: {PR_BACKEND!r}"
+assert (
+    PR_DISCOVERY in _VALID_PR_DISCOVERY
+), f"Expected one of {_VALID_PR_DISCOVERY!r} but got: {PR_DISCOVERY!r}"
+assert (
+    OUTPUT_FORMAT in _VALID_OUTPUT_FORMATS
+), f"Expected one of {_VALID_OUTPUT_FORMATS!r} but got: {OUTPUT_FORMAT!r}"
+assert (
+    PROFILE_TRACE_FORMAT in _VALID_TRACE_FORMATS
+), f"Expected one of {_VALID_TRACE_FORMATS!r} but got: {PROFILE_TRACE_FORMAT!r}"
+assert (
+    IMPLICIT_COMPLETIONS in _VALID_COMPLETION_MODES
+), f"Expected one of {_VALID_COMPLETION_MODES!r} but got: {IMPLICIT_COMPLETIONS!r}"
+assert (
+    ENTITY_STORE_MODE in _VALID_ENTITY_STORE_MODES
+), f"Expected one of {_VALID_ENTITY_STORE_MODES!r} but got: {ENTITY_STORE_MODE!r}"
+assert (
+    CAPTURE_MODE in _VALID_CAPTURE_MODES
+), f"Expected one of {_VALID_CAPTURE_MODES!r} but got: {CAPTURE_MODE!r}"
+assert not (
+    CAPTURE_MODE and PR_BACKEND == "async"
+), "CAPTURE_MODE cannot be used with the 'async' PR_BACKEND"
+assert not (
+    PR_INCREMENTAL and PR_BACKEND != "rest"
+), "PR_INCREMENTAL can only be used with the 'rest' PR_BACKEND"
+assert not (
+    PR_DISCOVERY == "search" and (PR_INCREMENTAL or PR_BACKEND != "rest")
+), "PR_DISCOVERY 'search' can only be used with the 'rest' PR_BACKEND, without PR_INCREMENTAL"
+assert not (MAX_DATE and PR_INCREMENTAL), "MAX_DATE cannot be used with PR_INCREMENTAL"
+assert not (
+    MIN_DATE and MAX_DATE and MAX_DATE < MIN_DATE
+), f"Expected MAX_DATE to be on or after MIN_DATE but got: {MAX_DATE}"
+assert PR_WORKERS >= 1, f"Expected PR_WORKERS to be at least 1 but got: {PR_WORKERS}"
+assert (
+    COMMIT_WORKERS >= 1
+), f"Expected COMMIT_WORKERS to be at least 1 but got: {COMMIT_WORKERS}"
 
 if __name__ == "__main__":
     test()
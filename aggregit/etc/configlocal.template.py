@@ -12,6 +12,18 @@ See docs/installation.md for instructions.
 # This is MUST be set with a valid value - see docs/installation.md.
 ACCESS_TOKEN = ""
 
+# Optional list of tokens, such as of several bot accounts, to spread requests
+# over their rate limits. Each request is sent with the token which has the
+# most remaining rate limit, and the usage of each token is shown at the end of
+# a report. The sharded report runner gives each worker process one of the
+# tokens instead. Defaults to `ACCESS_TOKEN`.
+# e.g. ACCESS_TOKENS = ["abc...", "def..."]
+ACCESS_TOKENS = None
+
+# Base URL of the API. Change this for GitHub Enterprise, e.g.
+# "https://github.mycompany.com/api/v3", or to run against a local server.
+BASE_URL = "https://api.github.com"
+
 
 ##################
 # Global filters #
@@ -47,6 +59,11 @@ REPO_PATHS = ("MichaelCurrin/aggre-git",)
 # - `None`: No limit.
 MIN_DATE = None
 
+# Last date for activity, in the same formats as `MIN_DATE`. For the PR report,
+# any PRs which were updated after this date will be ignored. This cannot be
+# used with `PR_INCREMENTAL`.
+MAX_DATE = None
+
 
 #####################
 # PR Report filters #
@@ -54,3 +71,192 @@ MIN_DATE = None
 
 # Include only PRs in this state. Must be one of 'open', 'closed' or 'all'.
 PR_STATE = "all"
+
+# Number of threads used to fetch details of PRs at the same time. Each PR
+# needs several requests, so a higher value makes the report faster for repos
+# with many PRs. Rows are still written in the same order. Set as 1 to fetch
+# one PR at a time.
+PR_WORKERS = 1
+
+# Keep the rows of the PR report between runs, and on each run only fetch PRs
+# which were updated since the last run. Rows are stored in a database in the
+# `var` directory - delete it to rebuild the report from scratch. The store is
+# rebuilt automatically for a repo if the usernames or PR state filters change.
+PR_INCREMENTAL = False
+
+# API to fetch PRs with. One of:
+# - "rest": The V3 REST API. This needs several requests for each PR.
+# - "graphql": The V4 GraphQL API. This gets a page of PRs with all their
+#       details in one request, so is much faster for repos with many PRs.
+#       This cannot be used with `PR_INCREMENTAL`.
+# - "async": The V3 REST API, with requests for many repos and PRs sent at
+#       once using asyncio. See `ASYNC_CONCURRENCY` below. This needs the
+#       `aiohttp` package and cannot be used with `PR_INCREMENTAL`.
+PR_BACKEND = "rest"
+
+# How to find the PRs to report on with the "rest" backend. One of:
+# - "list": List every PR of each repo and skip those which are not by the
+#       configured users.
+# - "search": Search for PRs by the configured users, updated since the min
+#       date, with the Search API. Only those PRs are fetched, which needs far
+#       fewer requests when reporting on a few users in an org with many PRs.
+#       This cannot be used with `PR_INCREMENTAL`.
+PR_DISCOVERY = "list"
+
+# Max requests in flight at once for the "async" backend, and max open
+# connections to the API host.
+ASYNC_CONCURRENCY = 20
+ASYNC_CONNECTIONS_PER_HOST = 20
+
+
+#################
+# Commit Report #
+#################
+
+# Keep an index of the commits which were walked between runs, with the rows
+# of the selected commits, in a database in the `var` directory. On the next
+# run, walking a branch stops at the commits which are in the index, so only
+# commits added since the last run are requested. Delete the database to
+# rebuild the report from scratch. A repo is rebuilt automatically if the
+# usernames or columns change.
+COMMIT_INCREMENTAL = False
+
+# Number of threads used to fetch the stats of commits at the same time. Each
+# commit by the configured users needs a request for its stats, so a higher
+# value makes the report faster for repos with many commits. Rows are still
+# written in the same order. Set as 1 to fetch one commit at a time.
+COMMIT_WORKERS = 1
+
+
+##############
+# Rate limit #
+##############
+
+# Max requests to send per minute on average. GitHub recommends staying under
+# 900 per minute to avoid its secondary rate limits.
+RATE_LIMIT_PER_MINUTE = 900
+
+# Max requests which can be sent at once before the per minute rate applies.
+RATE_LIMIT_BURST = 100
+
+# When the remaining rate limit gets down to this value, wait until the reset
+# time before sending more requests. Set above zero to leave some requests
+# for other use of your token while a report runs.
+RATE_LIMIT_RESERVE = 0
+
+
+#########
+# Cache #
+#########
+
+# Store API responses on disk and revalidate them with conditional requests,
+# so that unchanged data does not count against the API rate limit. Set as
+# False to bypass the cache. To empty it, run `./response_cache.py purge`.
+CACHE_ENABLED = True
+
+# Remove cached responses which were stored more than this many days ago.
+CACHE_MAX_AGE_DAYS = 30
+
+# Remove the least recently used responses when the cache grows past this size.
+CACHE_MAX_SIZE_MB = 500
+
+
+#################
+# Display names #
+#################
+
+# Keep the display names of users in a file in the `var` directory between
+# runs, so that each user's profile is not requested again on every run. Set
+# as False to only keep names while a report runs.
+NAME_CACHE_ENABLED = True
+
+# Request the name of a user again if it was stored more than this many days
+# ago.
+NAME_CACHE_TTL_DAYS = 7
+
+# Logins of orgs to fetch the names of all members for at the start of a
+# report, with one request per 100 members. This is much faster than fetching
+# each user's profile when the reports cover many users of an org. e.g.
+# NAME_CACHE_ORGS = ["MichaelCurrin"]
+NAME_CACHE_ORGS = []
+
+
+##########
+# Output #
+##########
+
+# File format to write reports in, to the `var` directory. One of:
+# - "csv": A CSV file.
+# - "parquet": A Parquet file, with dates and counts typed. Needs `pyarrow`.
+# - "feather": A Feather (Arrow IPC) file, with dates and counts typed. This is
+#       the fastest to load with pandas. Needs `pyarrow`.
+OUTPUT_FORMAT = "csv"
+
+# Columns to include in each report, in any order, or None for all. Columns
+# are written in the order of the full report. Leaving out columns which need
+# extra requests makes a report faster, e.g. the PR report only requests the
+# details of each PR for "Merged By", "Commits", "Comments" and the counts of
+# files and lines, and the commit report only requests each commit for the
+# counts of files and lines.
+# e.g. PR_COLUMNS = ["Repo Name", "PR ID", "Author", "Status", "PR Updated At"]
+PR_COLUMNS = None
+COMMIT_COLUMNS = None
+
+# Keep the users, repos, branches, PRs, reviews and commits which reports fetch
+# in a SQLite database at `var/entities.sqlite`, which both reports share. One
+# of:
+# - None: Do not use the store.
+# - "write": Save each entity as it is fetched, updating those stored before.
+# - "read": Report on the stored entities with SQL queries instead of the API,
+#       so a report sends no requests. Run the report in "write" mode first,
+#       with at least the same columns, repos and date range.
+ENTITY_STORE_MODE = None
+
+
+#############
+# Profiling #
+#############
+
+# Record the time, size and status of each API request by endpoint, and the
+# time spent in each phase of a report, and print a summary at the end. This
+# only keeps totals, so it is cheap enough to leave on.
+PROFILE_ENABLED = True
+
+# Write every request and phase to a trace file in the `var` directory at the
+# end of a report, e.g. `var/pr_report.trace.json`. One of:
+# - None: Do not write a trace.
+# - "json": A list of events, with times in seconds.
+# - "chrome": Chrome trace events, which can be opened in `chrome://tracing`
+#       or https://ui.perfetto.dev to see a timeline for each thread.
+PROFILE_TRACE_FORMAT = None
+
+# Reading a field of a PyGithub object from a listing which was not in the
+# listing sends a request for the full object, which is easy to miss. These
+# requests for a single PR, commit or user are counted in the summary at the
+# end of a report. One of:
+# - "count": Count them and carry on.
+# - "refuse": Raise an error instead, to find the code which reads the field.
+IMPLICIT_COMPLETIONS = "count"
+
+
+###########
+# Capture #
+###########
+
+# Record the API responses of a report to a file, or run a report again from
+# them without the network. One of:
+# - None: Send requests as usual.
+# - "record": Write each response to the capture file, replacing the file.
+# - "replay": Send no requests, and serve each response from the capture file.
+#       Use the same config as when recording. The async PR backend cannot be
+#       used with either mode.
+CAPTURE_MODE = None
+
+# Gzipped file to record responses to and replay them from. This defaults to
+# `var/capture.jsonl.gz`, so set a path for each report to keep captures of
+# both. e.g.
+# CAPTURE_PATH = "/tmp/pr_report.jsonl.gz"
+
+# When replaying, wait for the time each request took when it was recorded,
+# rather than serving responses at once.
+CAPTURE_LATENCY = False
@@ -11,13 +11,22 @@ import github
 from etc import config
 from github import UnknownObjectException
 
+from . import fetch_plan
 from .connection import CONN
+from .display_names import DISPLAY_NAMES
+from .entity_store import ENTITY_STORE
 
-# Match a ticket number like "ABC-123".
-JIRA_TICKET_PATTERN = re.compile(r"[A-Z]+-\d+")
+# Match a ticket number like "ABC-123". The lookbehind means a match is only
+# tried from the start of a run of capital letters, rather than again from each
+# letter in the run.
+JIRA_TICKET_PATTERN = re.compile(r"[A-Z](?<![A-Z][A-Z])[A-Z]*-\d+")
 # Match a URL like "https://jira.myorg.com/browse/ABC-123", where domain could
-# optionally include organization's name. Extract just the ticket portion.
-JIRA_URL_PATTERN = re.compile(r"https:\/\/jira.+/browse/([A-Z]+-\d+)")
+# optionally include organization's name. Extract just the ticket portion. The
+# URL can not span whitespace, so this does not search the rest of the line
+# again for each Jira link.
+JIRA_URL_PATTERN = re.compile(r"https://jira\S+?/browse/([A-Z]+-\d+)")
+# Characters at the start of each text to search for a ticket.
+JIRA_SCAN_CHARS = 10_000
 
 
 def parse_datetime(standard_datetime):
@@ -39,14 +48,39 @@ def parse_datetime(standard_datetime):
     return datetime.datetime.fromtimestamp(timestamp)
 
 
+def parse_iso_datetime(value):
+    """
+    Parse an ISO 8601 datetime string in UTC, as given by the GraphQL API and
+    the JSON of the REST API, to a datetime object.
+
+    The result is a naive datetime, to match the PyGithub REST objects.
+
+    >>> parse_iso_datetime("2019-01-02T03:04:05Z")
+    datetime.datetime(2019, 1, 2, 3, 4, 5)
+    >>> parse_iso_datetime(None)
+    """
+    if value is None:
+        return None
+
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+
+
 def display(user: github.NamedUser.NamedUser):
     """
     Return an easy-to-read reference for a GitHub user account.
 
+    The name is looked up in the display names cache, so that the user's
+    profile is only requested the first time a login is seen.
+
+    :param user: PyGithub user object or Actor. Or, the login of a user.
+
     :return: User or org's display otherwise their handle.
     """
     if user:
-        return user.name if user.name else f"@{user.login}"
+        name = DISPLAY_NAMES.name(user)
+        login = user if isinstance(user, str) else user.login
+
+        return name if name else f"@{login}"
 
     return "<NO USER FOUND>"
 
@@ -73,15 +107,28 @@ def get_repos():
     :return repos: A list of GitHub Repository objects. If getting all repos
         for a user, this is a paginated list (requests are not made yet),
         otherwise if getting repos by repo paths then each objects contains
-        data from a completed request.
+        data from a completed request. In a worker of the sharded report
+        runner, this is the shard of repos which the runner got. When reading
+        from the entity store, these are the stored repos. When writing to it,
+        this is a generator which stores each repo as it is used.
     """
+    if config.SHARD_REPOS is not None:
+        return [
+            CONN.create_from_raw_data(github.Repository.Repository, raw_data)
+            for raw_data in config.SHARD_REPOS
+        ]
+
+    if ENTITY_STORE.reading:
+        return _read_repos()
+
     if config.BY_OWNER:
         try:
             user = CONN.get_organization(config.REPO_OWNER)
             
             print(f"Fetched org: {config.REPO_OWNER}")
         except UnknownObjectException:
-            user = CONN.get_user(config.REPO_OWNER)
+            with fetch_plan.explicit():
+                user = CONN.get_user(config.REPO_OWNER)
             print(f"Fetched user: {config.REPO_OWNER}")
 
         # This is a paginated list, so we do not get all repos upfront.
@@ -100,9 +147,64 @@ def get_repos():
             repos.append(repo)
     print()
 
+    if ENTITY_STORE.writing:
+        return _stored_repos(repos)
+
     return repos
 
 
+def _read_repos():
+    """
+    Get the configured repos from the entity store.
+    """
+    if config.BY_OWNER:
+        stored = ENTITY_STORE.repos(owner=config.REPO_OWNER)
+    else:
+        stored = ENTITY_STORE.repos(full_names=config.REPO_PATHS)
+    print(f"Stored repos: {len(stored)}")
+    print()
+
+    return [
+        CONN.create_from_raw_data(github.Repository.Repository, raw_data)
+        for raw_data in stored
+    ]
+
+
+def _stored_repos(repos):
+    """
+    Save each repo to the entity store as it is used.
+    """
+    for repo in repos:
+        ENTITY_STORE.save_repo(repo._rawData)
+        yield repo
+
+
+def prefetch_names():
+    """
+    Get display names for a report up front.
+
+    When reading from the entity store, the stored names are used, so that no
+    user is requested. Otherwise, fetch the names of the members of the
+    configured orgs.
+    """
+    if ENTITY_STORE.reading:
+        for login, name in ENTITY_STORE.users():
+            DISPLAY_NAMES.add(login, name)
+    else:
+        DISPLAY_NAMES.prefetch_orgs(config.NAME_CACHE_ORGS)
+
+
+def save_names():
+    """
+    Save the display names which are known, to their file and to the entity
+    store if writing to it.
+    """
+    DISPLAY_NAMES.save()
+
+    if ENTITY_STORE.writing:
+        ENTITY_STORE.save_users(DISPLAY_NAMES.items())
+
+
 def write_csv(path, header, data):
     """
     Write rows to a CSV.
@@ -122,12 +224,57 @@ def write_csv(path, header, data):
         writer.writerows(data)
 
 
-def extract_jira_ticket(text):
+def extract_jira_tickets(items):
+    """
+    Extract the Jira ticket ID of each of a batch of items, such as PRs.
+
+    Both patterns take linear time on any text, and only the first
+    `JIRA_SCAN_CHARS` characters of each text are searched, so that a long
+    templated description is quick to search.
+
+    :param items: Iterable of tuples of texts for each item, in order of
+        preference, such as the description and title of a PR. A text may be
+        None.
+
+    :return: List with the first Jira ticket ID found for each item, or None
+        if there is no match. A ticket in a Jira URL is preferred over a plain
+        ticket number in the same text.
+
+    >>> extract_jira_tickets([("See ABC-1", "DEF-2"), (None, "DEF-2"), ("abc", "")])
+    ['ABC-1', 'DEF-2', None]
+    """
+    tickets = []
+
+    for texts in items:
+        ticket = None
+
+        for text in texts:
+            if not text:
+                continue
+
+            match = JIRA_URL_PATTERN.search(text, 0, JIRA_SCAN_CHARS)
+            if match:
+                ticket = match.group(1)
+                break
+
+            match = JIRA_TICKET_PATTERN.search(text, 0, JIRA_SCAN_CHARS)
+            if match:
+                ticket = match.group()
+                break
+
+        tickets.append(ticket)
+
+    return tickets
+
+
+def extract_jira_ticket(*texts):
     """
     Extract Jira ticket ID if one can be found.
 
-    :param text: Text to search, such as a PR description. Expect it to contain
-        a Jira URL otherwise fallback to checking for a plain ticket number.
+    :param texts: Text to search, such as a PR description. Expect it to
+        contain a Jira URL otherwise fallback to checking for a plain ticket
+        number. Further texts, such as the PR title, are searched in turn if
+        there is no match.
 
     :return: The first Jira ticket ID if found e.g. "ABC-123". Or, None
         if no match.
@@ -150,18 +297,13 @@ def extract_jira_ticket(text):
 
     >>> extract_jira_ticket("https://jira.com/browse/abc-123")
 
-    """
-    match = JIRA_URL_PATTERN.search(text)
-
-    if match:
-        return match.group(1)
+    >>> extract_jira_ticket("See ABC-1 in https://jira.com/browse/DEF-2")
+    'DEF-2'
 
-    match = JIRA_TICKET_PATTERN.search(text)
-
-    if match:
-        return match.group()
-
-    return None
+    >>> extract_jira_ticket("No ticket", "ABC-1: Fix the thing")
+    'ABC-1'
+    """
+    return extract_jira_tickets([texts])[0]
 
 
 def week_of_year(value):
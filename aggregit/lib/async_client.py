@@ -0,0 +1,295 @@
+"""
+Async client library module.
+
+Usage:
+    from lib import async_client
+
+    async def get_pulls(client, repo_name):
+        return [pr async for pr in client.iter_pulls(repo_name, state="all")]
+
+    pulls_by_repo = async_client.run_all(get_pulls, ["org/repo-a", "org/repo-b"])
+
+Send requests to the GitHub REST API with asyncio, so that requests for many
+repos and PRs can be in flight at once. PyGithub only sends one request at a
+time per thread, so processing repos one after another spends most of the
+time waiting on the network.
+
+The client covers the endpoints used by the async PR backend: pulls, pull
+commits and reviews. Responses are returned as the decoded
+JSON, which can be wrapped in PyGithub objects to use existing report code.
+
+Connections are pooled per host and a global cap limits the requests in flight.
+Requests go through the same rate limit scheduler, response cache and profiler
+as `CONN`, and each request is sent with the token which the scheduler picks.
+The scheduler may sleep, so it is called in a thread to avoid blocking other
+requests.
+
+Report code which is not async uses the client through `run` and `run_all`,
+which start an event loop and a client and return the results.
+
+Needs the optional `aiohttp` package.
+"""
+import asyncio
+import json
+import re
+import time
+import urllib.parse
+
+from etc import config
+
+from .cache import RESPONSE_CACHE, CachedResponse
+from .connection import MAX_PER_PAGE
+from .profiler import PROFILER
+from .scheduler import MAX_RATE_LIMIT_RETRIES, SCHEDULER
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+ACCEPT = "application/vnd.github.v3+json"
+USER_AGENT = "aggre-git"
+
+# Match the URL of the next page in a Link header.
+NEXT_LINK_PATTERN = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+
+class AsyncGitHub:
+    """
+    GitHub REST API client for asyncio, with connection pooling and a cap on
+    requests in flight.
+
+    Use as an async context manager, to open and close the connection pool.
+    """
+
+    def __init__(self, token, base_url, concurrency, connections_per_host):
+        """
+        :param token: GitHub API token.
+        :param base_url: Base URL of the API, e.g. "https://api.github.com".
+        :param concurrency: Max requests in flight at once.
+        :param connections_per_host: Max open connections to a host.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "The aiohttp package is needed for the async client."
+                " Install it or use another PR_BACKEND."
+            )
+
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.connections_per_host = connections_per_host
+
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.connections_per_host)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={
+                "Authorization": f"token {self.token}",
+                "Accept": ACCEPT,
+                "User-Agent": USER_AGENT,
+            },
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._session.close()
+
+    async def _send(self, url, headers):
+        """
+        Send a GET request and return a response which mimics PyGithub's,
+        using the cache if it is enabled.
+        """
+        split_url = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(("", "", split_url.path, split_url.query, ""))
+
+        key = entry = None
+        if config.CACHE_ENABLED:
+            key = RESPONSE_CACHE.key(split_url.hostname, path, ACCEPT)
+            entry = RESPONSE_CACHE.get(key)
+            if entry:
+                headers = {**headers, **RESPONSE_CACHE.conditional_headers(entry)}
+
+        start = time.perf_counter()
+        async with self._session.get(url, headers=headers) as resp:
+            response = CachedResponse(
+                resp.status,
+                {k.lower(): v for k, v in resp.headers.items()},
+                await resp.text(),
+            )
+        end = time.perf_counter()
+
+        cache_status = None
+        if entry and response.status == 304:
+            cache_status = "hit"
+            response = RESPONSE_CACHE.revalidated(key, entry, response)
+        elif key:
+            cache_status = "miss"
+            RESPONSE_CACHE.count(hit=False)
+            if response.status == 200:
+                RESPONSE_CACHE.store(key, path, response)
+
+        PROFILER.record_request(
+            "GET",
+            url,
+            response.status,
+            start,
+            end,
+            len(response.text),
+            cache_status,
+            response.headers,
+        )
+
+        return response
+
+    async def request(self, url, params=None):
+        """
+        Send a GET request and return the response.
+
+        :param url: Full URL, or a path relative to the base URL.
+        :param params: Optional dict of query parameters.
+
+        :raises aiohttp.ClientResponseError: If the response is an error.
+
+        :return: Response with the status, headers with lowercase names, and
+            text of the body.
+        """
+        if url.startswith("/"):
+            url = f"{self.base_url}{url}"
+        if params:
+            url = f"{url}?{urllib.parse.urlencode(params)}"
+        path = urllib.parse.urlsplit(url).path
+
+        loop = asyncio.get_running_loop()
+
+        async with self._semaphore:
+            for _ in range(MAX_RATE_LIMIT_RETRIES):
+                token = await loop.run_in_executor(None, SCHEDULER.acquire, path)
+                headers = {"Authorization": f"token {token}"} if token else {}
+                response = await self._send(url, headers)
+
+                wait = SCHEDULER.update(
+                    token, path, response.status, response.headers, response.text
+                )
+                if wait is None:
+                    break
+                if wait:
+                    print(f"\nRate limited. Waiting {wait:,d}s to retry.")
+                    await asyncio.sleep(wait)
+
+        if response.status >= 400:
+            raise aiohttp.ClientResponseError(
+                None, (), status=response.status, message=response.text[:200]
+            )
+
+        return response
+
+    async def get_json(self, url, params=None):
+        """
+        Return the decoded JSON of a GET request.
+        """
+        response = await self.request(url, params)
+
+        return json.loads(response.text)
+
+    async def iter_paginated(self, path, params=None, per_page=MAX_PER_PAGE):
+        """
+        Request pages of a listing, following the next links.
+
+        :return: Async generator which yields each item. The next page is only
+            requested as the previous page has been used.
+        """
+        url = path
+        params = dict(params or {}, per_page=per_page)
+
+        while url:
+            response = await self.request(url, params)
+            for item in json.loads(response.text):
+                yield item
+
+            match = NEXT_LINK_PATTERN.search(response.headers.get("link", ""))
+            url = match.group(1) if match else None
+            # The next link includes the query parameters.
+            params = None
+
+    async def get_all(self, path, params=None, per_page=MAX_PER_PAGE):
+        """
+        Return all items of a listing.
+        """
+        return [item async for item in self.iter_paginated(path, params, per_page)]
+
+    def iter_pulls(self, repo_name, **params):
+        """
+        List PRs of a repo, with optional params such as state and sort.
+        """
+        return self.iter_paginated(f"/repos/{repo_name}/pulls", params)
+
+    async def get_pull(self, repo_name, number):
+        return await self.get_json(f"/repos/{repo_name}/pulls/{number}")
+
+    async def get_pull_commits(self, repo_name, number, page=1):
+        """
+        Return a page of a PR's commits, oldest first.
+
+        Use the PR's count of commits to find the page with its latest commit.
+        """
+        return await self.get_json(
+            f"/repos/{repo_name}/pulls/{number}/commits",
+            {"per_page": MAX_PER_PAGE, "page": page},
+        )
+
+    async def get_reviews(self, repo_name, number):
+        return await self.get_all(f"/repos/{repo_name}/pulls/{number}/reviews")
+
+
+def create_client():
+    """
+    Return a client using the configured token, base URL and limits.
+    """
+    return AsyncGitHub(
+        config.ACCESS_TOKENS[0],
+        config.BASE_URL,
+        config.ASYNC_CONCURRENCY,
+        config.ASYNC_CONNECTIONS_PER_HOST,
+    )
+
+
+def run(func, *args):
+    """
+    Run a coroutine function with a client, from code which is not async.
+
+    :param func: Coroutine function which takes a client and the args.
+
+    :return: Result of the function.
+    """
+
+    async def main():
+        async with create_client() as client:
+            return await func(client, *args)
+
+    return asyncio.run(main())
+
+
+def run_all(func, items):
+    """
+    Run a coroutine function for each of several items at once, with a shared
+    client, from code which is not async.
+
+    :param func: Coroutine function which takes a client and an item.
+    :param items: Iterable of items, such as repo names.
+
+    :return: List of results, in the same order as the items. If a call raised
+        an error, the error is returned in its place.
+    """
+
+    async def gather(client, items):
+        return await asyncio.gather(
+            *(func(client, item) for item in items), return_exceptions=True
+        )
+
+    return run(gather, list(items))
@@ -0,0 +1,296 @@
+"""
+Cache library module.
+
+Usage:
+    >>> from lib.cache import RESPONSE_CACHE
+    >>> RESPONSE_CACHE.prune()
+
+Store GitHub API responses on disk, keyed by the request URL (including query
+parameters) and the Accept header. A stored response is not served blindly -
+the request is still sent, but with an `If-None-Match` or `If-Modified-Since`
+header set from the stored `ETag` or `Last-Modified` value. If the data has not
+changed, GitHub replies with an empty 304 response, which does not count
+against the rate limit, and the stored body is used instead.
+    https://docs.github.com/en/rest/overview/resources-in-the-rest-api#conditional-requests
+
+Each response is a gzipped JSON file in the configured cache directory. The
+file's modified time is when it was stored and its access time is set whenever
+the response is used, so that the least recently used responses are removed
+first when the cache is too large. Responses stored longer ago than the max age
+are removed regardless of use.
+
+The cache is used through the connection classes in `lib.connection`, so is
+applied to every GET request made with `CONN`. Set `CACHE_ENABLED` in the
+local config to bypass it. See the `response_cache.py` script to check the
+size of the cache or to empty it.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from etc import config
+
+SECONDS_PER_DAY = 24 * 60 * 60
+BYTES_PER_MB = 1024 * 1024
+
+# Response headers which describe the request that was just made, rather than
+# the stored data, so these are taken from a 304 response and not the cache.
+FRESH_HEADERS = (
+    "date",
+    "x-ratelimit-limit",
+    "x-ratelimit-remaining",
+    "x-ratelimit-reset",
+    "x-ratelimit-used",
+    "x-ratelimit-resource",
+)
+
+
+class CachedResponse:
+    """
+    Mimic the response object of PyGithub's connection classes.
+    """
+
+    def __init__(self, status, headers, text):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+class ResponseCache:
+    """
+    Store of API responses on disk, for use with conditional requests.
+
+    Counts of hits (served from the cache after a 304 response) and misses
+    (a full response was received) are kept for the current process.
+    """
+
+    def __init__(self, directory, max_age_days, max_size_mb):
+        """
+        Initialize cache for a directory, which is created if needed.
+        """
+        self.directory = directory
+        self.max_age = max_age_days * SECONDS_PER_DAY
+        self.max_size = max_size_mb * BYTES_PER_MB
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(host, url, accept):
+        """
+        Return a key for a request, as a hash of the URL and Accept header.
+
+        :param host: Hostname of the API.
+        :param url: Path of the request, including any query parameters.
+        :param accept: Accept header of the request, if any. The same URL can
+            give a different response for a different media type.
+        """
+        value = f"{host} {url} {accept or ''}"
+
+        return hashlib.sha1(value.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, key):
+        """
+        Return a stored response for a key, if there is one and it has not
+        expired.
+
+        :return: dict with "headers" and "body" keys, or None if not found.
+        """
+        path = self._path(key)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        if self._expired(stat):
+            self._remove(path)
+
+            return None
+
+        try:
+            with gzip.open(path, "rt") as f_in:
+                entry = json.load(f_in)
+        except (OSError, ValueError):
+            # A partly-written or corrupt file is treated as a miss.
+            self._remove(path)
+
+            return None
+
+        return entry
+
+    def store(self, key, url, response):
+        """
+        Store a 200 response, if it has a validator so can be revalidated.
+
+        :param key: Key for the request.
+        :param url: Path of the request, for reference when inspecting files.
+        :param response: Response object from a connection class.
+        """
+        headers = {k.lower(): v for k, v in response.getheaders()}
+
+        if "etag" not in headers and "last-modified" not in headers:
+            return
+
+        entry = {
+            "url": url,
+            "stored_at": time.time(),
+            "headers": headers,
+            "body": response.read(),
+        }
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file first so a reader never sees a partial file.
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt") as f_out:
+            json.dump(entry, f_out)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Return request headers to revalidate a stored response.
+        """
+        headers = {}
+        stored_headers = entry["headers"]
+
+        if "etag" in stored_headers:
+            headers["If-None-Match"] = stored_headers["etag"]
+        if "last-modified" in stored_headers:
+            headers["If-Modified-Since"] = stored_headers["last-modified"]
+
+        return headers
+
+    def revalidated(self, key, entry, response):
+        """
+        Return the stored response for a key, after receiving a 304 response.
+
+        The stored headers are used, except for those about the new request,
+        such as the rate limit values.
+
+        :return: CachedResponse instance, with the 200 status of the stored
+            response.
+        """
+        headers = dict(entry["headers"])
+        fresh_headers = {k.lower(): v for k, v in response.getheaders()}
+        for name in FRESH_HEADERS:
+            if name in fresh_headers:
+                headers[name] = fresh_headers[name]
+
+        # Mark as recently used, for size-based eviction.
+        path = self._path(key)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            pass
+
+        self.count(hit=True)
+
+        return CachedResponse(200, headers, entry["body"])
+
+    def count(self, hit):
+        """
+        Increment the hit or miss count.
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _expired(self, stat, now=None):
+        now = now or time.time()
+
+        return now - stat.st_mtime > self.max_age
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _files(self):
+        """
+        Yield path and stat result for each stored response.
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        for dir_path, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+    def prune(self):
+        """
+        Remove expired responses and then the least recently used responses
+        until the cache is within the max size.
+
+        :return: Count of files removed.
+        """
+        now = time.time()
+        removed = 0
+        kept = []
+
+        for path, stat in self._files():
+            if path.endswith(".tmp") or self._expired(stat, now):
+                self._remove(path)
+                removed += 1
+            else:
+                kept.append((stat.st_atime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in kept)
+        kept.sort()
+
+        for _, size, path in kept:
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+            removed += 1
+
+        return removed
+
+    def purge(self):
+        """
+        Remove all stored responses.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def size(self):
+        """
+        Return count of stored responses and their total size in bytes.
+        """
+        count = 0
+        total_size = 0
+
+        for _, stat in self._files():
+            count += 1
+            total_size += stat.st_size
+
+        return count, total_size
+
+
+RESPONSE_CACHE = ResponseCache(
+    config.CACHE_DIR, config.CACHE_MAX_AGE_DAYS, config.CACHE_MAX_SIZE_MB
+)
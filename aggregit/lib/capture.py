@@ -0,0 +1,190 @@
+"""
+Capture library module.
+
+Usage:
+    from lib.capture import CAPTURE
+
+    if CAPTURE.replaying:
+        response = CAPTURE.replay("GET", "/repos/abc/def", None)
+
+Record the API responses of a report to a capture file, then serve them back
+to run the report again without the network, such as to debug or profile it
+on the same data or to run a benchmark in CI. Set the mode in the config:
+
+    - "record": Each request is sent as usual, and its response is written to
+      the capture file, which is replaced on the first request of a run.
+    - "replay": No requests are sent. Each response is read from the capture
+      file, at memory speed or optionally after the time the request took when
+      it was recorded.
+
+The capture is a gzipped file of JSON lines, one for each request, with the
+verb, path and body of the request, and the status, headers, text and time of
+the response. A request is matched by its verb, path and body, so the host and
+token do not matter. When the same request was recorded several times, the
+responses are served in the order they were recorded, and the last one again
+after that. A request which was not recorded raises an error, so the report
+must be replayed with the same config it was recorded with. Avoid a min date
+as a count of days, or a search without a max date, as these give requests
+which depend on the current time.
+
+Responses are recorded and replayed through the connection classes in
+`lib.connection`, so this covers every request made with `CONN`, including the
+GraphQL API, but not the async client of the PR report. A response is recorded
+after any retries for the rate limit, and after the response cache is applied.
+"""
+import atexit
+import gzip
+import json
+import threading
+import time
+
+from etc import config
+
+from .cache import CachedResponse
+
+
+def _text(body):
+    if isinstance(body, bytes):
+        return body.decode("utf-8", "replace")
+
+    return body
+
+
+class RequestCapture:
+    """
+    Recorder or player of API responses, which is shared by threads.
+
+    The capture file is opened on first use, so nothing is created unless a
+    mode is set.
+    """
+
+    def __init__(self, path, mode, emulate_latency=False):
+        """
+        :param path: Path to the gzipped capture file.
+        :param mode: "record" to write responses, "replay" to read them
+            instead of sending requests, or None to do neither.
+        :param emulate_latency: If True, wait for the recorded time of each
+            response when replaying it.
+        """
+        self.path = path
+        self.recording = mode == "record"
+        self.replaying = mode == "replay"
+        self.emulate_latency = emulate_latency
+
+        self.count = 0
+        self._file = None
+        self._responses = None
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(verb, url, body):
+        """
+        Return a key to match a request, from its verb, path and body.
+
+        >>> RequestCapture.key("GET", "/repos/abc/def?page=2", None)
+        'GET /repos/abc/def?page=2 '
+        """
+        return f"{verb} {url} {_text(body) or ''}"
+
+    def record(self, verb, url, body, response, seconds):
+        """
+        Write a response to the capture file.
+
+        :param verb: HTTP method, e.g. "GET".
+        :param url: Path of the request, including any query parameters.
+        :param body: Body of the request, or None.
+        :param response: Response object from a connection class.
+        :param seconds: Time the request took.
+        """
+        line = json.dumps(
+            {
+                "verb": verb,
+                "url": url,
+                "body": _text(body),
+                "status": response.status,
+                "headers": dict(response.getheaders()),
+                "text": response.text,
+                "seconds": round(seconds, 6),
+            }
+        )
+
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, "wt")
+                atexit.register(self.close)
+            self._file.write(f"{line}\n")
+            self.count += 1
+
+    def _load(self):
+        """
+        Read the recorded responses by key. A capture which was cut short,
+        such as by a report which was stopped, is read up to where it ends.
+        """
+        self._responses = {}
+
+        try:
+            with gzip.open(self.path, "rt") as f_in:
+                for line in f_in:
+                    entry = json.loads(line)
+                    key = self.key(entry["verb"], entry["url"], entry["body"])
+                    self._responses.setdefault(key, []).append(entry)
+        except FileNotFoundError:
+            raise ValueError(f"No capture file to replay: {self.path}")
+        except (EOFError, OSError, ValueError):
+            print(
+                f"Capture file ends early, so later requests are missing: {self.path}"
+            )
+
+    def replay(self, verb, url, body):
+        """
+        Return the recorded response for a request.
+
+        :raises LookupError: If the request was not recorded.
+
+        :return: CachedResponse instance.
+        """
+        key = self.key(verb, url, body)
+
+        with self._lock:
+            if self._responses is None:
+                self._load()
+
+            entries = self._responses.get(key)
+            if not entries:
+                raise LookupError(f"Request was not recorded: {verb} {url}")
+
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            entry = entries[min(position, len(entries) - 1)]
+            self.count += 1
+
+        if self.emulate_latency:
+            time.sleep(entry["seconds"])
+
+        return CachedResponse(entry["status"], entry["headers"], entry["text"])
+
+    def close(self):
+        """
+        Finish writing the capture file, if one is open.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def summary(self):
+        """
+        Return a line of text describing the responses recorded or replayed.
+        """
+        if not (self.recording or self.replaying):
+            return "Capture: off"
+
+        action = "recorded to" if self.recording else "replayed from"
+
+        return f"Capture: {self.count:,d} responses {action} {self.path}"
+
+
+CAPTURE = RequestCapture(
+    config.CAPTURE_PATH, config.CAPTURE_MODE, config.CAPTURE_LATENCY
+)
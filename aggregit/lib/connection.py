@@ -23,14 +23,300 @@ Note on paging and timeout.
     GitHub has a 10s limit imposed on
     queries, so a few but larger queries are more likely to timeout than more
     but smaller queries.
+
+    For listings of lightweight items where we expect to read many pages, such
+    as commits on a branch, use `get_paginated` to request the max page size.
+
+Note on connection classes.
+    PyGithub sends requests through a connection class, which can be replaced
+    for all requesters using `Requester.injectConnectionClasses`. This is the
+    hook used here to pace requests with the rate limit scheduler in
+    `lib.scheduler` and send each with a token from its pool, to serve GET
+    requests through the response cache in `lib.cache`, to record or replay
+    responses with `lib.capture` and to record each request with the profiler
+    in `lib.profiler`. An injected class is created
+    fresh for each request, so the underlying `requests` session is shared per
+    thread and host, to keep connections alive between requests.
 """
+import math
+import threading
+import time
+
 from etc import config
-from github import Github
+from github import Github, GithubException
+from github.PaginatedList import PaginatedList
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+)
+
+from .cache import RESPONSE_CACHE
+from .capture import CAPTURE
+from .fetch_plan import COMPLETIONS, explicit
+from .profiler import PROFILER
+from .scheduler import MAX_RATE_LIMIT_RETRIES, SCHEDULER
 
 RETRY_COUNT = 3
 PER_PAGE = 30
+MAX_PER_PAGE = 100
+# The API only lists up to this many commits of a PR.
+MAX_PR_COMMITS = 250
+
+# Times to resend a request for a commit which got a server error, and the
+# seconds to wait before the first retry, which doubles for each retry.
+SERVER_ERROR_RETRIES = 3
+SERVER_ERROR_BACKOFF_SECONDS = 1
 
 # TODO: Consider configuring the per_page argument from the default and see how
 # it affects paging and rate limits.
 
-CONN = Github(config.ACCESS_TOKEN, per_page=PER_PAGE, retry=RETRY_COUNT)
+_SESSIONS = threading.local()
+
+
+class ConnectionMixin:
+    """
+    Add a shared session, the rate limit scheduler, the response cache, the
+    request capture and the profiler to a PyGithub connection class.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        sessions = _SESSIONS.__dict__.setdefault("sessions", {})
+        key = (self.protocol, self.host, self.port)
+        if key in sessions:
+            self.session = sessions[key]
+        else:
+            sessions[key] = self.session
+
+    def getresponse(self):
+        """
+        Send the request when the scheduler allows and return the response.
+
+        The request is sent with the token which the scheduler picks from the
+        configured tokens. If the response is a rate limit error, wait and
+        send it again, with another token if one can be used.
+
+        When replaying a capture, the recorded response is returned instead,
+        without the scheduler.
+
+        A request for a single object which was not asked for is counted or
+        refused first, as set in `lib.fetch_plan`.
+        """
+        COMPLETIONS.check(self.verb, self.url)
+
+        if CAPTURE.replaying:
+            return self._replay()
+
+        for _ in range(MAX_RATE_LIMIT_RETRIES):
+            token = SCHEDULER.acquire(self.url)
+            if token and "Authorization" in self.headers:
+                self.headers = {**self.headers, "Authorization": f"token {token}"}
+            self.cache_status = None
+            start = time.perf_counter()
+            response = self._send()
+            end = time.perf_counter()
+
+            headers = {k.lower(): v for k, v in response.getheaders()}
+            PROFILER.record_request(
+                self.verb,
+                self.url,
+                response.status,
+                start,
+                end,
+                len(response.text),
+                self.cache_status,
+                headers,
+            )
+            wait = SCHEDULER.update(
+                token, self.url, response.status, headers, response.text
+            )
+            if wait is None:
+                break
+            SCHEDULER.wait_to_retry(wait)
+
+        if CAPTURE.recording:
+            CAPTURE.record(self.verb, self.url, self.input, response, end - start)
+
+        return response
+
+    def _replay(self):
+        """
+        Return the recorded response for the request, and profile it as if it
+        was sent.
+        """
+        start = time.perf_counter()
+        response = CAPTURE.replay(self.verb, self.url, self.input)
+        end = time.perf_counter()
+
+        headers = {k.lower(): v for k, v in response.getheaders()}
+        PROFILER.record_request(
+            self.verb,
+            self.url,
+            response.status,
+            start,
+            end,
+            len(response.text),
+            None,
+            headers,
+        )
+
+        return response
+
+    def _send(self):
+        """
+        Send the request and return the response, using the cache for GET
+        requests if it is enabled.
+        """
+        if not config.CACHE_ENABLED or self.verb != "GET":
+            return super().getresponse()
+
+        key = RESPONSE_CACHE.key(self.host, self.url, self.headers.get("Accept"))
+        entry = RESPONSE_CACHE.get(key)
+
+        if entry:
+            self.headers = {
+                **self.headers,
+                **RESPONSE_CACHE.conditional_headers(entry),
+            }
+
+        response = super().getresponse()
+
+        if response.status == 304 and entry:
+            self.cache_status = "hit"
+            return RESPONSE_CACHE.revalidated(key, entry, response)
+
+        self.cache_status = "miss"
+        RESPONSE_CACHE.count(hit=False)
+        if response.status == 200:
+            RESPONSE_CACHE.store(key, self.url, response)
+
+        return response
+
+
+class HTTPConnection(ConnectionMixin, HTTPRequestsConnectionClass):
+    pass
+
+
+class HTTPSConnection(ConnectionMixin, HTTPSRequestsConnectionClass):
+    pass
+
+
+def get_paginated(
+    content_class, parent, path, params=None, per_page=MAX_PER_PAGE, list_item="items"
+):
+    """
+    Return a paginated list for an endpoint under a PyGithub object.
+
+    PyGithub uses the page size set on CONN for all listings, so this is used
+    to override it for one listing. Note that PyGithub will still use the
+    CONN value if that is not the default of 30.
+
+    :param content_class: PyGithub class of the items in the list,
+        e.g. `github.Commit.Commit`.
+    :param parent: PyGithub object which the endpoint belongs to, e.g. a repo.
+    :param path: Path of the endpoint relative to the parent's URL,
+        e.g. "/commits".
+    :param params: Optional dict of query parameters.
+    :param per_page: Number of items to request on each page.
+    :param list_item: Key of the items, for an endpoint which responds with
+        an object rather than a list, e.g. "commits" for a comparison.
+
+    :return: PyGithub PaginatedList instance. No requests are made until it
+        is iterated over.
+    """
+    params = dict(params or {}, per_page=per_page)
+
+    return PaginatedList(
+        content_class,
+        parent._requester,
+        f"{parent.url}{path}",
+        params,
+        list_item=list_item,
+    )
+
+
+def get_commit_stats(commit):
+    """
+    Fetch the count of changed files and the added and deleted lines of a
+    commit.
+
+    The JSON of the commit is read directly, rather than completing the
+    PyGithub object, so that each file and its patch is not parsed into an
+    object which is kept with the commit. GitHub can send a server error for
+    a commit with a large diff which takes too long, so these requests are
+    sent again after a backoff.
+
+    :param commit: PyGithub commit object, such as from a listing.
+
+    :raises github.GithubException: If the request still fails after the
+        retries, or fails with a client error.
+
+    :return: Tuple of the count of changed files, added lines and deleted
+        lines.
+    """
+    for attempt in range(SERVER_ERROR_RETRIES + 1):
+        try:
+            with explicit():
+                _, data = commit._requester.requestJsonAndCheck("GET", commit.url)
+        except GithubException as e:
+            if e.status < 500 or attempt == SERVER_ERROR_RETRIES:
+                raise
+            time.sleep(SERVER_ERROR_BACKOFF_SECONDS * 2**attempt)
+        else:
+            break
+
+    stats = data["stats"]
+
+    return len(data["files"]), stats["additions"], stats["deletions"]
+
+
+def get_pr_commit_range(pr, commit_count):
+    """
+    Fetch the oldest and latest commits of a PR, with as few requests as
+    possible.
+
+    The PR's commits are listed oldest first, so both are on the first page
+    for a PR with up to a page of commits. Otherwise, the latest commit is on
+    the last page, which is found from the count of commits rather than by
+    requesting the first page again for its links, as PyGithub does for a
+    reversed list. Only the first commits of a PR up to `MAX_PR_COMMITS` are
+    listed, so the latest listed commit is used for a larger PR.
+
+    The JSON is read directly, rather than creating PyGithub commit objects.
+
+    :param pr: PyGithub PR object.
+    :param commit_count: Count of commits of the PR, from the full PR.
+
+    :return: Tuple of the JSON of the oldest and latest commits.
+    """
+
+    def get_page(page):
+        _, data = pr._requester.requestJsonAndCheck(
+            "GET",
+            f"{pr.url}/commits",
+            parameters={"per_page": MAX_PER_PAGE, "page": page},
+        )
+
+        return data
+
+    first_page = get_page(1)
+    last_page_number = math.ceil(min(commit_count, MAX_PR_COMMITS) / MAX_PER_PAGE)
+    last_page = get_page(last_page_number) if last_page_number > 1 else first_page
+
+    return first_page[0], last_page[-1]
+
+
+Requester.injectConnectionClasses(HTTPConnection, HTTPSConnection)
+
+if config.CACHE_ENABLED:
+    RESPONSE_CACHE.prune()
+
+# The token is replaced on each request with one from the scheduler's pool.
+CONN = Github(
+    config.ACCESS_TOKENS[0],
+    base_url=config.BASE_URL,
+    per_page=PER_PAGE,
+    retry=RETRY_COUNT,
+)
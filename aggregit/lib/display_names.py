@@ -0,0 +1,303 @@
+"""
+Display names library module.
+
+Usage:
+    from lib.display_names import DISPLAY_NAMES
+
+    DISPLAY_NAMES.prefetch_orgs(["my-org"])
+    name = DISPLAY_NAMES.name(user)
+    DISPLAY_NAMES.save()
+
+Keep the display name of each GitHub user by login, for the whole process.
+
+A user object in a listing, such as the author of a PR, only has the login.
+Reading its name completes the object with a request for the user's profile,
+so without this cache the same profile is requested again for every row which
+shows that user. Now each login is requested at most once, and names which are
+already known, such as from a completed user or a GraphQL response, are used
+without a request.
+
+Names are stored in a JSON file in the `var` directory between runs and are
+fetched again once they are older than the configured TTL. The names of all
+members of an org can be fetched up front with a few GraphQL requests of 100
+members each.
+"""
+
+import json
+import os
+import threading
+import time
+
+from etc import config
+
+from . import fetch_plan, graphql
+from .connection import CONN
+from .profiler import PROFILER
+
+SECONDS_PER_DAY = 24 * 60 * 60
+MEMBERS_PAGE_SIZE = 100
+
+ORG_MEMBERS_QUERY = """
+query($login: String!, $cursor: String, $pageSize: Int!) {
+    organization(login: $login) {
+        membersWithRole(first: $pageSize, after: $cursor) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            nodes {
+                login
+                name
+            }
+        }
+    }
+}
+"""
+
+
+def _loaded_name(user):
+    """
+    Return a tuple of whether the user's name is loaded and the name.
+
+    The name of a PyGithub user is only read if it is in the data the object
+    was created with, since otherwise reading it would make a request.
+    """
+    raw_data = getattr(user, "_rawData", None)
+
+    if raw_data is None:
+        # Not a PyGithub object, such as an Actor, so the name is known.
+        return True, user.name
+
+    if "name" in raw_data:
+        return True, raw_data["name"]
+
+    return False, None
+
+
+class DisplayNameCache:
+    """
+    Thread-safe map of user login to display name, with optional storage on
+    disk.
+
+    A name can be None, for a user who has not set one.
+    """
+
+    def __init__(self, path, ttl_days):
+        """
+        :param path: Path to a JSON file to load and save names. If None,
+            names are only kept in memory.
+        :param ttl_days: Fetch a stored name again after this many days.
+        """
+        self.path = path
+        self.ttl = ttl_days * SECONDS_PER_DAY
+
+        self.fetched = 0
+        self._names = {}
+        self._orgs = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        if path:
+            self._load()
+
+    def _read(self, path):
+        """
+        Return the names and orgs in a file which are within the TTL, as
+        dicts like `_names` and `_orgs`.
+        """
+        try:
+            with open(path) as f_in:
+                data = json.load(f_in)
+        except FileNotFoundError:
+            return {}, {}
+        except ValueError:
+            print(f"Ignoring invalid display names file: {path}")
+            return {}, {}
+
+        now = time.time()
+        names = {
+            login: (name, stored_at)
+            for login, (name, stored_at) in data.get("users", {}).items()
+            if now - stored_at <= self.ttl
+        }
+        orgs = {
+            org: stored_at
+            for org, stored_at in data.get("orgs", {}).items()
+            if now - stored_at <= self.ttl
+        }
+
+        return names, orgs
+
+    def _load(self):
+        self._names, self._orgs = self._read(self.path)
+
+    def merge(self, path):
+        """
+        Add the names and orgs in another file, such as one written by a
+        worker of the sharded report runner. The most recently stored value
+        of each is kept.
+        """
+        names, orgs = self._read(path)
+
+        with self._lock:
+            for login, value in names.items():
+                if login not in self._names or self._names[login][1] < value[1]:
+                    self._names[login] = value
+            for org, stored_at in orgs.items():
+                self._orgs[org] = max(stored_at, self._orgs.get(org, 0))
+
+    def save(self, path=None):
+        """
+        Write names to the file, if there is one.
+
+        :param path: Path to write to instead of the file the names were
+            loaded from, such as to give a copy to each worker of the sharded
+            report runner.
+        """
+        path = path or self.path
+        if not path:
+            return
+
+        with self._lock:
+            data = {
+                "users": {login: list(value) for login, value in self._names.items()},
+                "orgs": dict(self._orgs),
+            }
+
+        # Write to a temp file first so a reader never sees a partial file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f_out:
+            json.dump(data, f_out)
+        os.replace(tmp_path, path)
+
+    def add(self, login, name):
+        """
+        Set the name for a login.
+        """
+        with self._lock:
+            self._names[login] = (name, time.time())
+
+    def items(self):
+        """
+        Return a list of tuples of the login and name of each known user.
+        """
+        with self._lock:
+            return [(login, name) for login, (name, _) in self._names.items()]
+
+    def name(self, user):
+        """
+        Return the display name of a user.
+
+        :param user: PyGithub user object, Actor, or anything else with a login
+            and name attribute. Or, the login of a user as a string.
+
+        :return: Name of the user, or None if they have not set one.
+        """
+        login = user if isinstance(user, str) else user.login
+
+        with self._lock:
+            if login in self._names:
+                return self._names[login][0]
+
+        is_loaded, name = (False, None) if login is user else _loaded_name(user)
+        if is_loaded:
+            self.add(login, name)
+
+            return name
+
+        return self._fetch(user)
+
+    def _fetch(self, user):
+        """
+        Request the name of a user, once only if several threads need it.
+        """
+        login = user if isinstance(user, str) else user.login
+
+        with self._lock:
+            if login in self._names:
+                return self._names[login][0]
+
+            event = self._pending.get(login)
+            is_fetcher = event is None
+            if is_fetcher:
+                event = self._pending[login] = threading.Event()
+
+        if not is_fetcher:
+            event.wait()
+
+            return self.name(user)
+
+        try:
+            with PROFILER.span("get_user"):
+                if login is user:
+                    with fetch_plan.explicit():
+                        user = CONN.get_user(login)
+                else:
+                    fetch_plan.complete(user)
+                name = user.name
+            self.add(login, name)
+            with self._lock:
+                self.fetched += 1
+        finally:
+            with self._lock:
+                del self._pending[login]
+            event.set()
+
+        return name
+
+    def prefetch_org(self, org):
+        """
+        Fetch names for all members of an org, unless done within the TTL.
+
+        The REST API's list of org members does not include names, so the
+        GraphQL API is used.
+
+        :param org: Login of the org.
+        """
+        with self._lock:
+            if org in self._orgs:
+                return
+
+        print(f"Fetching display names for members of org: {org}")
+        requester = CONN.get_organization(org)._requester
+        variables = {"login": org, "cursor": None, "pageSize": MEMBERS_PAGE_SIZE}
+        count = 0
+
+        while True:
+            data = graphql.query(requester, ORG_MEMBERS_QUERY, variables)
+            members = data["organization"]["membersWithRole"]
+
+            for node in members["nodes"]:
+                self.add(node["login"], node["name"])
+                count += 1
+
+            if not members["pageInfo"]["hasNextPage"]:
+                break
+            variables["cursor"] = members["pageInfo"]["endCursor"]
+
+        print(f"Members: {count}")
+        print()
+
+        with self._lock:
+            self._orgs[org] = time.time()
+
+    def prefetch_orgs(self, orgs):
+        """
+        Fetch names for all members of each of several orgs.
+        """
+        for org in orgs:
+            self.prefetch_org(org)
+
+    def summary(self):
+        """
+        Return a line of text describing the names known and requested.
+        """
+        return (
+            f"Display names: {len(self._names):,d} known - {self.fetched:,d} requested"
+        )
+
+
+DISPLAY_NAMES = DisplayNameCache(
+    config.NAME_CACHE_PATH if config.NAME_CACHE_ENABLED else None,
+    config.NAME_CACHE_TTL_DAYS,
+)
@@ -0,0 +1,712 @@
+"""
+Entity store library module.
+
+Usage:
+    from lib.entity_store import ENTITY_STORE
+
+    if ENTITY_STORE.writing:
+        ENTITY_STORE.save_pr(repo.id, pr_data.to_store())
+    if ENTITY_STORE.reading:
+        for record in ENTITY_STORE.pull_requests(repo.id, usernames=["abc"]):
+            print(record["number"])
+
+Keep the users, repos, branches, PRs, reviews and commits which the reports
+fetch in a local SQLite database, which is shared by the reports and kept
+between runs. Set the mode in the config:
+
+    - "write": Reports save each entity as they fetch it. An entity which was
+      stored before is updated in place. A part which was not fetched, such as
+      the reviews of a PR when no review columns are configured, keeps its
+      stored value.
+    - "read": Reports get their repos and items with SQL queries over the
+      store instead of the API, so they send no requests. The data is as of
+      the last report which wrote it.
+
+Repos are keyed by their GitHub ID, commits by their SHA, users by their login
+and PRs by their repo and number. The commit report also records the branch
+each commit was found on, in the order they were found. Tables are indexed by
+repo, author and date, to match the filters of the reports.
+
+The database uses write-ahead logging, so the worker processes of the sharded
+report runner can write to it at the same time as others read it. Each save is
+a transaction of its own, and the connection is shared by threads with a lock.
+"""
+import datetime
+import json
+import sqlite3
+import threading
+
+from etc import config
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# Seconds to wait for another process to finish writing.
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    login TEXT PRIMARY KEY,
+    name TEXT
+);
+-- The ID is not the rowid, so that the rowid keeps the order repos were listed.
+CREATE TABLE IF NOT EXISTS repos (
+    id INTEGER NOT NULL UNIQUE,
+    full_name TEXT NOT NULL,
+    owner_login TEXT NOT NULL,
+    raw_data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repos_owner ON repos (owner_login);
+CREATE INDEX IF NOT EXISTS repos_full_name ON repos (full_name);
+CREATE TABLE IF NOT EXISTS branches (
+    repo_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    PRIMARY KEY (repo_id, name)
+);
+CREATE TABLE IF NOT EXISTS pull_requests (
+    repo_id INTEGER NOT NULL,
+    number INTEGER NOT NULL,
+    title TEXT,
+    from_branch_name TEXT,
+    to_branch_name TEXT,
+    author_login TEXT,
+    url TEXT,
+    merged INTEGER NOT NULL,
+    merged_at TEXT,
+    closed INTEGER NOT NULL,
+    closed_at TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    assignees TEXT NOT NULL,
+    jira_ticket TEXT,
+    has_details INTEGER,
+    merged_by_login TEXT,
+    commit_count INTEGER,
+    comment_count INTEGER,
+    changed_files INTEGER,
+    additions INTEGER,
+    deletions INTEGER,
+    oldest_commit_sha TEXT,
+    latest_commit_sha TEXT,
+    has_reviews INTEGER,
+    PRIMARY KEY (repo_id, number)
+);
+CREATE INDEX IF NOT EXISTS pull_requests_updated
+    ON pull_requests (repo_id, updated_at);
+CREATE INDEX IF NOT EXISTS pull_requests_author ON pull_requests (author_login);
+CREATE TABLE IF NOT EXISTS reviews (
+    repo_id INTEGER NOT NULL,
+    number INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    submitted_at TEXT NOT NULL,
+    reviewer_login TEXT,
+    PRIMARY KEY (repo_id, number, position)
+);
+CREATE INDEX IF NOT EXISTS reviews_reviewer ON reviews (reviewer_login);
+CREATE TABLE IF NOT EXISTS commits (
+    sha TEXT PRIMARY KEY,
+    repo_id INTEGER NOT NULL,
+    author_login TEXT,
+    committer_login TEXT,
+    committed_at TEXT NOT NULL,
+    message TEXT,
+    url TEXT,
+    changed_files INTEGER,
+    additions INTEGER,
+    deletions INTEGER
+);
+CREATE INDEX IF NOT EXISTS commits_repo ON commits (repo_id, committed_at);
+CREATE INDEX IF NOT EXISTS commits_author ON commits (author_login);
+CREATE TABLE IF NOT EXISTS branch_commits (
+    repo_id INTEGER NOT NULL,
+    sha TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    PRIMARY KEY (repo_id, sha)
+);
+"""
+
+PR_COLUMNS = (
+    "repo_id",
+    "number",
+    "title",
+    "from_branch_name",
+    "to_branch_name",
+    "author_login",
+    "url",
+    "merged",
+    "merged_at",
+    "closed",
+    "closed_at",
+    "created_at",
+    "updated_at",
+    "assignees",
+    "jira_ticket",
+    "has_details",
+    "merged_by_login",
+    "commit_count",
+    "comment_count",
+    "changed_files",
+    "additions",
+    "deletions",
+    "oldest_commit_sha",
+    "latest_commit_sha",
+    "has_reviews",
+)
+# Columns of a PR from its parts which need extra requests, which keep their
+# stored values when a part was not fetched.
+PR_PART_COLUMNS = PR_COLUMNS[PR_COLUMNS.index("has_details") :]
+COMMIT_COLUMNS = (
+    "sha",
+    "repo_id",
+    "author_login",
+    "committer_login",
+    "committed_at",
+    "message",
+    "url",
+    "changed_files",
+    "additions",
+    "deletions",
+)
+# Columns of a commit which are only known from the commit report, which keep
+# their stored values when the commit is saved from a PR.
+COMMIT_PART_COLUMNS = (
+    "committer_login",
+    "message",
+    "url",
+    "changed_files",
+    "additions",
+    "deletions",
+)
+
+USER_UPSERT = (
+    "INSERT INTO users (login, name) VALUES (?, ?)"
+    " ON CONFLICT (login) DO UPDATE SET name = excluded.name"
+)
+
+
+def upsert_sql(table, columns, key, keep=()):
+    """
+    Return SQL to insert a row, or update the row with the same key.
+
+    :param table: Name of the table.
+    :param columns: Names of the columns to set.
+    :param key: Names of the columns of the primary key.
+    :param keep: Names of columns which keep their stored value if the new
+        value is NULL.
+
+    >>> print(upsert_sql("t", ("k", "v"), ("k",)))
+    INSERT INTO t (k, v) VALUES (?, ?) ON CONFLICT (k) DO UPDATE SET v = excluded.v
+    >>> print(upsert_sql("t", ("k", "v"), ("k",), ("v",)))
+    INSERT INTO t (k, v) VALUES (?, ?) ON CONFLICT (k) DO UPDATE SET v = COALESCE(excluded.v, v)
+    """
+    updates = ", ".join(
+        (
+            f"{column} = COALESCE(excluded.{column}, {column})"
+            if column in keep
+            else f"{column} = excluded.{column}"
+        )
+        for column in columns
+        if column not in key
+    )
+
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)})"
+        f" VALUES ({', '.join('?' * len(columns))})"
+        f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+    )
+
+
+def _format(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime(DATE_FORMAT)
+
+    return value
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, DATE_FORMAT).date() if value else None
+
+
+def _parse_datetime(value):
+    return datetime.datetime.strptime(value, DATETIME_FORMAT) if value else None
+
+
+def _login(actor):
+    return actor[0] if actor else None
+
+
+def _actors(record):
+    """
+    Return the users of a PR or commit record, as tuples of login and name.
+    """
+    actors = [record.get("author")]
+
+    details = record.get("details")
+    if details:
+        actors.append(details["merged_by"])
+    for commit in (record.get("oldest_commit"), record.get("latest_commit")):
+        if commit:
+            actors.append(commit["author"])
+    for review in record.get("reviews") or []:
+        actors.append(review["reviewer"])
+
+    return [tuple(actor) for actor in actors if actor]
+
+
+class EntityStore:
+    """
+    SQLite store of the entities which reports fetch.
+
+    The database is opened on first use, so nothing is created unless the
+    store is enabled.
+    """
+
+    def __init__(self, path, mode):
+        """
+        :param path: Path to the SQLite database.
+        :param mode: "write" to save entities, "read" to read them instead of
+            using the API, or None to not use the store.
+        """
+        self.path = path
+        self.writing = mode == "write"
+        self.reading = mode == "read"
+
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                self.path,
+                timeout=BUSY_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript(SCHEMA)
+
+        return self._conn
+
+    def _write(self, statements):
+        """
+        Run statements in one transaction.
+
+        :param statements: Iterable of tuples of SQL and a list of rows of
+            parameters, to run with `executemany`.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    conn.executemany(sql, rows)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _names(self):
+        return dict(self._query("SELECT login, name FROM users"))
+
+    def save_users(self, users):
+        """
+        Add or update users.
+
+        :param users: Iterable of tuples of login and display name.
+        """
+        self._write([(USER_UPSERT, list(users))])
+
+    def users(self):
+        """
+        Return a list of tuples of the login and display name of each user.
+        """
+        return self._query("SELECT login, name FROM users")
+
+    def save_repo(self, raw_data):
+        """
+        Add or update a repo, from the JSON of the repo.
+        """
+        row = (
+            raw_data["id"],
+            raw_data["full_name"],
+            raw_data["owner"]["login"],
+            json.dumps(raw_data),
+        )
+        columns = ("id", "full_name", "owner_login", "raw_data")
+
+        self._write([(upsert_sql("repos", columns, ("id",)), [row])])
+
+    def repos(self, owner=None, full_names=None):
+        """
+        Get the JSON of stored repos.
+
+        :param owner: Login of the owner of the repos, or None.
+        :param full_names: Full names of the repos, or None. The repos are in
+            this order, and a name which is not stored is skipped.
+
+        :return: List of dicts. The repos of an owner are in the order they
+            were first stored.
+        """
+        if full_names is not None:
+            rows = [
+                row
+                for full_name in full_names
+                for row in self._query(
+                    "SELECT raw_data FROM repos WHERE full_name = ? COLLATE NOCASE",
+                    (full_name,),
+                )
+            ]
+        else:
+            rows = self._query(
+                "SELECT raw_data FROM repos WHERE owner_login = ? COLLATE NOCASE"
+                " ORDER BY rowid",
+                (owner,),
+            )
+
+        return [json.loads(raw_data) for (raw_data,) in rows]
+
+    def save_branches(self, repo_id, branches):
+        """
+        Set the branches of a repo, replacing those which were stored.
+
+        :param repo_id: GitHub ID of the repo.
+        :param branches: Iterable of tuples of branch name and HEAD SHA.
+        """
+        self._write(
+            [
+                ("DELETE FROM branches WHERE repo_id = ?", [(repo_id,)]),
+                (
+                    "INSERT INTO branches (repo_id, name, sha) VALUES (?, ?, ?)",
+                    [(repo_id, name, sha) for name, sha in branches],
+                ),
+            ]
+        )
+
+    def save_pr(self, repo_id, record):
+        """
+        Add or update a PR, with its users, its oldest and latest commits and
+        its reviews.
+
+        :param repo_id: GitHub ID of the repo.
+        :param record: dict of the PR's values, as returned by
+            `PullRequest.to_store`. Users are tuples of login and name. The
+            details, commits and reviews are None if they were not fetched.
+        """
+        number = record["number"]
+        details = record["details"] or {}
+        oldest, latest = record["oldest_commit"], record["latest_commit"]
+        reviews = record["reviews"]
+
+        pr_row = (
+            repo_id,
+            number,
+            record["title"],
+            record["from_branch_name"],
+            record["to_branch_name"],
+            _login(record["author"]),
+            record["url"],
+            record["merged"],
+            _format(record["merged_at"]),
+            record["closed"],
+            _format(record["closed_at"]),
+            _format(record["created_at"]),
+            _format(record["updated_at"]),
+            json.dumps(record["assignees"]),
+            record["jira_ticket"],
+            1 if details else None,
+            _login(details.get("merged_by")),
+            details.get("commit_count"),
+            details.get("comment_count"),
+            details.get("changed_files"),
+            details.get("additions"),
+            details.get("deletions"),
+            oldest["sha"] if oldest else None,
+            latest["sha"] if latest else None,
+            1 if reviews is not None else None,
+        )
+        # The other columns of a commit are only known from the commit report.
+        commit_rows = [
+            (
+                commit["sha"],
+                repo_id,
+                _login(commit["author"]),
+                None,
+                _format(commit["datetime"]),
+                None,
+                None,
+                None,
+                None,
+                None,
+            )
+            for commit in (oldest, latest)
+            if commit
+        ]
+
+        statements = [
+            (
+                upsert_sql(
+                    "pull_requests", PR_COLUMNS, ("repo_id", "number"), PR_PART_COLUMNS
+                ),
+                [pr_row],
+            ),
+            (
+                upsert_sql("commits", COMMIT_COLUMNS, ("sha",), COMMIT_PART_COLUMNS),
+                commit_rows,
+            ),
+            (USER_UPSERT, _actors(record)),
+        ]
+        if reviews is not None:
+            statements += [
+                (
+                    "DELETE FROM reviews WHERE repo_id = ? AND number = ?",
+                    [(repo_id, number)],
+                ),
+                (
+                    "INSERT INTO reviews (repo_id, number, position, state,"
+                    " submitted_at, reviewer_login) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            repo_id,
+                            number,
+                            position,
+                            review["state"],
+                            _format(review["submitted_at"]),
+                            _login(review["reviewer"]),
+                        )
+                        for position, review in enumerate(reviews)
+                    ],
+                ),
+            ]
+
+        self._write(statements)
+
+    def pull_requests(
+        self, repo_id, usernames=None, state="all", min_date=None, max_date=None
+    ):
+        """
+        Get the stored PRs of a repo which match the filters of the PR report.
+
+        :param repo_id: GitHub ID of the repo.
+        :param usernames: Logins of the authors to include, or None for all.
+        :param state: PR state to include, e.g. "open" or "all".
+        :param min_date: Exclude PRs last updated before this date, or None.
+        :param max_date: Exclude PRs last updated after this date, or None.
+
+        :return: List of records like those of `save_pr`, by number
+            descending.
+        """
+        query = (
+            f"SELECT {', '.join(f'p.{column}' for column in PR_COLUMNS)},"
+            " o.author_login, o.committed_at, l.author_login, l.committed_at"
+            " FROM pull_requests p"
+            " LEFT JOIN commits o ON o.sha = p.oldest_commit_sha"
+            " LEFT JOIN commits l ON l.sha = p.latest_commit_sha"
+            " WHERE p.repo_id = ?"
+        )
+        params = [repo_id]
+        if usernames:
+            query += f" AND p.author_login IN ({', '.join('?' * len(usernames))})"
+            params.extend(usernames)
+        query += {
+            "open": " AND NOT p.closed",
+            "closed": " AND p.closed",
+            "merged": " AND p.merged",
+        }.get(state, "")
+        if min_date:
+            query += " AND p.updated_at >= ?"
+            params.append(min_date.strftime(DATE_FORMAT))
+        if max_date:
+            query += " AND p.updated_at <= ?"
+            params.append(max_date.strftime(DATE_FORMAT))
+        query += " ORDER BY p.number DESC"
+
+        names = self._names()
+
+        def actor(login):
+            return (login, names.get(login)) if login else None
+
+        reviews = {}
+        for number, state, submitted_at, reviewer_login in self._query(
+            "SELECT number, state, submitted_at, reviewer_login FROM reviews"
+            " WHERE repo_id = ? ORDER BY number, position",
+            (repo_id,),
+        ):
+            reviews.setdefault(number, []).append(
+                {
+                    "state": state,
+                    "submitted_at": _parse_date(submitted_at),
+                    "reviewer": actor(reviewer_login),
+                }
+            )
+
+        records = []
+        for row in self._query(query, params):
+            values = dict(zip(PR_COLUMNS, row))
+            oldest_author, oldest_at, latest_author, latest_at = row[len(PR_COLUMNS) :]
+            number = values["number"]
+
+            records.append(
+                {
+                    "number": number,
+                    "title": values["title"],
+                    "from_branch_name": values["from_branch_name"],
+                    "to_branch_name": values["to_branch_name"],
+                    "author": actor(values["author_login"]),
+                    "url": values["url"],
+                    "merged": bool(values["merged"]),
+                    "merged_at": _parse_date(values["merged_at"]),
+                    "closed": bool(values["closed"]),
+                    "closed_at": _parse_date(values["closed_at"]),
+                    "created_at": _parse_date(values["created_at"]),
+                    "updated_at": _parse_date(values["updated_at"]),
+                    "assignees": json.loads(values["assignees"]),
+                    "jira_ticket": values["jira_ticket"],
+                    "details": (
+                        {
+                            "merged_by": actor(values["merged_by_login"]),
+                            "commit_count": values["commit_count"],
+                            "comment_count": values["comment_count"],
+                            "changed_files": values["changed_files"],
+                            "additions": values["additions"],
+                            "deletions": values["deletions"],
+                        }
+                        if values["has_details"]
+                        else None
+                    ),
+                    "oldest_commit": (
+                        {
+                            "sha": values["oldest_commit_sha"],
+                            "author": actor(oldest_author),
+                            "datetime": _parse_datetime(oldest_at),
+                        }
+                        if oldest_at
+                        else None
+                    ),
+                    "latest_commit": (
+                        {
+                            "sha": values["latest_commit_sha"],
+                            "author": actor(latest_author),
+                            "datetime": _parse_datetime(latest_at),
+                        }
+                        if latest_at
+                        else None
+                    ),
+                    "reviews": (
+                        reviews.get(number, []) if values["has_reviews"] else None
+                    ),
+                }
+            )
+
+        return records
+
+    def save_commit(self, repo_id, branch, record):
+        """
+        Add or update a commit which the commit report found on a branch.
+
+        :param repo_id: GitHub ID of the repo.
+        :param branch: Name of the branch the commit was found on. A commit
+            keeps the branch it was first found on.
+        :param record: dict of the commit's values, as returned by
+            `Commit.to_store`. The stats are None if they were not fetched.
+        """
+        commit_row = (
+            record["sha"],
+            repo_id,
+            _login(record["author"]),
+            record["committer_login"],
+            _format(record["datetime"]),
+            record["message"],
+            record["url"],
+            record["changed_files"],
+            record["additions"],
+            record["deletions"],
+        )
+
+        self._write(
+            [
+                (
+                    upsert_sql(
+                        "commits", COMMIT_COLUMNS, ("sha",), COMMIT_PART_COLUMNS
+                    ),
+                    [commit_row],
+                ),
+                (
+                    "INSERT OR IGNORE INTO branch_commits (repo_id, sha, branch)"
+                    " VALUES (?, ?, ?)",
+                    [(repo_id, record["sha"], branch)],
+                ),
+                (USER_UPSERT, _actors(record)),
+            ]
+        )
+
+    def commits(self, repo_id, usernames=None, min_date=None):
+        """
+        Get the commits which the commit report found in a repo, which match
+        its filters.
+
+        :param repo_id: GitHub ID of the repo.
+        :param usernames: Logins of the authors to include, or None for all.
+        :param min_date: Exclude commits before this datetime, or None.
+
+        :return: List of tuples of the branch name and a record like those of
+            `save_commit`, in the order they were found.
+        """
+        query = (
+            f"SELECT b.branch, {', '.join(f'c.{column}' for column in COMMIT_COLUMNS)}"
+            " FROM branch_commits b JOIN commits c ON c.sha = b.sha"
+            " WHERE b.repo_id = ?"
+        )
+        params = [repo_id]
+        if usernames:
+            query += f" AND c.author_login IN ({', '.join('?' * len(usernames))})"
+            params.extend(usernames)
+        if min_date:
+            query += " AND c.committed_at >= ?"
+            params.append(min_date.strftime(DATETIME_FORMAT))
+        query += " ORDER BY b.rowid"
+
+        names = self._names()
+        records = []
+        for branch, *row in self._query(query, params):
+            values = dict(zip(COMMIT_COLUMNS, row))
+            author_login = values["author_login"]
+
+            records.append(
+                (
+                    branch,
+                    {
+                        "sha": values["sha"],
+                        "url": values["url"],
+                        "author": (
+                            (author_login, names.get(author_login))
+                            if author_login
+                            else None
+                        ),
+                        "committer_login": values["committer_login"],
+                        "datetime": _parse_datetime(values["committed_at"]),
+                        "message": values["message"],
+                        "changed_files": values["changed_files"],
+                        "additions": values["additions"],
+                        "deletions": values["deletions"],
+                    },
+                )
+            )
+
+        return records
+
+
+ENTITY_STORE = EntityStore(config.ENTITY_STORE_PATH, config.ENTITY_STORE_MODE)
@@ -0,0 +1,205 @@
+"""
+Fetch plan library module.
+
+Usage:
+    from lib import fetch_plan
+
+    columns = fetch_plan.select_columns(HEADER, config.PR_COLUMNS)
+    parts = fetch_plan.parts_needed(columns, COLUMN_PARTS)
+    if "details" in parts:
+        fetch_plan.complete(pr)
+
+    print(fetch_plan.COMPLETIONS.summary())
+
+Plan which requests a report needs from the columns it writes, and watch for
+requests which PyGithub sends without being asked.
+
+A PyGithub object from a listing, such as a PR from the PRs of a repo, only
+has some of its fields. Reading any other field sends a request for the full
+object. This is easy to miss, as it looks like reading an attribute. A report
+defines which parts of an item, such as the details, commits or reviews of a
+PR, each of its columns need. Then only the parts for the configured columns
+are fetched, and other columns are read from the listing which is already in
+hand. When a part is needed, the full object is fetched with `complete`, so
+the request is explicit.
+
+Any other request for a single PR, commit or user is implicit. Requests are
+checked by their URL in `lib.connection`, as they are sent, and a request made
+within `explicit` is not checked. Implicit requests are counted by the kind of
+object, for the summary at the end of a report, or refused with an error if
+configured, to find the code which caused them.
+"""
+import collections
+import contextlib
+import re
+import threading
+
+from etc import config
+
+# Paths of the single objects which a listing gives without all their fields,
+# by the kind of object.
+OBJECT_PATTERNS = {
+    "PullRequest": re.compile(r"/repos/[^/]+/[^/]+/pulls/\d+$"),
+    "Commit": re.compile(r"/repos/[^/]+/[^/]+/commits/[0-9a-f]{40}$"),
+    "NamedUser": re.compile(r"/users/[^/]+$"),
+}
+
+_EXPLICIT = threading.local()
+
+
+class ImplicitCompletionError(Exception):
+    """
+    Error for a request for a single object which was not asked for, when
+    implicit completions are refused.
+    """
+
+
+class CompletionGuard:
+    """
+    Count or refuse implicit completions of PyGithub objects.
+    """
+
+    def __init__(self, refuse):
+        """
+        :param refuse: If True, raise an error instead of sending a request
+            for an object implicitly.
+        """
+        self.refuse = refuse
+        self.counts = collections.Counter()
+
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def kind(verb, url):
+        """
+        Return the kind of object a request is for, if it is a request for a
+        single object which could be an implicit completion, otherwise None.
+
+        >>> CompletionGuard.kind("GET", "/api/v3/repos/abc/def/pulls/12")
+        'PullRequest'
+        >>> CompletionGuard.kind("GET", "/repos/abc/def/pulls/12/commits?page=2")
+        >>> CompletionGuard.kind("PATCH", "/users/abc")
+        """
+        if verb != "GET":
+            return None
+
+        path = url.split("?", 1)[0]
+
+        return next(
+            (kind for kind, pattern in OBJECT_PATTERNS.items() if pattern.search(path)),
+            None,
+        )
+
+    def check(self, verb, url):
+        """
+        Count a request if it is an implicit completion.
+
+        :param verb: HTTP method of the request.
+        :param url: Path of the request, including any query parameters.
+
+        :raises ImplicitCompletionError: If completions are refused.
+        """
+        if getattr(_EXPLICIT, "depth", 0):
+            return
+
+        kind = self.kind(verb, url)
+        if kind is None:
+            return
+
+        with self._lock:
+            self.counts[kind] += 1
+
+        if self.refuse:
+            raise ImplicitCompletionError(
+                f"Reading a field of a {kind} would send a request for {url}."
+                " Fetch it explicitly or use a field from the listing."
+            )
+
+    def summary(self):
+        """
+        Return a line of text with the count of implicit completions, by the
+        kind of object.
+        """
+        with self._lock:
+            total = sum(self.counts.values())
+            counts = self.counts.most_common()
+
+        if not total:
+            return "Implicit completions: 0"
+
+        details = ", ".join(f"{name}: {count:,d}" for name, count in counts)
+
+        return f"Implicit completions: {total:,d} - {details}"
+
+
+COMPLETIONS = CompletionGuard(config.IMPLICIT_COMPLETIONS == "refuse")
+
+
+@contextlib.contextmanager
+def explicit():
+    """
+    Mark the requests sent in this thread within the block as asked for, so
+    they are not counted as implicit completions.
+    """
+    _EXPLICIT.depth = getattr(_EXPLICIT, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _EXPLICIT.depth -= 1
+
+
+def complete(obj):
+    """
+    Fetch the full object for a PyGithub object from a listing, if it is not
+    already complete. This is not counted as an implicit completion.
+    """
+    with explicit():
+        obj._completeIfNeeded()
+
+
+def select_columns(header, columns):
+    """
+    Return the columns of a report to write.
+
+    :param header: All columns of the report.
+    :param columns: Configured columns, or None for all.
+
+    :raises ValueError: If a configured column is not in the report.
+
+    :return: Tuple of columns, in the order of the header.
+
+    >>> select_columns(("A", "B", "C"), None)
+    ('A', 'B', 'C')
+    >>> select_columns(("A", "B", "C"), ["C", "A"])
+    ('A', 'C')
+    """
+    if not columns:
+        return tuple(header)
+
+    unknown = set(columns) - set(header)
+    if unknown:
+        raise ValueError(
+            f"Unknown columns: {sorted(unknown)!r}. Expected any of: {list(header)!r}"
+        )
+
+    return tuple(column for column in header if column in columns)
+
+
+def parts_needed(columns, column_parts):
+    """
+    Return the parts of an item which are needed for the columns.
+
+    :param columns: Columns to write.
+    :param column_parts: dict of each part which needs extra requests, with
+        the columns which use it.
+
+    :return: Set of parts.
+
+    >>> sorted(parts_needed(("A", "B"), {"x": ("B",), "y": ("C",)}))
+    ['x']
+    """
+    return {
+        part
+        for part, part_columns in column_parts.items()
+        if any(column in columns for column in part_columns)
+    }
@@ -0,0 +1,248 @@
+"""
+GraphQL library module.
+
+Fetch data from the GitHub V4 GraphQL API, as an alternative to the REST API
+for the PR report.
+    https://docs.github.com/en/graphql
+
+Usage:
+    from lib import graphql
+
+    repo = CONN.get_repo("MichaelCurrin/aggre-git")
+    for node in graphql.get_pull_requests(repo, "all"):
+        print(node["number"])
+
+The REST API needs several requests for each PR, to get its commits and
+reviews and then to complete the user objects. With GraphQL, a single request
+gets a page of PRs with all the fields used in the PR report.
+
+Requests are sent through the requester of a PyGithub object, so they use the
+same token, base URL and connection classes as `CONN`. The endpoint is found
+from the configured base URL, as it is at `/graphql` on github.com but at
+`/api/graphql` on GitHub Enterprise, rather than next to the REST API at
+`/api/v3`.
+"""
+from etc import config
+from github import GithubException
+
+PR_PAGE_SIZE = 25
+REVIEW_PAGE_SIZE = 100
+
+# Map a configured PR state to GraphQL PR states. Note that closed PRs in the
+# REST API include merged PRs.
+PR_STATES = {
+    "open": ["OPEN"],
+    "closed": ["CLOSED", "MERGED"],
+    "merged": ["MERGED"],
+    "all": None,
+}
+
+ACTOR_FIELDS = """
+    login
+    ... on User {
+        name
+    }
+"""
+
+COMMIT_FIELDS = """
+    commit {
+        oid
+        authoredDate
+        committedDate
+        author {
+            user {
+                login
+                name
+            }
+        }
+    }
+"""
+
+REVIEW_FIELDS = f"""
+    pageInfo {{
+        hasNextPage
+        endCursor
+    }}
+    nodes {{
+        state
+        submittedAt
+        author {{
+            {ACTOR_FIELDS}
+        }}
+    }}
+"""
+
+PULL_REQUESTS_QUERY = f"""
+query($owner: String!, $name: String!, $states: [PullRequestState!],
+      $cursor: String, $pageSize: Int!, $reviewPageSize: Int!) {{
+    repository(owner: $owner, name: $name) {{
+        pullRequests(first: $pageSize, after: $cursor, states: $states,
+                     orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+            pageInfo {{
+                hasNextPage
+                endCursor
+            }}
+            nodes {{
+                id
+                number
+                title
+                body
+                url
+                state
+                merged
+                mergedAt
+                closedAt
+                createdAt
+                updatedAt
+                headRefName
+                baseRefName
+                changedFiles
+                additions
+                deletions
+                author {{
+                    {ACTOR_FIELDS}
+                }}
+                mergedBy {{
+                    {ACTOR_FIELDS}
+                }}
+                assignees(first: 100) {{
+                    nodes {{
+                        login
+                        name
+                    }}
+                }}
+                comments {{
+                    totalCount
+                }}
+                commits {{
+                    totalCount
+                }}
+                oldestCommit: commits(first: 1) {{
+                    nodes {{
+                        {COMMIT_FIELDS}
+                    }}
+                }}
+                latestCommit: commits(last: 1) {{
+                    nodes {{
+                        {COMMIT_FIELDS}
+                    }}
+                }}
+                reviews(first: $reviewPageSize) {{
+                    {REVIEW_FIELDS}
+                }}
+            }}
+        }}
+    }}
+}}
+"""
+
+REVIEWS_QUERY = f"""
+query($id: ID!, $cursor: String, $reviewPageSize: Int!) {{
+    node(id: $id) {{
+        ... on PullRequest {{
+            reviews(first: $reviewPageSize, after: $cursor) {{
+                {REVIEW_FIELDS}
+            }}
+        }}
+    }}
+}}
+"""
+
+
+def endpoint(base_url):
+    """
+    Return the URL of the GraphQL API for the base URL of the REST API.
+
+    >>> endpoint("https://api.github.com")
+    'https://api.github.com/graphql'
+    >>> endpoint("https://github.example.com/api/v3/")
+    'https://github.example.com/api/graphql'
+    """
+    base_url = base_url.rstrip("/")
+    if base_url.endswith("/api/v3"):
+        base_url = base_url[: -len("/v3")]
+
+    return f"{base_url}/graphql"
+
+
+def query(requester, text, variables):
+    """
+    Send a GraphQL query and return the data.
+
+    :param requester: PyGithub requester, such as from a repo object.
+    :param text: GraphQL query.
+    :param variables: dict of values for variables in the query.
+
+    :raises GithubException: If the query returns errors. The API returns a
+        200 status for errors in the query, so this is not done by PyGithub.
+
+    :return: Value of the "data" field of the response.
+    """
+    _, data = requester.requestJsonAndCheck(
+        "POST",
+        endpoint(config.BASE_URL),
+        input={"query": text, "variables": variables},
+    )
+
+    if data.get("errors"):
+        raise GithubException(200, data["errors"], None)
+
+    return data["data"]
+
+
+def _get_remaining_reviews(requester, node):
+    """
+    Add any reviews for a PR after the first page to the PR's node.
+    """
+    reviews = node["reviews"]
+
+    while reviews["pageInfo"]["hasNextPage"]:
+        data = query(
+            requester,
+            REVIEWS_QUERY,
+            {
+                "id": node["id"],
+                "cursor": reviews["pageInfo"]["endCursor"],
+                "reviewPageSize": REVIEW_PAGE_SIZE,
+            },
+        )
+        page = data["node"]["reviews"]
+        reviews["nodes"].extend(page["nodes"])
+        reviews["pageInfo"] = page["pageInfo"]
+
+
+def get_pull_requests(repo, state):
+    """
+    Get PRs in a repo, with the fields needed for the PR report.
+
+    PRs are ordered by most recently updated first, to match the REST listing
+    in `lib.pr_listing`.
+
+    :param repo: PyGithub repo object.
+    :param state: Configured PR state, e.g. "all".
+
+    :return: Generator which yields PR nodes as dicts. Each page of PRs is
+        only requested as the previous page has been used.
+    """
+    requester = repo._requester
+    owner, name = repo.full_name.split("/")
+    variables = {
+        "owner": owner,
+        "name": name,
+        "states": PR_STATES[state],
+        "cursor": None,
+        "pageSize": PR_PAGE_SIZE,
+        "reviewPageSize": REVIEW_PAGE_SIZE,
+    }
+
+    while True:
+        data = query(requester, PULL_REQUESTS_QUERY, variables)
+        pull_requests = data["repository"]["pullRequests"]
+
+        for node in pull_requests["nodes"]:
+            _get_remaining_reviews(requester, node)
+            yield node
+
+        if not pull_requests["pageInfo"]["hasNextPage"]:
+            break
+        variables["cursor"] = pull_requests["pageInfo"]["endCursor"]
@@ -0,0 +1,177 @@
+"""
+PR listing library module.
+
+List the PRs of a repo which were last updated within a window of time.
+
+Usage:
+    from lib import pr_listing
+
+    for pr in pr_listing.list_prs(repo, "all", start, end):
+        print(pr.number, pr.updated_at)
+
+PRs are listed by most recently updated first, so the listing stops at the
+first PR which was updated before the start of the window and no later pages
+are requested. The API's default order is by most recently created first, in
+which an old PR can be followed by one which was updated recently, so it
+cannot be stopped early.
+    https://docs.github.com/en/rest/pulls/pulls#list-pull-requests
+
+PRs which were updated after the end of the window are at the start of the
+listing. Rather than paging through them, the page where the window starts is
+found with a binary search over the pages, which needs a request for each
+halving of the pages. The count of pages is read from the Link header of the
+first page.
+
+A PR which is updated while the pages are requested moves to the start of the
+listing, which moves the other PRs back, so the same PR can be on two pages.
+Each PR is only given once.
+"""
+import re
+
+from github.PullRequest import PullRequest
+
+from . import parse_iso_datetime
+from .connection import MAX_PER_PAGE
+
+LAST_PAGE_PATTERN = re.compile(r'[?&]page=(\d+)[^>]*>; rel="last"')
+
+
+def last_page(headers):
+    """
+    Return the number of the last page of a listing, from the headers of one
+    of its pages.
+
+    >>> last_page({"link": '<https://x/pulls?page=2>; rel="next", '
+    ...            '<https://x/pulls?page=9>; rel="last"'})
+    9
+    >>> last_page({})
+    1
+    """
+    match = LAST_PAGE_PATTERN.search(headers.get("link", ""))
+
+    return int(match.group(1)) if match else 1
+
+
+class _Pages:
+    """
+    Pages of the PRs of a repo, most recently updated first, which are each
+    requested once.
+    """
+
+    def __init__(self, repo, state):
+        self.requester = repo._requester
+        self.url = f"{repo.url}/pulls"
+        self.state = state
+        self._pages = {}
+        self.last = 1
+
+    def get(self, page):
+        """
+        Return the headers and JSON of the PRs on a page, starting from 1.
+        """
+        if page not in self._pages:
+            headers, data = self.requester.requestJsonAndCheck(
+                "GET",
+                self.url,
+                parameters={
+                    "state": self.state,
+                    "sort": "updated",
+                    "direction": "desc",
+                    "per_page": MAX_PER_PAGE,
+                    "page": page,
+                },
+            )
+            self._pages[page] = (headers, data)
+            if page == 1:
+                self.last = last_page(headers)
+
+        return self._pages[page]
+
+    def keep(self, page):
+        """
+        Forget every page except one, such as the pages which were requested
+        to find where a window starts.
+        """
+        self._pages = {page: self._pages[page]} if page in self._pages else {}
+
+    def pop(self, page):
+        """
+        Return a page and forget it, so that pages which were used are not
+        kept.
+        """
+        result = self.get(page)
+        del self._pages[page]
+
+        return result
+
+
+def _ends_before(pages, page, end):
+    """
+    Return True if the last PR on a page was updated before the end of the
+    window, so the window starts on or before that page.
+    """
+    _, data = pages.get(page)
+
+    return not data or parse_iso_datetime(data[-1]["updated_at"]) < end
+
+
+def find_start_page(pages, end):
+    """
+    Find the first page which has a PR that was updated before the end of a
+    window, with a binary search over the pages.
+
+    :param pages: `_Pages` instance.
+    :param end: End of the window. PRs updated at or after this are skipped.
+
+    :return: Page number, which is past the last page if every PR was updated
+        after the end.
+    """
+    if _ends_before(pages, 1, end):
+        return 1
+
+    low, high = 1, pages.last + 1
+    while high - low > 1:
+        middle = (low + high) // 2
+        if _ends_before(pages, middle, end):
+            high = middle
+        else:
+            low = middle
+
+    return high
+
+
+def list_prs(repo, state, start=None, end=None):
+    """
+    List the PRs of a repo which were last updated within a window of time.
+
+    :param repo: PyGithub repo object.
+    :param state: State of the PRs to list, e.g. "all".
+    :param start: PRs updated before this are not listed, or None for no
+        limit.
+    :param end: PRs updated at or after this are not listed, or None for no
+        limit.
+
+    :return: Generator which yields PyGithub PR objects, most recently updated
+        first. Each page is only requested as the previous page has been used.
+    """
+    pages = _Pages(repo, state)
+    page = find_start_page(pages, end) if end else 1
+    pages.keep(page)
+    seen = set()
+
+    while True:
+        headers, data = pages.pop(page)
+
+        for item in data:
+            updated_at = parse_iso_datetime(item["updated_at"])
+            if item["number"] in seen or (end and updated_at >= end):
+                continue
+            if start and updated_at < start:
+                return
+
+            seen.add(item["number"])
+            yield PullRequest(pages.requester, headers, item, completed=False)
+
+        if len(data) < MAX_PER_PAGE:
+            return
+        page += 1
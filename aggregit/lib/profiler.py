@@ -0,0 +1,405 @@
+"""
+Profiler library module.
+
+Usage:
+    from lib.profiler import PROFILER
+
+    with PROFILER.span("get_repos"):
+        repos = list(lib.get_repos())
+
+    for pr in PROFILER.iter_span("get_pulls", repo.get_pulls()):
+        ...
+
+    print(PROFILER.summary())
+    PROFILER.save_trace("pr_report")
+
+Record each API request and timed spans for the phases of a report, to see
+where the time of a slow report goes.
+
+Requests are recorded by the connection classes in `lib.connection` and by the
+async client, with the endpoint as a template such as
+`/repos/{owner}/{repo}/pulls/{number}`, the status, latency, size of the body,
+whether the response cache was hit and the remaining rate limit. Each request
+is also counted against the innermost span which was open in its thread, so
+the summary shows which phase sent the requests.
+
+A span is timed with a context manager or around each step of an iterable. The
+latter is for phases which are lazy, such as a paginated listing, so that only
+the time spent getting the next item is counted and not the time the caller
+spends on it.
+
+Only totals for each endpoint and span are kept, so the cost of a record is a
+few dict updates and it can stay on for every run. The events themselves are
+only kept if a trace format is configured, to write to a JSON file at the end
+of the report. The "chrome" format can be opened in `chrome://tracing` or
+Perfetto, to see the spans and requests on a timeline for each thread.
+"""
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+from etc import config
+
+TRACE_PATH_TEMPLATE = os.path.join(config.OUTPUT_PATH, "{name}.trace.json")
+
+# Path segments which are replaced in endpoint templates.
+SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+NAMED_SEGMENTS = {
+    "users": "{user}",
+    "orgs": "{org}",
+    "branches": "{branch}",
+    "commits": "{sha}",
+}
+
+
+def endpoint_template(url):
+    """
+    Return the endpoint of a request URL, with IDs replaced by placeholders.
+
+    >>> endpoint_template("/repos/MichaelCurrin/aggre-git/pulls/12/commits?page=2")
+    '/repos/{owner}/{repo}/pulls/{number}/commits'
+    >>> endpoint_template("https://api.github.com/users/MichaelCurrin")
+    '/users/{user}'
+    >>> endpoint_template("/repos/a/b/commits/" + "f" * 40)
+    '/repos/{owner}/{repo}/commits/{sha}'
+    >>> endpoint_template("/graphql")
+    '/graphql'
+    """
+    path = url.split("?", 1)[0]
+    if "://" in path:
+        path = "/" + path.split("/", 3)[3]
+    parts = path.strip("/").split("/")
+
+    if parts[0] == "repos" and len(parts) >= 3:
+        parts[1:3] = ["{owner}", "{repo}"]
+        start = 3
+    else:
+        start = 0
+
+    for index in range(start, len(parts)):
+        part = parts[index]
+        previous = parts[index - 1] if index else None
+
+        if part.isdigit():
+            parts[index] = "{number}"
+        elif SHA_PATTERN.match(part):
+            parts[index] = "{sha}"
+        elif previous in NAMED_SEGMENTS:
+            parts[index] = NAMED_SEGMENTS[previous]
+
+    return "/" + "/".join(parts)
+
+
+class _Span:
+    """
+    Context manager which times a span and records it on exit.
+    """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack().append(self.name)
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.profiler._stack().pop()
+        self.profiler._record_span(self.name, self.start, end)
+
+
+class _NoSpan:
+    """
+    Context manager which does nothing, for when profiling is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    """
+    Totals and optional trace of API requests and timed spans.
+    """
+
+    def __init__(self, enabled, trace_format):
+        """
+        :param enabled: Set as False to make recording do nothing.
+        :param trace_format: One of "json" or "chrome" to keep events for a
+            trace file, or None to only keep totals.
+        """
+        self.enabled = enabled
+        self.trace_format = trace_format
+
+        self.requests = {}
+        self.spans = {}
+        self.events = []
+        self.start_time = time.perf_counter()
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def current_span(self):
+        """
+        Return the name of the innermost span open in this thread, or None.
+        """
+        stack = self._stack()
+
+        return stack[-1] if stack else None
+
+    def span(self, name):
+        """
+        Return a context manager which times a span.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+
+        return _Span(self, name)
+
+    def iter_span(self, name, iterable):
+        """
+        Yield the items of an iterable, timing each step as a span.
+        """
+        if not self.enabled:
+            yield from iterable
+
+            return
+
+        iterator = iter(iterable)
+        while True:
+            with _Span(self, name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def timed(self, name):
+        """
+        Return a decorator which times each call of a function as a span.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _span_totals(self, name):
+        """
+        Return the totals for a span, which are added if needed. The lock must
+        be held.
+        """
+        totals = self.spans.get(name)
+        if totals is None:
+            totals = self.spans[name] = {
+                "calls": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+                "requests": 0,
+            }
+
+        return totals
+
+    def _record_span(self, name, start, end):
+        seconds = end - start
+
+        with self._lock:
+            totals = self._span_totals(name)
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+
+        if self.trace_format:
+            self.events.append(("span", name, start, end, threading.get_ident(), None))
+
+    def record_request(self, verb, url, status, start, end, size, cache, headers):
+        """
+        Record an API request.
+
+        :param verb: HTTP method, e.g. "GET".
+        :param url: Path or full URL of the request.
+        :param status: HTTP status of the response.
+        :param start: Value of `time.perf_counter` when the request was sent.
+        :param end: Value of `time.perf_counter` when the response was read.
+        :param size: Length of the response body.
+        :param cache: "hit" or "miss" if the response cache was used, or None.
+        :param headers: Response headers, with lowercase names.
+        """
+        if not self.enabled:
+            return
+
+        endpoint = f"{verb} {endpoint_template(url)}"
+        seconds = end - start
+        remaining = headers.get("x-ratelimit-remaining")
+        span = self.current_span()
+
+        with self._lock:
+            totals = self.requests.get(endpoint)
+            if totals is None:
+                totals = self.requests[endpoint] = {
+                    "requests": 0,
+                    "errors": 0,
+                    "cache_hits": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "bytes": 0,
+                    "remaining": None,
+                }
+            totals["requests"] += 1
+            totals["errors"] += status >= 400
+            totals["cache_hits"] += cache == "hit"
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["bytes"] += size
+            if remaining is not None:
+                totals["remaining"] = int(float(remaining))
+
+            if span is not None:
+                self._span_totals(span)["requests"] += 1
+
+        if self.trace_format:
+            args = {
+                "url": url,
+                "status": status,
+                "bytes": size,
+                "cache": cache,
+                "remaining": remaining,
+                "span": span,
+            }
+            self.events.append(
+                ("request", endpoint, start, end, threading.get_ident(), args)
+            )
+
+    def summary(self):
+        """
+        Return tables of the totals for each endpoint and span, with the
+        slowest first.
+        """
+        if not self.enabled:
+            return "Profiler: disabled"
+
+        with self._lock:
+            requests = sorted(self.requests.items(), key=lambda i: -i[1]["seconds"])
+            spans = sorted(self.spans.items(), key=lambda i: -i[1]["seconds"])
+
+        lines = [
+            "Endpoint | Requests | Errors | Cache hits | Total s | Mean ms"
+            " | Max ms | KB | Remaining",
+            "---      | ---      | ---    | ---        | ---     | ---    "
+            " | ---    | --- | ---",
+        ]
+        for endpoint, totals in requests:
+            mean = totals["seconds"] / totals["requests"]
+            remaining = totals["remaining"]
+            lines.append(
+                f"{endpoint} | {totals['requests']:,d} | {totals['errors']:,d}"
+                f" | {totals['cache_hits']:,d} | {totals['seconds']:.2f}"
+                f" | {mean * 1000:.1f} | {totals['max_seconds'] * 1000:.1f}"
+                f" | {totals['bytes'] / 1024:,.0f}"
+                f" | {'-' if remaining is None else f'{remaining:,d}'}"
+            )
+
+        lines += [
+            "",
+            "Span | Calls | Total s | Mean ms | Max ms | Requests",
+            "---  | ---   | ---     | ---     | ---    | ---",
+        ]
+        for name, totals in spans:
+            mean = totals["seconds"] / totals["calls"]
+            lines.append(
+                f"{name} | {totals['calls']:,d} | {totals['seconds']:.2f}"
+                f" | {mean * 1000:.2f} | {totals['max_seconds'] * 1000:.1f}"
+                f" | {totals['requests']:,d}"
+            )
+
+        elapsed = time.perf_counter() - self.start_time
+        lines += ["", f"Profiled time: {elapsed:.2f}s"]
+
+        return "\n".join(lines)
+
+    def trace(self):
+        """
+        Return the recorded events in the configured trace format.
+
+        Times are relative to when the profiler was created. The "json" format
+        has a list of events with times in seconds. The "chrome" format has
+        trace events with times in microseconds.
+        """
+        if self.trace_format == "chrome":
+            pid = os.getpid()
+            events = [
+                {
+                    "name": name,
+                    "cat": kind,
+                    "ph": "X",
+                    "ts": (start - self.start_time) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args or {},
+                }
+                for kind, name, start, end, tid, args in self.events
+            ]
+
+            return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+        events = [
+            {
+                "type": kind,
+                "name": name,
+                "start": start - self.start_time,
+                "seconds": end - start,
+                "thread": tid,
+                **(args or {}),
+            }
+            for kind, name, start, end, tid, args in self.events
+        ]
+
+        return {"events": events}
+
+    def save_trace(self, name):
+        """
+        Write the trace to a file in the `var` directory, if a trace format is
+        configured.
+
+        :param name: Name of the report, used for the file name.
+        """
+        if not self.enabled or not self.trace_format:
+            return
+
+        path = TRACE_PATH_TEMPLATE.format(name=name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f_out:
+            json.dump(self.trace(), f_out)
+        os.replace(tmp_path, path)
+
+        print(f"Wrote trace of {len(self.events):,d} events to: {path}")
+
+
+PROFILER = Profiler(config.PROFILE_ENABLED, config.PROFILE_TRACE_FORMAT)
@@ -0,0 +1,453 @@
+"""
+Row store library module.
+
+Usage:
+    from lib.row_store import RowStore
+
+    with RowStore("pr_report.sqlite") as store:
+        rows = store.rows("MichaelCurrin/aggre-git")
+
+Keep the rows of a report in a local SQLite database between runs, so that a
+report can be updated incrementally. For each repo, the store holds the
+computed rows keyed by an item number such as a PR number, plus a high-water
+mark of the most recent `updated_at` value which has been processed. On the
+next run, only items updated since the watermark need to be fetched again.
+
+The store for a repo is reset when the report's filters have changed, or if
+the configured min date is now earlier than the date the repo's rows were
+fetched back to, since there could be older items which were never fetched.
+
+Row values are stored as JSON. Dates are tagged so they can be restored
+as `datetime.date` objects, to match rows which were computed in this run.
+
+The commit report uses a `CommitIndex` instead, as commits have no number or
+updated time. It holds every commit which has been walked, keyed by its full
+SHA as 20 bytes, across all branches and repos, with the row of each commit
+which was selected. A walk of a branch stops at commits in the index, so on
+the next run only commits which were added above the known commits are
+requested. The index also holds the HEAD commit of each branch which was
+walked, so that a branch which has not changed can be skipped. A commit which
+could not be converted to a row stays in the index, so the walk still stops at
+it, and is marked as failed with its branch, so that it is fetched again on
+the next run.
+"""
+
+import datetime
+import json
+import sqlite3
+
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repo_state (
+    repo TEXT PRIMARY KEY,
+    watermark TEXT,
+    floor TEXT,
+    filters TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS repo_row (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    row TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+"""
+
+
+COMMIT_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS index_state (
+    repo TEXT PRIMARY KEY,
+    floor TEXT,
+    filters TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seen_commit (
+    sha BLOB PRIMARY KEY,
+    repo TEXT NOT NULL,
+    committed_at TEXT,
+    row TEXT
+);
+CREATE INDEX IF NOT EXISTS seen_commit_repo ON seen_commit (repo);
+CREATE TABLE IF NOT EXISTS failed_commit (
+    sha BLOB PRIMARY KEY,
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS branch_head (
+    repo TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    PRIMARY KEY (repo, branch)
+);
+"""
+
+
+def _encode(value):
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+
+    raise TypeError(f"Cannot store value of type: {type(value).__name__}")
+
+
+def _decode(obj):
+    if "$date" in obj:
+        return datetime.date.fromisoformat(obj["$date"])
+
+    return obj
+
+
+def _format_datetime(value):
+    return value.strftime(DATETIME_FORMAT) if value else None
+
+
+def _parse_datetime(value):
+    return datetime.datetime.strptime(value, DATETIME_FORMAT) if value else None
+
+
+class RowStore:
+    """
+    SQLite store of report rows and watermarks for each repo.
+
+    Use as a context manager, so that changes are committed at the end. The
+    state of each repo is also committed when `end_repo` is called, so a
+    failed run keeps the repos which were completed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def __enter__(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(SCHEMA)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
+    def start_repo(self, repo, filters, min_date):
+        """
+        Get the watermark for a repo, resetting the repo if needed.
+
+        :param repo: Full name of the repo, e.g. "MichaelCurrin/aggre-git".
+        :param filters: JSON-serializable value of the report's filters, such
+            as the configured usernames and state. If this differs from the
+            last run, the repo is reset.
+        :param min_date: Configured min date as a datetime, or None.
+
+        :return: Watermark as a datetime, or None if items should be fetched
+            back to the min date.
+        """
+        filters = json.dumps(filters, sort_keys=True)
+        state = self._conn.execute(
+            "SELECT watermark, floor, filters FROM repo_state WHERE repo = ?",
+            (repo,),
+        ).fetchone()
+
+        if state is not None:
+            watermark, floor, stored_filters = state
+            floor = _parse_datetime(floor)
+            missing_older = floor is not None and (min_date is None or min_date < floor)
+
+            if stored_filters == filters and not missing_older:
+                return _parse_datetime(watermark)
+
+        self._conn.execute("DELETE FROM repo_row WHERE repo = ?", (repo,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO repo_state (repo, watermark, floor, filters)"
+            " VALUES (?, NULL, ?, ?)",
+            (repo, _format_datetime(min_date), filters),
+        )
+
+        return None
+
+    def end_repo(self, repo, watermark):
+        """
+        Set the watermark for a repo and commit changes to it.
+
+        :param repo: Full name of the repo.
+        :param watermark: The `updated_at` value which the next run should
+            fetch items from, as a datetime. If None, the current value is kept.
+        """
+        if watermark is not None:
+            self._conn.execute(
+                "UPDATE repo_state SET watermark = ? WHERE repo = ?",
+                (_format_datetime(watermark), repo),
+            )
+        self._conn.commit()
+
+    def save(self, repo, number, updated_at, row):
+        """
+        Add or replace the row for an item.
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO repo_row (repo, number, updated_at, row)"
+            " VALUES (?, ?, ?, ?)",
+            (
+                repo,
+                number,
+                _format_datetime(updated_at),
+                json.dumps(row, default=_encode),
+            ),
+        )
+
+    def updated_at(self, repo, number):
+        """
+        Get the `updated_at` value which the row for an item was stored with,
+        as a datetime, or None if there is no row.
+        """
+        row = self._conn.execute(
+            "SELECT updated_at FROM repo_row WHERE repo = ? AND number = ?",
+            (repo, number),
+        ).fetchone()
+
+        return _parse_datetime(row[0]) if row else None
+
+    def delete(self, repo, number):
+        """
+        Remove the row for an item, if there is one.
+        """
+        self._conn.execute(
+            "DELETE FROM repo_row WHERE repo = ? AND number = ?", (repo, number)
+        )
+
+    def rows(self, repo, min_date=None):
+        """
+        Get the stored rows for a repo.
+
+        :param repo: Full name of the repo.
+        :param min_date: Optionally exclude items last updated before this
+            datetime.
+
+        :return: List of rows as dicts, ordered by item number descending.
+        """
+        query = "SELECT row FROM repo_row WHERE repo = ?"
+        params = [repo]
+        if min_date:
+            query += " AND updated_at >= ?"
+            params.append(_format_datetime(min_date))
+        query += " ORDER BY number DESC"
+
+        return [
+            json.loads(row, object_hook=_decode)
+            for (row,) in self._conn.execute(query, params)
+        ]
+
+
+class CommitIndex:
+    """
+    SQLite index of the commits which have been seen, by full SHA.
+
+    Supports `in` and `add` with SHA strings, like a set, so that it can be
+    used to track seen commits while walking branches. Commits are added to
+    the repo which was last started.
+
+    Use as a context manager, like `RowStore`. Use the path ":memory:" to only
+    keep the index for this run.
+
+    >>> with CommitIndex(":memory:") as index:
+    ...     index.start_repo("abc/def", {}, None)
+    ...     index.add("ab12")
+    ...     index.fail("ab12", "master")
+    ...     index.end_repo()
+    ...     index.start_repo("abc/def", {}, None)
+    ...     print("ab12" in index, index.failed_commits())
+    True [('ab12', 'master')]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._repo = None
+        self._last_id = 0
+
+    def __enter__(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(COMMIT_INDEX_SCHEMA)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
+    def __contains__(self, sha):
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM seen_commit WHERE sha = ?", (bytes.fromhex(sha),)
+            ).fetchone()
+            is not None
+        )
+
+    def start_repo(self, repo, filters, min_date):
+        """
+        Start adding commits for a repo, resetting the repo if needed.
+
+        :param repo: Full name of the repo, e.g. "MichaelCurrin/aggre-git".
+        :param filters: JSON-serializable value of the report's filters, such
+            as the configured usernames. If this differs from the last run,
+            the commits of the repo are removed.
+        :param min_date: Configured min date as a datetime, or None.
+        """
+        filters = json.dumps(filters, sort_keys=True)
+        state = self._conn.execute(
+            "SELECT floor, filters FROM index_state WHERE repo = ?", (repo,)
+        ).fetchone()
+
+        reset = True
+        if state is not None:
+            floor, stored_filters = state
+            floor = _parse_datetime(floor)
+            missing_older = floor is not None and (min_date is None or min_date < floor)
+            reset = stored_filters != filters or missing_older
+
+        if reset:
+            self._conn.execute("DELETE FROM seen_commit WHERE repo = ?", (repo,))
+            self._conn.execute("DELETE FROM branch_head WHERE repo = ?", (repo,))
+            self._conn.execute("DELETE FROM failed_commit WHERE repo = ?", (repo,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO index_state (repo, floor, filters)"
+                " VALUES (?, ?, ?)",
+                (repo, _format_datetime(min_date), filters),
+            )
+
+        (last_id,) = self._conn.execute(
+            "SELECT COALESCE(MAX(rowid), 0) FROM seen_commit"
+        ).fetchone()
+        self._repo = repo
+        self._last_id = last_id
+
+    def add(self, sha):
+        """
+        Add a commit which has been seen, without a row.
+        """
+        self._conn.execute(
+            "INSERT OR IGNORE INTO seen_commit (sha, repo) VALUES (?, ?)",
+            (bytes.fromhex(sha), self._repo),
+        )
+
+    def fail(self, sha, branch):
+        """
+        Mark a commit which could not be converted to a row, so that it is
+        fetched again on the next run. The commit stays in the index, as the
+        commits above it were walked.
+
+        :param sha: Full SHA of the commit.
+        :param branch: Name of the branch the commit was found on.
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO failed_commit (sha, repo, branch) VALUES (?, ?, ?)",
+            (bytes.fromhex(sha), self._repo, branch),
+        )
+
+    def forget(self, sha):
+        """
+        Remove a failed commit which no longer exists, so it is not fetched
+        again.
+        """
+        self._conn.execute(
+            "DELETE FROM failed_commit WHERE sha = ?", (bytes.fromhex(sha),)
+        )
+
+    def failed_commits(self):
+        """
+        Get the failed commits of the repo which was last started.
+
+        :return: List of tuples of the full SHA and branch name of each commit.
+        """
+        return [
+            (sha.hex(), branch)
+            for sha, branch in self._conn.execute(
+                "SELECT sha, branch FROM failed_commit WHERE repo = ? ORDER BY rowid",
+                (self._repo,),
+            )
+        ]
+
+    def save_row(self, sha, committed_at, row):
+        """
+        Set the row for a commit which was added, or which failed before.
+
+        The commit is added again, so that a failed commit from an earlier run
+        counts as added in this run and is not also given by `earlier_rows`.
+        """
+        sha = bytes.fromhex(sha)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO seen_commit (sha, repo, committed_at, row)"
+            " VALUES (?, ?, ?, ?)",
+            (
+                sha,
+                self._repo,
+                _format_datetime(committed_at),
+                json.dumps(row, default=_encode),
+            ),
+        )
+        self._conn.execute("DELETE FROM failed_commit WHERE sha = ?", (sha,))
+
+    def head(self, branch):
+        """
+        Get the SHA of the HEAD commit of a branch in the repo which was last
+        started, as it was when the branch was last walked, or None.
+        """
+        row = self._conn.execute(
+            "SELECT sha FROM branch_head WHERE repo = ? AND branch = ?",
+            (self._repo, branch),
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def set_head(self, branch, sha):
+        """
+        Set the SHA of the HEAD commit of a branch which was walked.
+        """
+        self._conn.execute(
+            "INSERT OR REPLACE INTO branch_head (repo, branch, sha) VALUES (?, ?, ?)",
+            (self._repo, branch, sha),
+        )
+
+    def end_repo(self, branches=None):
+        """
+        Commit the changes to the repo which was last started.
+
+        :param branches: Optionally, the names of the branches which the repo
+            has now. The HEAD commits of any other branches are removed.
+        """
+        if branches is not None:
+            stored = {
+                branch
+                for (branch,) in self._conn.execute(
+                    "SELECT branch FROM branch_head WHERE repo = ?", (self._repo,)
+                )
+            }
+            self._conn.executemany(
+                "DELETE FROM branch_head WHERE repo = ? AND branch = ?",
+                [(self._repo, branch) for branch in stored - set(branches)],
+            )
+        self._conn.commit()
+
+    def earlier_rows(self, repo, min_date=None):
+        """
+        Get the rows of a repo which were added before it was last started.
+
+        :param repo: Full name of the repo.
+        :param min_date: Optionally exclude commits before this datetime.
+
+        :return: Generator of rows as dicts, in the order they were added.
+        """
+        query = (
+            "SELECT row FROM seen_commit"
+            " WHERE repo = ? AND rowid <= ? AND row IS NOT NULL"
+        )
+        params = [repo, self._last_id]
+        if min_date:
+            query += " AND committed_at >= ?"
+            params.append(_format_datetime(min_date))
+        query += " ORDER BY rowid"
+
+        for (row,) in self._conn.execute(query, params):
+            yield json.loads(row, object_hook=_decode)
@@ -0,0 +1,501 @@
+"""
+Scheduler library module.
+
+Pace requests made through `CONN` so that a report does not fail halfway
+through when it runs out of API rate limit.
+
+Usage:
+    from lib.scheduler import SCHEDULER
+
+    print(SCHEDULER.summary())
+    print(SCHEDULER.usage())
+
+Every response has headers for the rate limit of its resource, such as core,
+search or graphql. The scheduler keeps the latest values for each resource and
+uses them before each request:
+
+    - If the budget for the resource is used up, wait until the reset time
+      rather than sending a request which will fail.
+    - Otherwise, take a token from a token bucket. The bucket refills at the
+      configured requests per minute, to stay under GitHub's secondary rate
+      limits, and allows a burst of requests up to its size.
+
+If a response still has a rate limit error, the request is sent again after
+waiting until the reset time, or for as long as a `Retry-After` header says
+for a secondary rate limit. A secondary rate limit error without that header
+is sent again after a default wait of a minute, as GitHub advises.
+    https://docs.github.com/en/rest/overview/resources-in-the-rest-api#rate-limiting
+
+Each of the configured `ACCESS_TOKENS` has its own scheduler, as the rate
+limits are for each user. The pool of tokens picks the token for each request,
+which is the one with the most remaining budget for the resource, and moves
+on to another token when one is used up or rate limited. The summary is for
+all tokens together, and the usage shows the requests and budget of each.
+
+The scheduler is used through the connection classes in `lib.connection`. The
+rate limit report script is a view onto its state.
+"""
+import collections
+import datetime
+import threading
+import time
+
+from etc import config
+
+# Most recent requests to keep times for, to measure the current request rate.
+RATE_WINDOW_SECONDS = 60
+
+# Max times to resend a request which hit a rate limit, before returning the
+# error response.
+MAX_RATE_LIMIT_RETRIES = 5
+
+# Seconds to wait before resending a request which hit a secondary rate limit,
+# when the response does not say how long to wait.
+SECONDARY_RATE_LIMIT_SECONDS = 60
+
+
+def resource_for(url):
+    """
+    Return the rate limit resource which a request URL counts against.
+
+    >>> resource_for("/search/issues?q=abc")
+    'search'
+    >>> resource_for("/graphql")
+    'graphql'
+    >>> resource_for("/repos/MichaelCurrin/aggre-git/pulls")
+    'core'
+    """
+    if url.startswith("/search/"):
+        return "search"
+    if url.startswith("/graphql"):
+        return "graphql"
+
+    return "core"
+
+
+def is_secondary_rate_limit(text):
+    """
+    Return True if the body of an error response is for a secondary rate
+    limit, which is also known as an abuse limit.
+
+    >>> is_secondary_rate_limit('{"message": "You have exceeded a secondary rate limit."}')
+    True
+    >>> is_secondary_rate_limit('{"message": "Resource not accessible by integration"}')
+    False
+    """
+    text = (text or "").lower()
+
+    return "secondary rate limit" in text or "abuse" in text
+
+
+def token_label(token):
+    """
+    Return a label for a token which is safe to print.
+
+    >>> token_label("ghp_abcdefghijklmnop1234")
+    '...1234'
+    >>> token_label("")
+    'none'
+    """
+    if not token:
+        return "none"
+
+    return f"...{token[-4:]}"
+
+
+def format_status(status):
+    """
+    Return a line of text describing the status of a budget.
+
+    :param status: dict as returned by `RateLimitScheduler.status`.
+    """
+    if status["remaining"] is None:
+        return f"Rate limit: unknown - {status['requests']:,d} requests sent"
+
+    line = (
+        f"Rate limit: {status['remaining']:,d} / {status['limit']:,d} remaining"
+        f" - {status['requests']:,d} requests sent at {status['rate']:.1f}/s"
+    )
+    if status["reset_in"] is not None and status["reset_in"] > 0:
+        reset_in = datetime.timedelta(seconds=int(status["reset_in"]))
+        line += f" - resets in {reset_in}"
+    if status["exhausted_in"] is not None:
+        exhausted_in = datetime.timedelta(seconds=int(status["exhausted_in"]))
+        line += f" - used up in {exhausted_in} at this rate"
+
+    return line
+
+
+class Budget:
+    """
+    Rate limit values for a resource, as last seen on a response.
+    """
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_time = None
+
+    def wait_time(self, reserve, now):
+        """
+        Return seconds to wait until the reset time if the budget is used up,
+        otherwise zero.
+        """
+        if self.remaining is None or self.remaining > reserve:
+            return 0
+        if self.reset_time is None or self.reset_time <= now:
+            return 0
+
+        # Add a second as the reset time is rounded down.
+        return self.reset_time - now + 1
+
+
+class RateLimitScheduler:
+    """
+    Track rate limits from responses and pace requests.
+    """
+
+    def __init__(self, per_minute, burst, reserve):
+        """
+        :param per_minute: Rate which the token bucket refills at.
+        :param burst: Size of the token bucket.
+        :param reserve: Stop sending requests when the remaining budget for a
+            resource is at this value, until the reset time.
+        """
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.reserve = reserve
+
+        self.budgets = collections.defaultdict(Budget)
+        self.requests = 0
+        self.waited = 0.0
+        self.start_time = time.time()
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """
+        Wait until a request to a URL can be sent.
+        """
+        resource = resource_for(url)
+
+        with self._lock:
+            now = time.time()
+            budget = self.budgets[resource]
+            budget_wait = budget.wait_time(self.reserve, now)
+
+            if not budget_wait and budget.remaining is not None:
+                # Count this request now, so that requests in other threads
+                # do not all see the same remaining value.
+                budget.remaining -= 1
+
+            monotonic_now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (monotonic_now - self._last_refill) * self.rate,
+            )
+            self._last_refill = monotonic_now
+            self._tokens -= 1
+            bucket_wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+            self.requests += 1
+            self._recent.append(now)
+            self._drop_old_requests(now)
+
+        wait = budget_wait + bucket_wait
+        if budget_wait:
+            reset = datetime.datetime.fromtimestamp(now + budget_wait)
+            print(
+                f"\nRate limit used up for {resource}."
+                f" Waiting until {reset.time()} to continue."
+            )
+        self._sleep(wait)
+
+    def update(self, url, status, headers, text=""):
+        """
+        Update the budget for a URL's resource from a response's headers.
+
+        :param url: Path of the request.
+        :param status: HTTP status of the response.
+        :param headers: Response headers, with lowercase names.
+        :param text: Body of the response, to tell a secondary rate limit
+            error from another 403 error.
+
+        :return: Seconds to wait before sending the request again if it hit a
+            rate limit, otherwise None.
+        """
+        resource = headers.get("x-ratelimit-resource") or resource_for(url)
+
+        with self._lock:
+            budget = self.budgets[resource]
+            if "x-ratelimit-remaining" in headers:
+                budget.remaining = int(float(headers["x-ratelimit-remaining"]))
+            if "x-ratelimit-limit" in headers:
+                budget.limit = int(float(headers["x-ratelimit-limit"]))
+            if "x-ratelimit-reset" in headers:
+                budget.reset_time = int(float(headers["x-ratelimit-reset"]))
+
+        if status not in (403, 429):
+            return None
+
+        if "retry-after" in headers:
+            return int(headers["retry-after"])
+
+        if budget.remaining == 0:
+            return max(int(budget.wait_time(0, time.time())), 1)
+
+        if status == 429 or is_secondary_rate_limit(text):
+            return SECONDARY_RATE_LIMIT_SECONDS
+
+        return None
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.waited += seconds
+            time.sleep(seconds)
+
+    def wait_to_retry(self, seconds):
+        """
+        Wait before resending a request which hit a rate limit.
+        """
+        print(f"\nRate limited. Waiting {seconds:,d}s to retry.")
+        self._sleep(seconds)
+
+    def _drop_old_requests(self, now):
+        cutoff = now - RATE_WINDOW_SECONDS
+        while self._recent and self._recent[0] < cutoff:
+            self._recent.popleft()
+
+    def current_rate(self):
+        """
+        Return requests per second sent over the recent window.
+        """
+        with self._lock:
+            self._drop_old_requests(time.time())
+            count = len(self._recent)
+
+        elapsed = min(RATE_WINDOW_SECONDS, time.time() - self.start_time)
+
+        return count / elapsed if elapsed > 0 else 0.0
+
+    def status(self, resource="core"):
+        """
+        Return the live budget for a resource and estimated times.
+
+        :return: dict with the limit, remaining and reset time of the budget
+            if known. Also the requests sent in this run, the current rate of
+            requests per second, seconds until the reset time and estimated
+            seconds until the budget is used up at the current rate.
+        """
+        budget = self.budgets[resource]
+        now = time.time()
+        rate = self.current_rate()
+
+        reset_in = budget.reset_time - now if budget.reset_time else None
+        if budget.remaining is not None and rate:
+            exhausted_in = budget.remaining / rate
+        else:
+            exhausted_in = None
+
+        return {
+            "limit": budget.limit,
+            "remaining": budget.remaining,
+            "reset_time": budget.reset_time,
+            "requests": self.requests,
+            "rate": rate,
+            "reset_in": reset_in,
+            "exhausted_in": exhausted_in,
+            "waited": self.waited,
+        }
+
+    def summary(self, resource="core"):
+        """
+        Return a line of text describing the live budget for a resource.
+        """
+        return format_status(self.status(resource))
+
+
+class TokenPool:
+    """
+    Rate limit schedulers for a pool of tokens, which picks the token to send
+    each request with.
+
+    Each token has its own budgets and token bucket, as GitHub's rate limits
+    are for each user. A request is sent with the token which has the most
+    remaining budget for its resource, so that the tokens are used up evenly.
+    A token whose budget is used up, or which got a rate limit error, is
+    skipped until its reset time while any other token can be used. When all
+    tokens are used up, the one which resets first is used and its scheduler
+    waits.
+    """
+
+    def __init__(self, tokens, per_minute, burst, reserve):
+        """
+        :param tokens: List of API tokens. Duplicates are ignored.
+        :param per_minute: Rate which the token bucket of each token refills
+            at.
+        :param burst: Size of the token bucket of each token.
+        :param reserve: Stop sending requests with a token when the remaining
+            budget for a resource is at this value, until the reset time.
+        """
+        self.reserve = reserve
+        self.schedulers = {
+            token: RateLimitScheduler(per_minute, burst, reserve)
+            for token in dict.fromkeys(tokens)
+        }
+
+        self.waited = 0.0
+
+        self._sent = collections.Counter()
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def _wait_time(self, token, resource, now):
+        budget = self.schedulers[token].budgets[resource]
+        blocked = self._blocked_until.get((token, resource), 0) - now
+
+        return max(budget.wait_time(self.reserve, now), blocked, 0)
+
+    def _choose(self, resource, now):
+        """
+        Return the token to send a request with. The lock must be held.
+        """
+
+        def priority(token):
+            wait = self._wait_time(token, resource, now)
+            remaining = self.schedulers[token].budgets[resource].remaining
+            if remaining is None:
+                # Try each token before its budget is known.
+                remaining = float("inf")
+
+            return (wait, -remaining, self._sent[token])
+
+        return min(self.schedulers, key=priority)
+
+    def acquire(self, url):
+        """
+        Wait until a request to a URL can be sent and return the token to
+        send it with.
+        """
+        resource = resource_for(url)
+
+        with self._lock:
+            token = self._choose(resource, time.time())
+            self._sent[token] += 1
+
+        self.schedulers[token].acquire(url)
+
+        return token
+
+    def update(self, token, url, status, headers, text=""):
+        """
+        Update the budget of a token from a response's headers.
+
+        :param token: Token which the request was sent with.
+        :param url: Path of the request.
+        :param status: HTTP status of the response.
+        :param headers: Response headers, with lowercase names.
+        :param text: Body of the response.
+
+        :return: Seconds to wait before sending the request again if it hit a
+            rate limit, which is zero if another token can be used, otherwise
+            None.
+        """
+        wait = self.schedulers[token].update(url, status, headers, text)
+        if wait is None:
+            return None
+
+        resource = headers.get("x-ratelimit-resource") or resource_for(url)
+        now = time.time()
+        with self._lock:
+            self._blocked_until[(token, resource)] = now + wait
+            if any(
+                not self._wait_time(other, resource, now) for other in self.schedulers
+            ):
+                return 0
+
+        return wait
+
+    def wait_to_retry(self, seconds):
+        """
+        Wait before resending a request which hit a rate limit, unless it can
+        be sent with another token.
+        """
+        if not seconds:
+            return
+
+        print(f"\nRate limited. Waiting {seconds:,d}s to retry.")
+        with self._lock:
+            self.waited += seconds
+        time.sleep(seconds)
+
+    def status(self, resource="core"):
+        """
+        Return the live budget for a resource over all tokens.
+
+        :return: dict like `RateLimitScheduler.status`, with the totals of the
+            tokens and the earliest reset time.
+        """
+        statuses = [
+            scheduler.status(resource) for scheduler in self.schedulers.values()
+        ]
+        known = [status for status in statuses if status["remaining"] is not None]
+        resets = [status["reset_time"] for status in known if status["reset_time"]]
+
+        limit = sum(status["limit"] or 0 for status in known) if known else None
+        remaining = sum(status["remaining"] for status in known) if known else None
+        rate = sum(status["rate"] for status in statuses)
+        reset_time = min(resets) if resets else None
+
+        return {
+            "limit": limit,
+            "remaining": remaining,
+            "reset_time": reset_time,
+            "requests": sum(status["requests"] for status in statuses),
+            "rate": rate,
+            "reset_in": reset_time - time.time() if reset_time else None,
+            "exhausted_in": remaining / rate if known and rate else None,
+            "waited": self.waited + sum(status["waited"] for status in statuses),
+        }
+
+    def summary(self, resource="core"):
+        """
+        Return a line of text describing the live budget for a resource over
+        all tokens.
+        """
+        line = format_status(self.status(resource))
+        if len(self.schedulers) > 1:
+            line += f" - {len(self.schedulers)} tokens"
+
+        return line
+
+    def usage(self, resource="core"):
+        """
+        Return lines of text with the requests sent with each token and its
+        remaining budget for a resource.
+        """
+        lines = []
+        for token, scheduler in self.schedulers.items():
+            status = scheduler.status(resource)
+            if status["remaining"] is None:
+                budget = "unknown"
+            else:
+                budget = f"{status['remaining']:,d} / {status['limit']:,d} remaining"
+            lines.append(
+                f"Token {token_label(token)}: {status['requests']:,d} requests"
+                f" - {budget} - waited {status['waited']:.0f}s"
+            )
+
+        return "\n".join(lines)
+
+
+SCHEDULER = TokenPool(
+    config.ACCESS_TOKENS,
+    config.RATE_LIMIT_PER_MINUTE,
+    config.RATE_LIMIT_BURST,
+    config.RATE_LIMIT_RESERVE,
+)
@@ -0,0 +1,196 @@
+"""
+Search library module.
+
+Find issues and PRs with the Search API, rather than listing every item of
+every repo and filtering them locally.
+    https://docs.github.com/en/rest/search#search-issues-and-pull-requests
+
+Usage:
+    from lib import search
+
+    queries = search.build_queries(
+        "is:pr", ["user:MichaelCurrin"], ["author:abc", "author:def"]
+    )
+    for query in queries:
+        for item in search.search_issues(repo._requester, query, min_date):
+            print(item["repository_url"], item["number"])
+
+Qualifiers of the same kind, such as several `author:` or `repo:` values, are
+joined with OR by the API, so one query can cover a batch of authors. A query
+has a max length, so the values are split into as many queries as needed.
+
+A search only gives the first 1,000 results. Each query is run over a window of
+update times, and a window with more results than that is split in half and
+each half searched instead, until every window fits. Results are sorted by
+most recently updated first, so an item which is updated during a search can
+be given twice or moved between windows and missed, as when paging any
+listing.
+
+Requests are sent through the requester of a PyGithub object, as for
+`lib.graphql`. Search requests count against the search rate limit, which the
+scheduler tracks apart from the core rate limit.
+"""
+
+import datetime
+
+SEARCH_PATH = "/search/issues"
+MAX_QUERY_LENGTH = 256
+MAX_RESULTS = 1000
+PER_PAGE = 100
+
+# Start of a search window when there is no min date.
+EARLIEST_TIME = datetime.datetime(2008, 1, 1)
+# Length of an `updated:` qualifier with a start and end time, which is kept
+# free in each query.
+WINDOW_LENGTH = len(" updated:2008-01-01T00:00:00Z..2008-01-01T00:00:00Z")
+
+
+def format_time(value):
+    """
+    Format a datetime for a qualifier.
+
+    >>> format_time(datetime.datetime(2021, 3, 4, 5, 6, 7))
+    '2021-03-04T05:06:07Z'
+    """
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def batch_qualifiers(query, qualifiers, max_length=MAX_QUERY_LENGTH):
+    """
+    Split qualifiers into batches, which each fit in a query after a prefix.
+
+    :param query: Start of the query, which each batch is added to.
+    :param qualifiers: List of qualifiers, e.g. ["author:abc", "author:def"].
+    :param max_length: Max length of the query with a batch added.
+
+    :raises ValueError: If a qualifier does not fit on its own.
+
+    :return: List of batches, each a string of qualifiers.
+
+    >>> batch_qualifiers("is:pr", ["author:abc", "author:def"], 30)
+    ['author:abc author:def']
+    >>> batch_qualifiers("is:pr", ["author:abc", "author:def"], 20)
+    ['author:abc', 'author:def']
+    """
+    batches = []
+    batch = []
+    length = len(query)
+
+    for qualifier in qualifiers:
+        if length + 1 + len(qualifier) > max_length:
+            if not batch:
+                raise ValueError(f"Qualifier is too long for a query: {qualifier}")
+            batches.append(" ".join(batch))
+            batch = []
+            length = len(query)
+
+        batch.append(qualifier)
+        length += 1 + len(qualifier)
+
+    if batch:
+        batches.append(" ".join(batch))
+
+    return batches
+
+
+def build_queries(query, *qualifier_lists):
+    """
+    Build queries which together cover every value of each list of qualifiers.
+
+    Each list is split into batches, and there is a query for each combination
+    of batches. Room is kept in each query for a window of update times.
+
+    :param query: Qualifiers which are in every query, e.g. "is:pr is:open".
+    :param qualifier_lists: Lists of qualifiers of the same kind, which are
+        joined with OR, e.g. ["repo:a/b", "repo:c/d"]. An empty list is
+        skipped.
+
+    :return: List of queries.
+
+    >>> build_queries("is:pr", ["user:abc"], ["author:x", "author:y"])
+    ['is:pr user:abc author:x author:y']
+    >>> build_queries("is:pr", [])
+    ['is:pr']
+    """
+    queries = [query]
+    max_length = MAX_QUERY_LENGTH - WINDOW_LENGTH
+
+    for qualifiers in qualifier_lists:
+        if qualifiers:
+            queries = [
+                f"{query} {batch}"
+                for query in queries
+                for batch in batch_qualifiers(query, qualifiers, max_length)
+            ]
+
+    return queries
+
+
+def _get_page(requester, query, page):
+    _, data = requester.requestJsonAndCheck(
+        "GET",
+        SEARCH_PATH,
+        parameters={
+            "q": query,
+            "sort": "updated",
+            "order": "desc",
+            "per_page": PER_PAGE,
+            "page": page,
+        },
+    )
+
+    return data
+
+
+def search_issues(requester, query, start=None, end=None):
+    """
+    Search issues and PRs updated in a window of time, splitting the window
+    as needed to get every result.
+
+    :param requester: PyGithub requester, such as from a repo object.
+    :param query: Search query, without an `updated:` qualifier.
+    :param start: Earliest update time to include, or None for no limit.
+    :param end: Latest update time to include, or None for the current time.
+
+    :return: Generator which yields the JSON of each result, as a dict. The
+        items of each window are most recently updated first, and the windows
+        go from the latest to the earliest.
+    """
+    start = start or EARLIEST_TIME
+    end = end or datetime.datetime.now(datetime.timezone.utc).replace(
+        tzinfo=None, microsecond=0
+    )
+    windows = [(start, end)]
+
+    while windows:
+        window_start, window_end = windows.pop()
+        window_query = (
+            f"{query} updated:{format_time(window_start)}..{format_time(window_end)}"
+        )
+        data = _get_page(requester, window_query, 1)
+        total = data["total_count"]
+
+        if total > MAX_RESULTS and window_end - window_start > datetime.timedelta(
+            seconds=1
+        ):
+            middle = window_start + (window_end - window_start) / 2
+            middle = middle.replace(microsecond=0)
+            # The earlier half is popped last, so the latest results go first.
+            windows.append((window_start, middle))
+            windows.append((middle + datetime.timedelta(seconds=1), window_end))
+            continue
+
+        if total > MAX_RESULTS:
+            print(
+                f"Search has {total:,d} results in one second, so only the first"
+                f" {MAX_RESULTS:,d} are used: {window_query}"
+            )
+
+        page = 1
+        while True:
+            yield from data["items"]
+
+            if page * PER_PAGE >= min(total, MAX_RESULTS) or not data["items"]:
+                break
+            page += 1
+            data = _get_page(requester, window_query, page)
@@ -24,6 +24,7 @@ without filtering.
 from etc import config
 from github import UnknownObjectException
 from lib.connection import CONN
+from lib.fetch_plan import explicit
 
 
 def check_repo(repo_path):
@@ -58,7 +59,8 @@ def check_user(username):
     """
     print(username, end=" ")
     try:
-        CONN.get_user(username)
+        with explicit():
+            CONN.get_user(username)
         print("OK")
     except UnknownObjectException:
         print()
@@ -0,0 +1,501 @@
+"""
+Writers library module.
+
+Usage:
+    from lib.writers import open_writer
+
+    with open_writer(csv_path, header, column_types, filters) as writer:
+        for repo in repos:
+            if not writer.is_done(repo.full_name):
+                writer.write_repo(repo.full_name, rows_for(repo))
+
+Write the rows of a report to a file as they are produced, instead of keeping
+all rows in memory until the end.
+
+The format is set by `OUTPUT_FORMAT` in the config:
+    - "csv": A CSV, with non-numeric values quoted.
+    - "parquet": A Parquet file, with typed columns.
+    - "feather": A Feather file, which is the Arrow IPC file format, with typed
+        columns. This is the fastest to load.
+
+Parquet and Feather need the optional `pyarrow` package. Their columns are
+typed using the column types given by a report, so dates stay as dates and
+counts as integers when loaded with pandas. Other columns are strings.
+
+Rows are written to a partial path next to the output path. When the report
+completes, the partial output is moved or combined to the output path, so the
+output is never left half-written.
+
+After all rows for a repo are written, a checkpoint file is saved with the
+repos which are done and the state of the partial output. If the report fails,
+the partial output and checkpoint are kept. On the next run with the same
+format, header and filters, any rows after the last checkpoint are dropped and
+repos which are done are skipped, so the report continues where it stopped.
+
+Completed outputs of the same report, such as from the shards of the sharded
+report runner, can be combined in order with `merge_outputs`.
+"""
+import csv
+import glob
+import json
+import os
+import shutil
+
+from etc import config
+
+
+class ReportWriter:
+    """
+    Base class to write report rows as they are produced, with checkpoints
+    for each repo.
+
+    Subclasses set an extension and implement the methods which handle the
+    partial output.
+    """
+
+    EXTENSION = None
+
+    def __init__(self, path, header, column_types=None, filters=None):
+        """
+        :param path: Path of the completed output.
+        :param header: Column names.
+        :param column_types: Optional dict of column name to one of "int" or
+            "date", for columns which are not strings. This is only used by
+            typed formats.
+        :param filters: JSON-serializable value of the report's filters, such
+            as the configured usernames and min date. A partial output is only
+            resumed if these match.
+        """
+        self.path = path
+        self.header = list(header)
+        self.column_types = column_types or {}
+        self.filters = filters
+
+        self.partial_path = f"{path}.partial"
+        self.checkpoint_path = f"{path}.checkpoint.json"
+
+        self.done = []
+
+    def __enter__(self):
+        checkpoint = self._load_checkpoint()
+
+        if checkpoint:
+            self.done = checkpoint["done"]
+            print(f"Resuming {self.partial_path} after {len(self.done)} repos")
+            self._resume(checkpoint["state"])
+        else:
+            print(f"Writing to {self.path}")
+            self._start()
+            self._save_checkpoint()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._close()
+
+        if exc_type is None:
+            self._finish()
+            os.remove(self.checkpoint_path)
+            print(f"Wrote {self.path}")
+        else:
+            print(f"Kept partial report at {self.partial_path} - run again to resume")
+
+    def _load_checkpoint(self):
+        """
+        Return the checkpoint for a partial output which can be resumed, or
+        None.
+        """
+        try:
+            with open(self.checkpoint_path) as f_in:
+                checkpoint = json.load(f_in)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.exists(self.partial_path):
+            return None
+        if checkpoint.get("header") != self.header:
+            return None
+        if checkpoint.get("filters") != self.filters:
+            return None
+
+        return checkpoint
+
+    def _save_checkpoint(self):
+        """
+        Record which repos are done, after their rows are on disk.
+        """
+        checkpoint = {
+            "header": self.header,
+            "filters": self.filters,
+            "done": self.done,
+            "state": self._state(),
+        }
+
+        # Write to a temp file first so a reader never sees a partial file.
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f_out:
+            json.dump(checkpoint, f_out)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def is_done(self, key):
+        """
+        Check if rows for a repo were written in a previous run.
+        """
+        return key in self.done
+
+    def write_rows(self, rows):
+        """
+        Write rows.
+
+        :param rows: Iterable of rows as dicts, which have keys matching the
+            header.
+
+        :return: Count of rows written.
+        """
+        count = 0
+
+        for row in rows:
+            self._write_row(row)
+            count += 1
+
+        return count
+
+    def write_repo(self, key, rows):
+        """
+        Write all rows for a repo and then save a checkpoint.
+
+        :param key: Full name of the repo.
+        :param rows: Iterable of rows for the repo.
+
+        :return: Count of rows written.
+        """
+        count = self.write_rows(rows)
+        self.done.append(key)
+        self._save_checkpoint()
+
+        return count
+
+    def _start(self):
+        """
+        Create a new partial output.
+        """
+        raise NotImplementedError
+
+    def _resume(self, state):
+        """
+        Open the partial output, dropping anything written after the state.
+        """
+        raise NotImplementedError
+
+    def _write_row(self, row):
+        raise NotImplementedError
+
+    def _state(self):
+        """
+        Make sure rows written so far are on disk and return a JSON-serializable
+        value which can be used to resume from this point.
+        """
+        raise NotImplementedError
+
+    def _close(self):
+        """
+        Close the partial output, whether or not the report succeeded.
+        """
+        raise NotImplementedError
+
+    def _finish(self):
+        """
+        Move or combine the partial output to the output path.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def merge(cls, paths, path):
+        """
+        Write the rows of completed outputs to a single output, in order.
+
+        :param paths: Paths of outputs with the same header.
+        :param path: Path of the merged output.
+        """
+        raise NotImplementedError
+
+
+class CSVWriter(ReportWriter):
+    """
+    Write report rows to a CSV file, flushing after each row.
+
+    The state of the partial file is its size in bytes.
+    """
+
+    EXTENSION = ".csv"
+
+    def __init__(self, path, header, column_types=None, filters=None):
+        super().__init__(path, header, column_types, filters)
+
+        self._f_out = None
+        self._writer = None
+
+    def _open(self, mode):
+        self._f_out = open(self.partial_path, mode)
+        self._writer = csv.DictWriter(
+            self._f_out, fieldnames=self.header, quoting=csv.QUOTE_NONNUMERIC
+        )
+
+    def _start(self):
+        self._open("w")
+        self._writer.writeheader()
+
+    def _resume(self, state):
+        os.truncate(self.partial_path, state)
+        self._open("a")
+
+    def _write_row(self, row):
+        self._writer.writerow(row)
+        self._f_out.flush()
+
+    def _state(self):
+        self._f_out.flush()
+        os.fsync(self._f_out.fileno())
+
+        return os.fstat(self._f_out.fileno()).st_size
+
+    def _close(self):
+        self._f_out.close()
+
+    def _finish(self):
+        os.replace(self.partial_path, self.path)
+
+    @classmethod
+    def merge(cls, paths, path):
+        # Copy bytes so that line endings and quoting are kept as written.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f_out:
+            for index, input_path in enumerate(paths):
+                with open(input_path, "rb") as f_in:
+                    header = f_in.readline()
+                    if index == 0:
+                        f_out.write(header)
+                    shutil.copyfileobj(f_in, f_out)
+        os.replace(tmp_path, path)
+
+
+class ArrowWriter(ReportWriter):
+    """
+    Base class to write report rows to a typed columnar file with pyarrow.
+
+    Parquet and Feather files cannot be appended to, so rows are written in
+    parts to a partial directory, with a part for each repo or for every
+    `ROWS_PER_PART` rows. On completion, the parts are combined into the output
+    file one at a time, so that only one part is in memory. The state of the
+    partial directory is the count of parts.
+    """
+
+    ROWS_PER_PART = 10_000
+
+    def __init__(self, path, header, column_types=None, filters=None):
+        super().__init__(path, header, column_types, filters)
+
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(
+                "The pyarrow package is needed for Parquet and Feather output."
+                " Install it or set OUTPUT_FORMAT to 'csv'."
+            )
+        self._pa = pyarrow
+
+        types = {"int": pyarrow.int64(), "date": pyarrow.date32()}
+        self.schema = pyarrow.schema(
+            (name, types.get(self.column_types.get(name), pyarrow.string()))
+            for name in self.header
+        )
+
+        self._parts = 0
+        self._buffer = []
+
+    def _part_path(self, index):
+        return os.path.join(self.partial_path, f"{index:06d}.arrow")
+
+    def _start(self):
+        shutil.rmtree(self.partial_path, ignore_errors=True)
+        os.makedirs(self.partial_path)
+
+    def _resume(self, state):
+        self._parts = state
+
+        for path in glob.glob(os.path.join(self.partial_path, "*.arrow")):
+            if int(os.path.basename(path).split(".")[0]) >= self._parts:
+                os.remove(path)
+
+    def _write_row(self, row):
+        self._buffer.append(row)
+
+        if len(self._buffer) >= self.ROWS_PER_PART:
+            self._write_part()
+
+    def _write_part(self):
+        if not self._buffer:
+            return
+
+        table = self._pa.Table.from_pylist(self._buffer, schema=self.schema)
+        path = self._part_path(self._parts)
+        tmp_path = f"{path}.tmp"
+
+        with self._pa.OSFile(tmp_path, "wb") as sink:
+            with self._pa.ipc.new_file(sink, self.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        self._parts += 1
+        self._buffer = []
+
+    def _read_parts(self):
+        """
+        Yield each part as a table, in the order written.
+        """
+        for index in range(self._parts):
+            with self._pa.memory_map(self._part_path(index)) as source:
+                yield self._pa.ipc.open_file(source).read_all()
+
+    def _state(self):
+        self._write_part()
+
+        return self._parts
+
+    def _close(self):
+        pass
+
+    def _finish(self):
+        self._write_part()
+
+        tmp_path = f"{self.path}.tmp"
+        self._combine(tmp_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self.partial_path)
+
+    def _combine(self, path):
+        """
+        Write all parts to a single output file.
+        """
+        raise NotImplementedError
+
+
+class ParquetWriter(ArrowWriter):
+    """
+    Write report rows to a Parquet file, with a row group for each part.
+    """
+
+    EXTENSION = ".parquet"
+
+    def _combine(self, path):
+        import pyarrow.parquet
+
+        with pyarrow.parquet.ParquetWriter(path, self.schema) as writer:
+            for table in self._read_parts():
+                writer.write_table(table)
+            if not self._parts:
+                writer.write_table(self.schema.empty_table())
+
+    @classmethod
+    def merge(cls, paths, path):
+        import pyarrow.parquet
+
+        tmp_path = f"{path}.tmp"
+        schema = pyarrow.parquet.read_schema(paths[0])
+        with pyarrow.parquet.ParquetWriter(tmp_path, schema) as writer:
+            for input_path in paths:
+                parquet_file = pyarrow.parquet.ParquetFile(input_path)
+                for index in range(parquet_file.num_row_groups):
+                    writer.write_table(parquet_file.read_row_group(index))
+        os.replace(tmp_path, path)
+
+
+class FeatherWriter(ArrowWriter):
+    """
+    Write report rows to a Feather file, which is an Arrow IPC file with LZ4
+    compression.
+    """
+
+    EXTENSION = ".feather"
+
+    def _combine(self, path):
+        options = self._pa.ipc.IpcWriteOptions(compression="lz4")
+
+        with self._pa.OSFile(path, "wb") as sink:
+            with self._pa.ipc.new_file(sink, self.schema, options=options) as writer:
+                for table in self._read_parts():
+                    writer.write_table(table)
+
+    @classmethod
+    def merge(cls, paths, path):
+        import pyarrow
+
+        tmp_path = f"{path}.tmp"
+        options = pyarrow.ipc.IpcWriteOptions(compression="lz4")
+        with pyarrow.memory_map(paths[0]) as source:
+            schema = pyarrow.ipc.open_file(source).schema
+
+        with pyarrow.OSFile(tmp_path, "wb") as sink:
+            with pyarrow.ipc.new_file(sink, schema, options=options) as writer:
+                for input_path in paths:
+                    with pyarrow.memory_map(input_path) as source:
+                        reader = pyarrow.ipc.open_file(source)
+                        for index in range(reader.num_record_batches):
+                            writer.write_batch(reader.get_batch(index))
+        os.replace(tmp_path, path)
+
+
+WRITERS = {
+    "csv": CSVWriter,
+    "parquet": ParquetWriter,
+    "feather": FeatherWriter,
+}
+
+
+def open_writer(csv_path, header, column_types=None, filters=None, output_format=None):
+    """
+    Create a writer for a report in the configured output format.
+
+    :param csv_path: Path of the report as a CSV. For other formats, the
+        extension is replaced.
+    :param header: Column names.
+    :param column_types: Optional dict of column name to "int" or "date".
+    :param filters: JSON-serializable value of the report's filters.
+    :param output_format: Key of `WRITERS`. Defaults to the configured format.
+
+    :return: ReportWriter instance, to be used as a context manager.
+    """
+    writer_class = WRITERS[output_format or config.OUTPUT_FORMAT]
+
+    return writer_class(
+        output_path(csv_path, output_format), header, column_types, filters
+    )
+
+
+def output_path(csv_path, output_format=None):
+    """
+    Return the path of a report in the configured output format.
+
+    >>> output_path("var/pr_report.csv", "parquet")
+    'var/pr_report.parquet'
+    """
+    writer_class = WRITERS[output_format or config.OUTPUT_FORMAT]
+
+    return os.path.splitext(csv_path)[0] + writer_class.EXTENSION
+
+
+def merge_outputs(paths, csv_path, output_format=None):
+    """
+    Combine completed outputs of a report into one, in the order given.
+
+    :param paths: Paths of the outputs, in the configured output format.
+    :param csv_path: Path of the merged report as a CSV. For other formats,
+        the extension is replaced.
+    :param output_format: Key of `WRITERS`. Defaults to the configured format.
+
+    :return: Path of the merged output.
+    """
+    path = output_path(csv_path, output_format)
+    WRITERS[output_format or config.OUTPUT_FORMAT].merge(paths, path)
+
+    return path
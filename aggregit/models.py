@@ -7,6 +7,12 @@ store the data of interest in this project.
 This only is needed only printing, so wait until producing report rather
 and store the commit or pr etc. itself rather. In nested structure.
 
+To keep memory low for large reports, the models use `__slots__` and keep only
+primitive values, such as a user's login and name instead of the PyGithub user
+object. Parts which need extra requests, such as a PR's commits and reviews or
+a commit's stats, are fetched on first access and then the PyGithub object is
+released.
+
 Resources for objects which are not modeled use but are still used PyGithub
 objects.
   - Branches:
@@ -14,8 +20,112 @@ objects.
   - Repos:
         https://pygithub.readthedocs.io/en/latest/github_objects/Repository.html
 """
+from collections import namedtuple
+
 import github
 import lib
+from lib import fetch_plan, parse_iso_datetime
+from lib.connection import get_commit_stats, get_pr_commit_range
+from lib.display_names import DISPLAY_NAMES
+from lib.profiler import PROFILER
+
+# A user with just the fields used for display. This matches the attributes of a
+# PyGithub NamedUser that `lib.display` uses.
+Actor = namedtuple("Actor", ("login", "name"))
+
+# Fields of a PR which are only in the full PR and not in a listing of PRs.
+PullRequestDetails = namedtuple(
+    "PullRequestDetails",
+    (
+        "merged_by",
+        "commit_count",
+        "comment_count",
+        "changed_files",
+        "additions",
+        "deletions",
+    ),
+)
+
+# A commit of a PR with just the fields used in the PR report, which are all in
+# a listing of the PR's commits.
+CommitSummary = namedtuple("CommitSummary", ("sha", "author", "datetime"))
+
+
+def actor_from_user(user):
+    """
+    Convert a PyGithub user to an Actor, or None if there is no user.
+
+    The name is looked up in the display names cache, so a user's profile is
+    only requested the first time their login is seen.
+    """
+    if not user:
+        return None
+
+    return Actor(user.login, DISPLAY_NAMES.name(user))
+
+
+def to_actor(node):
+    """
+    Convert a GraphQL user node to an Actor, or None if there is no user.
+
+    The name field is only present for a User, not for other actors such as
+    a Bot.
+    """
+    if not node:
+        return None
+
+    actor = Actor(node["login"], node.get("name"))
+    DISPLAY_NAMES.add(*actor)
+
+    return actor
+
+
+def summarize_commit(data):
+    """
+    Convert the JSON of a commit, such as from a listing of a PR's commits, to
+    a CommitSummary.
+
+    The author is None if the commit's email is not linked to a GitHub user.
+    """
+    user = data["author"]
+    author = Actor(user["login"], DISPLAY_NAMES.name(user["login"])) if user else None
+    commit = data["commit"]
+    date = commit["author"]["date"] or commit["committer"]["date"]
+
+    return CommitSummary(data["sha"], author, parse_iso_datetime(date))
+
+
+def summarize_commit_node(node):
+    """
+    Convert a GraphQL PR commit node to a CommitSummary.
+    """
+    commit = node["commit"]
+    date = commit["authoredDate"] or commit["committedDate"]
+
+    return CommitSummary(
+        commit["oid"], to_actor(commit["author"]["user"]), parse_iso_datetime(date)
+    )
+
+
+def _stored_actor(value):
+    """
+    Convert a user of a record of `lib.entity_store` to an Actor, or None if
+    there is no user.
+    """
+    return Actor(*value) if value else None
+
+
+def _stored_commit(record):
+    """
+    Convert a commit of a PR record of `lib.entity_store` to a CommitSummary,
+    or None if it was not stored.
+    """
+    if not record:
+        return None
+
+    return CommitSummary(
+        record["sha"], _stored_actor(record["author"]), record["datetime"]
+    )
 
 
 class Review:
@@ -48,6 +158,8 @@ class Review:
         "COMMENTED",
     )
 
+    __slots__ = ("_state", "submitted_at", "reviewer")
+
     def __init__(self, review: github.PullRequestReview.PullRequestReview):
         """
         Expects a PyGithub Commit object as returned from the API.
@@ -55,7 +167,31 @@ class Review:
         """
         self._state = review.state
         self.submitted_at = review.submitted_at.date()
-        self.reviewer = review.user
+        self.reviewer = actor_from_user(review.user)
+
+    @classmethod
+    def from_graphql(cls, node):
+        """
+        Create a Review from a GraphQL review node.
+        """
+        review = cls.__new__(cls)
+        review._state = node["state"]
+        review.submitted_at = parse_iso_datetime(node["submittedAt"]).date()
+        review.reviewer = to_actor(node["author"])
+
+        return review
+
+    @classmethod
+    def from_store(cls, record):
+        """
+        Create a Review from a review of a PR record of `lib.entity_store`.
+        """
+        review = cls.__new__(cls)
+        review._state = record["state"]
+        review.submitted_at = record["submitted_at"]
+        review.reviewer = _stored_actor(record["reviewer"])
+
+        return review
 
     @classmethod
     def format_state(_cls, s):
@@ -97,16 +233,47 @@ class PullRequest:
     mind when interpreting the values. For example, multiple users may
     contribute commits to a PR and the commit count is the sum of all.
 
-    The .get_commits call uses pagination and returns only one commit by
-    default unless you slice it. Note the API returns 250 commits on a page.
-    For `github.PaginatedList.PaginatedList` class, see:
+    Only the oldest and latest commits are kept, as CommitSummary values, and
+    these are usually on a single page of the PR's commits. Note the API only
+    lists the first 250 commits of a PR.
         https://developer.github.com/v3/pulls/#list-commits-on-a-pull-request
+
+    The fields which are only in the full PR, such as the merged by user and
+    the counts of lines, and the latest and oldest commits and the reviews are
+    only fetched when first used. So a PR from a listing needs no requests if
+    none of these are used. Until then, the source PyGithub object is kept.
+    Users are stored as Actor values. Assignees are stored as logins, as they are not used in
+    reports, so their names are only looked up when displayed.
     """
 
     STATUS_MERGED = "Merged"
     STATUS_CLOSED = "Closed"
     STATUS_OPEN = "Open"
 
+    __slots__ = (
+        "number",
+        "title",
+        "from_branch_name",
+        "to_branch_name",
+        "author",
+        "url",
+        "merged",
+        "merged_at",
+        "closed",
+        "closed_at",
+        "status",
+        "created_at",
+        "updated_at",
+        "assignees",
+        "jira_ticket",
+        "_source",
+        "_details",
+        "_latest_commit",
+        "_oldest_commit",
+        "_reviews",
+    )
+
+    @PROFILER.timed("PullRequest.__init__")
     def __init__(self, pr: github.PullRequest.PullRequest):
         """
         Initialize customized PR object based on an existing GitHub PR object.
@@ -115,59 +282,321 @@ class PullRequest:
         self.title = pr.title
         self.from_branch_name = pr.head.ref
         self.to_branch_name = pr.base.ref
-        self.author = pr.user
+        self.author = actor_from_user(pr.user)
         self.url = pr.html_url
 
-        self.merged = pr.merged
-        if pr.merged:
-            self.merged_at = pr.merged_at.date()
-            self.merged_by = pr.merged_by
-        else:
-            self.merged_at = None
-            self.merged_by = None
+        # The merged field is not in a listing, but the merged time is.
+        self.merged = pr.merged_at is not None
+        self.merged_at = pr.merged_at.date() if self.merged else None
 
         self.closed = pr.state == "closed"
         self.closed_at = pr.closed_at.date() if self.closed else None
-
-        if self.merged:
-            self.status = self.STATUS_MERGED
-        elif self.closed:
-            self.status = self.STATUS_CLOSED
-        else:
-            self.status = self.STATUS_OPEN
+        self._set_status()
 
         self.created_at = pr.created_at.date()
         self.updated_at = pr.updated_at.date()
 
-        self.commit_count = pr.commits
-        self.comment_count = pr.comments
-        self.changed_files = pr.changed_files
-        self.additions = pr.additions
-        self.deletions = pr.deletions
-
         # This is a plain list and not a paginated list.
-        self.assignees = pr.assignees
+        self.assignees = tuple(user.login for user in pr.assignees)
+
+        self.jira_ticket = lib.extract_jira_ticket(pr.body, pr.title)
+
+        self._source = pr
+        self._details = None
+        self._latest_commit = None
+        self._oldest_commit = None
+        self._reviews = None
+
+    @PROFILER.timed("PullRequest.details")
+    def _load_details(self):
+        """
+        Fetch the full PR, if it is from a listing, and keep the fields which
+        are only in the full PR.
+        """
+        pr = self._source
+        fetch_plan.complete(pr)
+
+        self._details = PullRequestDetails(
+            merged_by=actor_from_user(pr.merged_by) if self.merged else None,
+            commit_count=pr.commits,
+            comment_count=pr.comments,
+            changed_files=pr.changed_files,
+            additions=pr.additions,
+            deletions=pr.deletions,
+        )
+        self._release_source()
 
-        # This is paged commits - so its hard to check if there are zero
-        # commits which could cause error in the next part.
-        commits = pr.get_commits()
+    @property
+    def details(self):
+        if self._details is None:
+            self._load_details()
+
+        return self._details
+
+    @property
+    def merged_by(self):
+        return self.details.merged_by
+
+    @property
+    def commit_count(self):
+        return self.details.commit_count
+
+    @property
+    def comment_count(self):
+        return self.details.comment_count
+
+    @property
+    def changed_files(self):
+        return self.details.changed_files
+
+    @property
+    def additions(self):
+        return self.details.additions
+
+    @property
+    def deletions(self):
+        return self.details.deletions
+
+    def _load_commits(self):
+        """
+        Fetch the latest and oldest commits of the PR.
+
+        The count of commits is in the PR's details, which are fetched first
+        if needed, so that the page with the latest commit is known.
+        """
+        commit_count = self.commit_count
+
+        with PROFILER.span("PullRequest.commits"):
+            oldest, latest = get_pr_commit_range(self._source, commit_count)
 
         # Avoid 'first' and 'last' names to avoid confusion with the list
         # indexes.
-        # Negative indexing does not work here so rather use .reversed method.
-        self.latest_commit = Commit(commits.reversed[0])
-        self.oldest_commit = Commit(commits[0])
-
-        self.reviews = [
-            Review(review)
-            for review in pr.get_reviews()
-            if review.state in Review.STATES
-        ]
-
-        self.jira_ticket = lib.extract_jira_ticket(pr.body) or lib.extract_jira_ticket(
-            pr.title
+        self._latest_commit = summarize_commit(latest)
+        self._oldest_commit = summarize_commit(oldest)
+        self._release_source()
+
+    def _release_source(self):
+        """
+        Drop the source PyGithub object once all lazy parts are loaded.
+        """
+        if (
+            self._details is not None
+            and self._latest_commit is not None
+            and self._reviews is not None
+        ):
+            self._source = None
+
+    @property
+    def latest_commit(self):
+        if self._latest_commit is None:
+            self._load_commits()
+
+        return self._latest_commit
+
+    @property
+    def oldest_commit(self):
+        if self._oldest_commit is None:
+            self._load_commits()
+
+        return self._oldest_commit
+
+    @property
+    def reviews(self):
+        if self._reviews is None:
+            with PROFILER.span("PullRequest.reviews"):
+                self._reviews = tuple(
+                    Review(review)
+                    for review in self._source.get_reviews()
+                    if review.state in Review.STATES
+                )
+            self._release_source()
+
+        return self._reviews
+
+    @classmethod
+    def from_loaded(cls, pr, oldest_commit, latest_commit, reviews):
+        """
+        Create a PullRequest from PyGithub objects which were already fetched,
+        such as with the async client, so that nothing is fetched later.
+
+        Parts which were not fetched, as they are not needed, are None.
+
+        :param pr: PyGithub PR object, which is complete if its details were
+            fetched.
+        :param oldest_commit: JSON of the commit, or None.
+        :param latest_commit: JSON of the commit, or None.
+        :param reviews: Iterable of PyGithub review objects, or None.
+        """
+        pr_data = cls(pr)
+
+        if oldest_commit is not None:
+            pr_data._oldest_commit = summarize_commit(oldest_commit)
+            pr_data._latest_commit = summarize_commit(latest_commit)
+        if reviews is not None:
+            pr_data._reviews = tuple(
+                Review(review) for review in reviews if review.state in Review.STATES
+            )
+
+        return pr_data
+
+    @classmethod
+    def from_graphql(cls, node):
+        """
+        Create a PullRequest from a GraphQL PR node.
+
+        The node is expected to have the fields requested by
+        `lib.graphql.get_pull_requests`. The attributes are set to the same
+        values as for a PyGithub PR object, so a report row is the same for
+        either API.
+        """
+        pr = cls.__new__(cls)
+
+        pr.number = node["number"]
+        pr.title = node["title"]
+        pr.from_branch_name = node["headRefName"]
+        pr.to_branch_name = node["baseRefName"]
+        pr.author = to_actor(node["author"])
+        pr.url = node["url"]
+
+        pr.merged = node["merged"]
+        pr.merged_at = parse_iso_datetime(node["mergedAt"]).date() if pr.merged else None
+
+        # A merged PR has state MERGED in GraphQL but closed in REST.
+        pr.closed = node["state"] != "OPEN"
+        pr.closed_at = parse_iso_datetime(node["closedAt"]).date() if pr.closed else None
+        pr._set_status()
+
+        pr.created_at = parse_iso_datetime(node["createdAt"]).date()
+        pr.updated_at = parse_iso_datetime(node["updatedAt"]).date()
+
+        pr._details = PullRequestDetails(
+            merged_by=to_actor(node["mergedBy"]) if pr.merged else None,
+            commit_count=node["commits"]["totalCount"],
+            comment_count=node["comments"]["totalCount"],
+            changed_files=node["changedFiles"],
+            additions=node["additions"],
+            deletions=node["deletions"],
+        )
+
+        for user in node["assignees"]["nodes"]:
+            DISPLAY_NAMES.add(user["login"], user["name"])
+        pr.assignees = tuple(user["login"] for user in node["assignees"]["nodes"])
+
+        pr.jira_ticket = lib.extract_jira_ticket(node["body"], node["title"])
+
+        pr._source = None
+        pr._latest_commit = summarize_commit_node(node["latestCommit"]["nodes"][0])
+        pr._oldest_commit = summarize_commit_node(node["oldestCommit"]["nodes"][0])
+        pr._reviews = tuple(
+            Review.from_graphql(review)
+            for review in node["reviews"]["nodes"]
+            if review["state"] in Review.STATES
         )
 
+        return pr
+
+    def to_store(self):
+        """
+        Return the PR's values as a dict for `lib.entity_store`.
+
+        Parts which were not fetched are None, so that nothing is fetched for
+        the store.
+        """
+        details = self._details
+        oldest, latest = self._oldest_commit, self._latest_commit
+
+        return {
+            "number": self.number,
+            "title": self.title,
+            "from_branch_name": self.from_branch_name,
+            "to_branch_name": self.to_branch_name,
+            "author": self.author,
+            "url": self.url,
+            "merged": self.merged,
+            "merged_at": self.merged_at,
+            "closed": self.closed,
+            "closed_at": self.closed_at,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "assignees": list(self.assignees),
+            "jira_ticket": self.jira_ticket,
+            "details": details._asdict() if details is not None else None,
+            "oldest_commit": oldest._asdict() if oldest is not None else None,
+            "latest_commit": latest._asdict() if latest is not None else None,
+            "reviews": (
+                [
+                    {
+                        "state": review._state,
+                        "submitted_at": review.submitted_at,
+                        "reviewer": review.reviewer,
+                    }
+                    for review in self._reviews
+                ]
+                if self._reviews is not None
+                else None
+            ),
+        }
+
+    @classmethod
+    def from_store(cls, record):
+        """
+        Create a PullRequest from a record of `lib.entity_store`, so that
+        nothing is fetched.
+
+        Parts which were not stored are None, and reading them raises an
+        error, as there is no source PR to fetch them from.
+        """
+        pr = cls.__new__(cls)
+
+        pr.number = record["number"]
+        pr.title = record["title"]
+        pr.from_branch_name = record["from_branch_name"]
+        pr.to_branch_name = record["to_branch_name"]
+        pr.author = _stored_actor(record["author"])
+        pr.url = record["url"]
+
+        pr.merged = record["merged"]
+        pr.merged_at = record["merged_at"]
+        pr.closed = record["closed"]
+        pr.closed_at = record["closed_at"]
+        pr._set_status()
+
+        pr.created_at = record["created_at"]
+        pr.updated_at = record["updated_at"]
+        pr.assignees = tuple(record["assignees"])
+        pr.jira_ticket = record["jira_ticket"]
+
+        details = record["details"]
+        pr._details = (
+            PullRequestDetails(
+                **{**details, "merged_by": _stored_actor(details["merged_by"])}
+            )
+            if details
+            else None
+        )
+
+        pr._source = None
+        pr._latest_commit = _stored_commit(record["latest_commit"])
+        pr._oldest_commit = _stored_commit(record["oldest_commit"])
+        pr._reviews = (
+            tuple(Review.from_store(review) for review in record["reviews"])
+            if record["reviews"] is not None
+            else None
+        )
+
+        return pr
+
+    def _set_status(self):
+        """
+        Set the status label from the merged and closed values.
+        """
+        if self.merged:
+            self.status = self.STATUS_MERGED
+        elif self.closed:
+            self.status = self.STATUS_CLOSED
+        else:
+            self.status = self.STATUS_OPEN
+
     def status_changed_at(self):
         """
         If merged or closed, get the date that the change happened on.
@@ -228,26 +657,122 @@ class Commit:
 
     Expect a PyGithub Commit as returned from the API:
         https://pygithub.readthedocs.io/en/latest/github_objects/Commit.html
+
+    The stats and files of a commit are not included when commits are listed,
+    so these are only fetched when first used, with a request for the commit,
+    or ahead of time with `load_stats`. Only the count of files is kept.
     """
 
-    def __init__(self, commit: github.GitCommit.GitCommit):
+    __slots__ = (
+        "sha",
+        "url",
+        "author",
+        "committer_login",
+        "datetime",
+        "message",
+        "_source",
+        "_changed_files",
+        "_additions",
+        "_deletions",
+    )
+
+    def __init__(self, commit: github.GitCommit.GitCommit, with_stats=True):
         """
         Initialize Commit object based on a GitHub commit object.
+
+        :param commit: PyGithub commit object.
+        :param with_stats: If False, the source commit is not kept to fetch
+            stats later, so the stats and count of files will be None.
         """
         self.sha = commit.sha
         self.url = commit.html_url
 
-        # Just a str.
-        self.author = commit.author
-        self.committer = commit.committer
+        self.author = actor_from_user(commit.author)
+        self.committer_login = commit.committer.login if commit.committer else None
 
         # No parsing needed as this is already datetime object.
         self.datetime = commit.commit.author.date or commit.commit.committer.date
         self.message = commit.commit.message
 
-        self.files = commit.files
-        self.additions = commit.stats.additions
-        self.deletions = commit.stats.deletions
+        self._source = commit if with_stats else None
+        self._changed_files = None
+        self._additions = None
+        self._deletions = None
+
+    def load_stats(self):
+        """
+        Fetch the stats and count of files of the commit, if needed.
+        """
+        if self._source is None:
+            return
+
+        with PROFILER.span("Commit.stats"):
+            stats = get_commit_stats(self._source)
+        self._changed_files, self._additions, self._deletions = stats
+        self._source = None
+
+    def to_store(self):
+        """
+        Return the commit's values as a dict for `lib.entity_store`.
+
+        The stats are None if they were not fetched.
+        """
+        return {
+            "sha": self.sha,
+            "url": self.url,
+            "author": self.author,
+            "committer_login": self.committer_login,
+            "datetime": self.datetime,
+            "message": self.message,
+            "changed_files": self._changed_files,
+            "additions": self._additions,
+            "deletions": self._deletions,
+        }
+
+    @classmethod
+    def from_store(cls, record):
+        """
+        Create a Commit from a record of `lib.entity_store`, so that nothing
+        is fetched.
+        """
+        commit = cls.__new__(cls)
+
+        commit.sha = record["sha"]
+        commit.url = record["url"]
+        commit.author = _stored_actor(record["author"])
+        commit.committer_login = record["committer_login"]
+        commit.datetime = record["datetime"]
+        commit.message = record["message"]
+
+        commit._source = None
+        commit._changed_files = record["changed_files"]
+        commit._additions = record["additions"]
+        commit._deletions = record["deletions"]
+
+        return commit
+
+    @property
+    def additions(self):
+        self.load_stats()
+
+        return self._additions
+
+    @property
+    def deletions(self):
+        self.load_stats()
+
+        return self._deletions
+
+    @property
+    def changed_files(self):
+        """
+        Return count of files changed in the commit.
+
+        This is None for a commit which was created without its stats.
+        """
+        self.load_stats()
+
+        return self._changed_files
 
     @property
     def short_sha(self):
@@ -263,10 +788,6 @@ class Commit:
         """
         return lib.truncate(self.message, 50)
 
-    @property
-    def changed_files(self):
-        return len(self.files)
-
     def __repr__(self):
         """
         Summarize attributes when printing an instance.
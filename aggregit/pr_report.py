@@ -14,17 +14,131 @@ Also requires configured usernames, such that only PRs created by these users
 are included. A commit doesn't have to have an author - if blank assume it
 was by the PR author (as it probably was).
 """
+
+import asyncio
 import datetime
+import math
 import traceback
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
+import github
 import lib
 from etc import config
+from lib import async_client, fetch_plan, graphql, pr_listing, search
+from lib.capture import CAPTURE
+from lib.connection import MAX_PER_PAGE, MAX_PR_COMMITS
+from lib.entity_store import ENTITY_STORE
+from lib.profiler import PROFILER
+from lib.row_store import RowStore
+from lib.scheduler import SCHEDULER
+from lib.writers import open_writer
 from models import PullRequest, Review
 
 ONE_DAY = datetime.timedelta(days=1)
+ONE_SECOND = datetime.timedelta(seconds=1)
+
+# Repos to process at once with the async backend.
+ASYNC_REPOS_PER_BATCH = 10
+# Search qualifiers for each configured PR state. Note that closed PRs
+# include merged PRs, as in the REST API.
+SEARCH_STATES = {
+    "open": "is:open",
+    "closed": "is:closed",
+    "merged": "is:merged",
+    "all": None,
+}
+
+HEADER = (
+    "Repo Owner",
+    "Repo Name",
+    "Repo URL",
+    "PR ID",
+    "PR Title",
+    "PR From Branch",
+    "PR To Branch",
+    "Author",
+    "PR URL",
+    "Jira Ticket",
+    "Status",
+    "Merged/Closed WOY",
+    "Merged/Closed Date",
+    "PR Updated At",
+    "PR Created At",
+    "Latest Commit At",
+    "Oldest Commit At",
+    "Days Between Commits",
+    "Latest Commit Author",
+    "Oldest Commit Author",
+    "Commits",
+    "Changed Files",
+    "Added Lines",
+    "Deleted Lines",
+    "Changed Lines",
+    "Comments",
+    "Merged By",
+    "Reviewers",
+) + Review.get_states()
+COLUMN_TYPES = {
+    **dict.fromkeys(
+        (
+            "Merged/Closed Date",
+            "PR Updated At",
+            "PR Created At",
+            "Latest Commit At",
+            "Oldest Commit At",
+        ),
+        "date",
+    ),
+    **dict.fromkeys(
+        (
+            "Days Between Commits",
+            "Commits",
+            "Changed Files",
+            "Added Lines",
+            "Deleted Lines",
+            "Changed Lines",
+            "Comments",
+        )
+        + Review.get_states(),
+        "int",
+    ),
+}
+
+# Parts of a PR which need extra requests, with the columns which use them.
+# Other columns are read from the listing of PRs.
+COLUMN_PARTS = {
+    "details": (
+        "Merged By",
+        "Comments",
+        "Commits",
+        "Changed Files",
+        "Added Lines",
+        "Deleted Lines",
+        "Changed Lines",
+    ),
+    "commits": (
+        "Latest Commit At",
+        "Oldest Commit At",
+        "Days Between Commits",
+        "Latest Commit Author",
+        "Oldest Commit Author",
+    ),
+    "reviews": ("Reviewers",) + Review.get_states(),
+}
+
+# Keys of a stored PR record which are None if a part was not stored.
+STORED_PARTS = {
+    "details": "details",
+    "commits": "latest_commit",
+    "reviews": "reviews",
+}
 
+COLUMNS = fetch_plan.select_columns(HEADER, config.PR_COLUMNS)
+PARTS = fetch_plan.parts_needed(COLUMNS, COLUMN_PARTS)
 
+
+@PROFILER.timed("to_row")
 def to_row(repo, author, pr):
     """
     Convert PR elements to a row of data.
@@ -33,22 +147,20 @@ def to_row(repo, author, pr):
     get the counts for each possible review action and add them as columns to
     the row (using zero as default value).
 
+    Only the parts of the PR which are needed for the configured columns are
+    fetched, and the row only has those columns.
+
     :param github.Repository.Repository repo: GitHub repo object.
     :param github.NamedUser.NamedUser author: GitHub user object.
-    :param github.PullRequest.PullRequest pr: GitHub PR object.
+    :param github.PullRequest.PullRequest pr: GitHub PR object. Or, a
+        PullRequest instance which was already created, such as from the
+        GraphQL API.
 
     :return dict out_row: dict of data around a PR's repo, the PR author and
         the PR itself. The status changed, created and updated date will be kept
         as datetime.datetime objects.
     """
-    pr_data = PullRequest(pr)
-
-    latest_commit_at = pr_data.latest_commit.datetime.date()
-    oldest_commit_at = pr_data.oldest_commit.datetime.date()
-    days_between_commits = (latest_commit_at - oldest_commit_at + ONE_DAY).days
-
-    latest_commit_author = lib.display(pr_data.latest_commit.author)
-    oldest_commit_author = lib.display(pr_data.oldest_commit.author)
+    pr_data = pr if isinstance(pr, PullRequest) else PullRequest(pr)
 
     out_row = {
         "Repo Owner": lib.display(repo.owner),
@@ -63,34 +175,686 @@ def to_row(repo, author, pr):
         "Jira Ticket": pr_data.jira_ticket,
         "PR Updated At": pr_data.updated_at,
         "PR Created At": pr_data.created_at,
-        "Latest Commit At": latest_commit_at,
-        "Latest Commit Author": latest_commit_author,
-        "Oldest Commit At": oldest_commit_at,
-        "Oldest Commit Author": oldest_commit_author,
-        "Days Between Commits": days_between_commits,
         "Status": pr_data.status,
         "Merged/Closed WOY": pr_data.status_changed_week_of_year(),
         "Merged/Closed Date": pr_data.status_changed_at(),
-        "Merged By": pr_data.merged_by_name(),
-        "Reviewers": ", ".join(pr_data.reviewer_names()),
-        "Comments": pr_data.comment_count,
-        "Commits": pr_data.commit_count,
-        "Changed Files": pr_data.changed_files,
-        "Added Lines": pr_data.additions,
-        "Deleted Lines": pr_data.deletions,
-        "Changed Lines": pr_data.additions + pr.deletions,
     }
 
-    review_states = Counter([r.state for r in pr_data.reviews])
-    [review_states.setdefault(s, 0) for s in Review.get_states()]
-    out_row.update(**dict(review_states))
+    if "commits" in PARTS:
+        latest_commit_at = pr_data.latest_commit.datetime.date()
+        oldest_commit_at = pr_data.oldest_commit.datetime.date()
+
+        out_row.update(
+            {
+                "Latest Commit At": latest_commit_at,
+                "Latest Commit Author": lib.display(pr_data.latest_commit.author),
+                "Oldest Commit At": oldest_commit_at,
+                "Oldest Commit Author": lib.display(pr_data.oldest_commit.author),
+                "Days Between Commits": (
+                    latest_commit_at - oldest_commit_at + ONE_DAY
+                ).days,
+            }
+        )
+
+    if "details" in PARTS:
+        out_row.update(
+            {
+                "Merged By": pr_data.merged_by_name(),
+                "Comments": pr_data.comment_count,
+                "Commits": pr_data.commit_count,
+                "Changed Files": pr_data.changed_files,
+                "Added Lines": pr_data.additions,
+                "Deleted Lines": pr_data.deletions,
+                "Changed Lines": pr_data.additions + pr_data.deletions,
+            }
+        )
+
+    if "reviews" in PARTS:
+        out_row["Reviewers"] = ", ".join(pr_data.reviewer_names())
+
+        review_states = Counter([r.state for r in pr_data.reviews])
+        [review_states.setdefault(s, 0) for s in Review.get_states()]
+        out_row.update(**dict(review_states))
+
+    if len(COLUMNS) < len(HEADER):
+        out_row = {column: out_row[column] for column in COLUMNS}
 
     return out_row
 
 
+def safe_to_row(repo, author, pr):
+    """
+    Convert PR elements to a row of data, without raising an error.
+
+    Keep the report generation robust by returning and skipping over any
+    errors. Create a bug issue in the aggre-git repo on GitHub so that the
+    error will be addressed.
+
+    When writing to the entity store, the PR is saved with the parts which
+    were fetched for the row.
+
+    :return: Tuple of the row and None if successful, otherwise None and a
+        message with the formatted traceback of the error.
+    """
+    try:
+        pr_data = pr if isinstance(pr, PullRequest) else PullRequest(pr)
+        out_row = to_row(repo, author, pr_data)
+
+        if ENTITY_STORE.writing:
+            ENTITY_STORE.save_pr(repo.id, pr_data.to_store())
+
+        return out_row, None
+    except Exception:
+        return None, (
+            f"Could not fetch or parse PR #{pr.number}.\n{traceback.format_exc()}"
+        )
+
+
+def end_date():
+    """
+    Return the end of the configured date range, as the day after the max
+    date, or None if there is no max date.
+    """
+    return config.MAX_DATE + ONE_DAY if config.MAX_DATE else None
+
+
+def is_updated_after_range(updated_at):
+    return config.MAX_DATE is not None and updated_at >= end_date()
+
+
+def select_prs(repos):
+    """
+    Get PRs within the configured date range and by the configured users.
+
+    PRs are listed by most recently updated first, so that the listing stops
+    at the min date. The selected PRs are given in the same order, as they are
+    listed, so that each can be fetched while the listing continues.
+
+    :param repos: Iterable of GitHub repo objects.
+
+    :return: Generator which yields a tuple of repo, author and PR object.
+    """
+    for repo in repos:
+        print(f"REPO: {repo.name}")
+        print(SCHEDULER.summary())
+
+        pulls = pr_listing.list_prs(repo, config.PR_STATE, config.MIN_DATE, end_date())
+
+        for pr in PROFILER.iter_span("get_pulls", pulls):
+            author = pr.user
+            if is_by_users(pr):
+                print(f"PR #{pr.number} - author: @{author.login}")
+                yield repo, author, pr
+            else:
+                print(f"PR #{pr.number} - skipping")
+
+
+def select_prs_graphql(repos):
+    """
+    Get PRs within the configured date range and by the configured users,
+    using the GraphQL API.
+
+    This follows the same logic as `select_prs`, but each PR has all the
+    details needed for a row, so no further requests are needed when
+    converting it.
+
+    :param repos: Iterable of GitHub repo objects.
+
+    :return: Generator which yields a tuple of repo, author and PullRequest
+        instance.
+    """
+    for repo in repos:
+        print(f"REPO: {repo.name}")
+        print(SCHEDULER.summary("graphql"))
+
+        nodes = graphql.get_pull_requests(repo, config.PR_STATE)
+
+        for node in PROFILER.iter_span("get_pulls", nodes):
+            updated_at = lib.parse_iso_datetime(node["updatedAt"])
+            if config.MIN_DATE and updated_at < config.MIN_DATE:
+                print(
+                    f"Skipping PRs which were updated before the"
+                    f" configured min cuttoff date: {config.MIN_DATE}"
+                )
+                break
+            if is_updated_after_range(updated_at):
+                continue
+
+            login = node["author"]["login"] if node["author"] else None
+            if config.USERNAMES and login not in config.USERNAMES:
+                print(f"PR #{node['number']} - skipping")
+                continue
+
+            print(f"PR #{node['number']} - author: @{login}")
+            try:
+                pr_data = PullRequest.from_graphql(node)
+            except Exception:
+                print(f"Could not parse PR #{node['number']}.")
+                traceback.print_exc()
+                print("---")
+            else:
+                yield repo, pr_data.author, pr_data
+
+
+def search_prs(repos):
+    """
+    Find the PRs by the configured users and updated within the configured
+    date range, in a list of repos, with the Search API.
+
+    The authors and repos are split into as few queries as fit in the max
+    query length. For an owner, the owner is searched rather than each repo.
+
+    :param repos: List of GitHub repo objects.
+
+    :return: dict of the full name of each repo which has PRs which were
+        found, and a list of tuples of the PR number and JSON of the author,
+        by number descending as in a listing of PRs.
+    """
+    if not repos:
+        return {}
+
+    if config.BY_OWNER and config.SHARD_REPOS is None:
+        scopes = [f"user:{config.REPO_OWNER}"]
+    else:
+        scopes = [f"repo:{repo.full_name}" for repo in repos]
+    authors = [f"author:{login}" for login in config.USERNAMES or []]
+    query = " ".join(filter(None, ("is:pr", SEARCH_STATES[config.PR_STATE])))
+    queries = search.build_queries(query, scopes, authors)
+    print(f"Searching for PRs with {len(queries):,d} queries")
+
+    requester = repos[0]._requester
+    # The end of a search is the latest time to include.
+    end = end_date() - ONE_SECOND if config.MAX_DATE else None
+    found = {}
+    for query in queries:
+        items = search.search_issues(requester, query, config.MIN_DATE, end)
+
+        for item in PROFILER.iter_span("search_prs", items):
+            repo_name = item["repository_url"].split("/repos/", 1)[1]
+            found.setdefault(repo_name, {})[item["number"]] = item["user"]
+
+    print(f"Found {sum(len(prs) for prs in found.values()):,d} PRs")
+    print()
+
+    return {
+        repo_name: sorted(prs.items(), key=lambda item: item[0], reverse=True)
+        for repo_name, prs in found.items()
+    }
+
+
+def select_searched_prs(repo, found):
+    """
+    Get the PRs of a repo which were found with the Search API.
+
+    :param repo: GitHub repo object.
+    :param found: Result of `search_prs`.
+
+    :return: Generator which yields a tuple of repo, author and PR object. The
+        PR object only has its number and URL, as a search result is an issue
+        rather than a PR, so it must be fetched before it is used.
+    """
+    print(f"REPO: {repo.name}")
+    print(SCHEDULER.summary())
+
+    for number, user in found.get(repo.full_name, []):
+        author = github.NamedUser.NamedUser(repo._requester, {}, user, completed=False)
+        pr = github.PullRequest.PullRequest(
+            repo._requester,
+            {},
+            {"number": number, "url": f"{repo.url}/pulls/{number}"},
+            completed=False,
+        )
+        print(f"PR #{number} - author: @{author.login}")
+
+        yield repo, author, pr
+
+
+def safe_searched_to_row(repo, author, pr):
+    """
+    Fetch a PR which was found with the Search API and convert it to a row,
+    without raising an error.
+
+    :return: Tuple of the row and error, as returned by `safe_to_row`.
+    """
+    try:
+        with PROFILER.span("PullRequest.details"):
+            fetch_plan.complete(pr)
+    except Exception:
+        return None, f"Could not fetch PR #{pr.number}.\n{traceback.format_exc()}"
+
+    return safe_to_row(repo, author, pr)
+
+
+def hydrate_prs(selected, workers, convert=safe_to_row):
+    """
+    Fetch details for selected PRs and convert them to rows.
+
+    Most of the time for a PR is spent waiting on requests, so when using
+    more than one worker, PRs are converted in a pool of threads. At most
+    twice as many PRs as workers are queued at a time, so that PRs are not
+    listed too far ahead of processing. Results are yielded in the same order
+    as the input, so the report is the same regardless of workers.
+
+    :param selected: Iterable of tuples of repo, author and PR object.
+    :param workers: Number of PRs to process at the same time.
+    :param convert: Function to convert each PR, which is `safe_to_row` or
+        another function which returns the same.
+
+    :return: Generator which yields a tuple of the row and error for each PR,
+        as returned by `safe_to_row`.
+    """
+    if workers == 1:
+        for repo, author, pr in selected:
+            yield convert(repo, author, pr)
+
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        for repo, author, pr in selected:
+            pending.append(executor.submit(convert, repo, author, pr))
+
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def is_by_users(pr):
+    """
+    Check if a PR was created by one of the configured users, if any are set.
+    """
+    return not config.USERNAMES or pr.user.login in config.USERNAMES
+
+
+def is_in_state(pr):
+    """
+    Check if a PR matches the configured PR state, using the listed PR.
+    """
+    if config.PR_STATE == "all":
+        return True
+    if config.PR_STATE == "merged":
+        return pr.merged_at is not None
+
+    return pr.state == config.PR_STATE
+
+
+def select_updated_prs(repo, store, watermark):
+    """
+    Get the PRs of a repo which were updated since the watermark and need to
+    be fetched, and remove the stored rows of PRs which are no longer
+    selected.
+
+    :param repo: GitHub repo object.
+    :param store: `RowStore` for the report, with the repo started.
+    :param watermark: Watermark of the repo as a datetime, or None.
+
+    :return: Tuple of a list of tuples of repo, author and PR object, and the
+        update time of the most recently updated PR, or None if there are no
+        PRs.
+    """
+    newest_update = None
+    selected = []
+
+    pulls = repo.get_pulls(state="all", sort="updated", direction="desc")
+
+    for pr in PROFILER.iter_span("get_pulls", pulls):
+        if newest_update is None:
+            newest_update = pr.updated_at
+
+        if watermark and pr.updated_at < watermark:
+            break
+        if config.MIN_DATE and pr.updated_at < config.MIN_DATE:
+            break
+
+        if not (is_by_users(pr) and is_in_state(pr)):
+            print(f"PR #{pr.number} - skipping")
+            store.delete(repo.full_name, pr.number)
+        elif store.updated_at(repo.full_name, pr.number) == pr.updated_at:
+            print(f"PR #{pr.number} - unchanged since the last run")
+        else:
+            print(f"PR #{pr.number} - author: @{pr.user.login}")
+            selected.append((repo, pr.user, pr))
+
+    return selected, newest_update
+
+
+def incremental_rows(repos):
+    """
+    Get rows for PRs, fetching only PRs updated since the last run.
+
+    Rows and a watermark of the most recent PR update are kept for each repo
+    in the row store. PRs are listed by most recently updated first, so
+    listing stops at the first PR which was last updated before the
+    watermark, or before the min date. Listed PRs which are still selected are
+    fetched and converted again, while those which are no longer selected are
+    removed from the store. A PR which is stored with the update time it has
+    now, such as the PR at the watermark from the last run, has not changed,
+    so it is skipped rather than fetched again.
+
+    All states are listed, so that a PR which moved out of the configured
+    state is seen and removed. If a PR cannot be converted, the watermark is
+    set to that PR's update time, so it will be tried again on the next run.
+
+    :param repos: Iterable of GitHub repo objects.
+
+    :return: Generator which yields rows for each repo, ordered by PR number
+        descending.
+    """
+    filters = {
+        "usernames": sorted(config.USERNAMES or []),
+        "state": config.PR_STATE,
+        "columns": list(COLUMNS),
+    }
+
+    with RowStore(config.PR_STORE_PATH) as store:
+        for repo in repos:
+            print(f"REPO: {repo.name}")
+            print(SCHEDULER.summary())
+            watermark = store.start_repo(repo.full_name, filters, config.MIN_DATE)
+
+            if watermark:
+                print(f"Fetching PRs updated since the last run: {watermark}")
+            selected, newest_update = select_updated_prs(repo, store, watermark)
+
+            failed_update = None
+            results = hydrate_prs(selected, config.PR_WORKERS)
+
+            for (_, _, pr), (out_row, error) in zip(selected, results):
+                if error:
+                    print(error, end="")
+                    print("---")
+                    failed_update = min(failed_update or pr.updated_at, pr.updated_at)
+                else:
+                    store.save(repo.full_name, pr.number, pr.updated_at, out_row)
+
+            store.end_repo(repo.full_name, failed_update or newest_update)
+
+            yield from store.rows(repo.full_name, config.MIN_DATE)
+
+
+def repo_rows(repo):
+    """
+    Get rows for the PRs in a repo, using the configured mode and backend.
+
+    :param repo: GitHub repo object.
+
+    :return: Generator which yields a row for each PR. PRs which could not be
+        converted are reported and skipped.
+    """
+    if config.PR_INCREMENTAL:
+        yield from incremental_rows([repo])
+
+        return
+
+    if config.PR_BACKEND == "graphql":
+        selected = select_prs_graphql([repo])
+    else:
+        selected = select_prs([repo])
+
+    for out_row, error in hydrate_prs(selected, config.PR_WORKERS):
+        if error:
+            print(error, end="")
+            print("---")
+        else:
+            yield out_row
+
+
+def searched_rows(repo, found):
+    """
+    Get rows for the PRs of a repo which were found with the Search API.
+
+    :param repo: GitHub repo object.
+    :param found: Result of `search_prs`.
+
+    :return: Generator which yields a row for each PR. PRs which could not be
+        fetched or converted are reported and skipped.
+    """
+    selected = select_searched_prs(repo, found)
+
+    for out_row, error in hydrate_prs(
+        selected, config.PR_WORKERS, safe_searched_to_row
+    ):
+        if error:
+            print(error, end="")
+            print("---")
+        else:
+            yield out_row
+
+
+def stored_rows(repo):
+    """
+    Get rows for the PRs of a repo from the entity store, within the
+    configured date range and by the configured users, with no requests.
+
+    :param repo: GitHub repo object, from the stored repos.
+
+    :return: Generator which yields a row for each PR. PRs which were stored
+        without a part which the configured columns need are reported and
+        skipped.
+    """
+    print(f"REPO: {repo.name}")
+
+    records = ENTITY_STORE.pull_requests(
+        repo.id, config.USERNAMES, config.PR_STATE, config.MIN_DATE, config.MAX_DATE
+    )
+
+    for record in records:
+        missing = [part for part in PARTS if record[STORED_PARTS[part]] is None]
+        if missing:
+            print(f"PR #{record['number']} - not stored with: {', '.join(missing)}")
+            continue
+
+        pr_data = PullRequest.from_store(record)
+        out_row, error = safe_to_row(repo, pr_data.author, pr_data)
+        if error:
+            print(error, end="")
+            print("---")
+        else:
+            yield out_row
+
+
+async def _none():
+    return None
+
+
+async def fetch_pr_details(client, repo_name, listed):
+    """
+    Fetch the details, oldest and latest commits and reviews of a PR at once,
+    for the parts which are needed for the configured columns.
+
+    The latest commit is on the first page of the PR's commits, unless there
+    are more commits than fit on a page.
+
+    :param client: Async client.
+    :param repo_name: Full name of the repo.
+    :param listed: JSON of the PR from the listing of PRs.
+
+    :return: Tuple of the JSON for the PR, its oldest commit, its latest commit
+        and a list of its reviews. The PR is the listed PR if its details are
+        not needed, and the other values are None if not needed.
+    """
+    number = listed["number"]
+    needs_details = "details" in PARTS or "commits" in PARTS
+
+    pr, reviews, first_page = await asyncio.gather(
+        client.get_pull(repo_name, number) if needs_details else _none(),
+        client.get_reviews(repo_name, number) if "reviews" in PARTS else _none(),
+        client.get_pull_commits(repo_name, number) if "commits" in PARTS else _none(),
+    )
+
+    if first_page is None:
+        return pr or listed, None, None, reviews
+
+    last_page_number = math.ceil(min(pr["commits"], MAX_PR_COMMITS) / MAX_PER_PAGE)
+    if last_page_number > 1:
+        last_page = await client.get_pull_commits(repo_name, number, last_page_number)
+    else:
+        last_page = first_page
+
+    return pr, first_page[0], last_page[-1], reviews
+
+
+async def fetch_repo_prs(client, repo):
+    """
+    List PRs of a repo within the configured date range and by the configured
+    users, then fetch their details at once.
+
+    :return: List of tuples of the listed PR's JSON and either the result of
+        `fetch_pr_details` or the error it raised.
+    """
+    listed = []
+
+    pulls = client.iter_pulls(
+        repo.full_name, state=config.PR_STATE, sort="updated", direction="desc"
+    )
+
+    async for pr in pulls:
+        updated_at = lib.parse_iso_datetime(pr["updated_at"])
+        if config.MIN_DATE and updated_at < config.MIN_DATE:
+            break
+        if is_updated_after_range(updated_at):
+            continue
+
+        login = pr["user"]["login"] if pr["user"] else None
+        if not config.USERNAMES or login in config.USERNAMES:
+            listed.append(pr)
+
+    details = await asyncio.gather(
+        *(fetch_pr_details(client, repo.full_name, pr) for pr in listed),
+        return_exceptions=True,
+    )
+
+    return list(zip(listed, details))
+
+
+def loaded_object(content_class, requester, data):
+    """
+    Wrap fetched JSON in a complete PyGithub object, or return None if there
+    is no JSON.
+    """
+    if data is None:
+        return None
+
+    return content_class(requester, {}, data, completed=True)
+
+
+def loaded_rows(repo, fetched):
+    """
+    Convert PRs fetched with the async client to rows.
+
+    The JSON of the PR and reviews is wrapped in PyGithub objects, and the
+    commits are summarized from their JSON, so that the same models and rows
+    are used as for the REST backend.
+
+    :param repo: GitHub repo object.
+    :param fetched: Result of `fetch_repo_prs` for the repo.
+
+    :return: Generator which yields a row for each PR. PRs which could not be
+        fetched or converted are reported and skipped.
+    """
+    print(f"REPO: {repo.name}")
+    requester = repo._requester
+
+    for listed, details in fetched:
+        number = listed["number"]
+        print(f"PR #{number} - author: @{listed['user']['login']}")
+
+        try:
+            if isinstance(details, Exception):
+                raise details
+
+            pr, oldest_commit, latest_commit, reviews = details
+            pr_data = PullRequest.from_loaded(
+                github.PullRequest.PullRequest(
+                    requester, {}, pr, completed=pr is not listed
+                ),
+                oldest_commit,
+                latest_commit,
+                (
+                    None
+                    if reviews is None
+                    else [
+                        loaded_object(
+                            github.PullRequestReview.PullRequestReview,
+                            requester,
+                            review,
+                        )
+                        for review in reviews
+                    ]
+                ),
+            )
+        except Exception:
+            print(f"Could not fetch or parse PR #{number}.")
+            traceback.print_exc()
+            print("---")
+            continue
+
+        out_row, error = safe_to_row(repo, pr_data.author, pr_data)
+        if error:
+            print(error, end="")
+            print("---")
+        else:
+            yield out_row
+
+
+def async_repo_rows(repos):
+    """
+    Get rows for the PRs in several repos, using the async client to fetch a
+    batch of repos at once.
+
+    :param repos: Iterable of GitHub repo objects.
+
+    :return: Generator which yields a tuple of a repo and a generator of rows
+        for its PRs, in the order of the repos. A repo whose PRs could not be
+        listed is reported and skipped.
+    """
+    batch = []
+
+    for repo in repos:
+        batch.append(repo)
+
+        if len(batch) == ASYNC_REPOS_PER_BATCH:
+            yield from _async_batch_rows(batch)
+            batch = []
+
+    if batch:
+        yield from _async_batch_rows(batch)
+
+
+def _async_batch_rows(batch):
+    print(f"Fetching PRs for {len(batch)} repos")
+    with PROFILER.span("fetch_repo_prs"):
+        results = async_client.run_all(fetch_repo_prs, batch)
+
+    for repo, fetched in zip(batch, results):
+        if isinstance(fetched, Exception):
+            # Report error without aborting. The repo is not written, so it is
+            # fetched again when the report is run again.
+            print(f"Could not fetch PRs for repo {repo.full_name}.")
+            traceback.print_exception(type(fetched), fetched, fetched.__traceback__)
+            print("---")
+            continue
+
+        yield repo, loaded_rows(repo, fetched)
+
+
+def unwritten_repos(writer, repos):
+    """
+    Skip repos which were written in a previous run of the report.
+    """
+    for repo in repos:
+        if writer.is_done(repo.full_name):
+            print(f"REPO: {repo.name} - already written")
+        else:
+            yield repo
+
+
 def main():
     """
-    Main command-line function to fetch PR data then write a CSV.
+    Main command-line function to fetch PR data then write a report file.
 
     Set the usernames value in the config so that the report will either
     filter to specific usernames or show activity for all.
@@ -100,80 +864,87 @@ def main():
     public repos. Fallback to getting a user object if it wasn't actually
     an org.
 
-    Use the MIN_DATE value in the config to exclude PRs which were last updated
-    before the cutoff date. The API's default setting is to return PRs ordered
-    by most recently created first.
-        https://developer.github.com/v3/pulls/#list-pull-requests
-    Therefore if we encounter an old PR then skip remaining PRs and go the next
-    repo.
+    Use the MIN_DATE and MAX_DATE values in the config to only include PRs
+    which were last updated within a date range. PRs are listed by most
+    recently updated first, so if we encounter an old PR then skip remaining
+    PRs and go to the next repo.
+
+    Use the PR_WORKERS value in the config to fetch details for multiple PRs
+    at the same time.
+
+    Use the PR_INCREMENTAL value in the config to keep rows between runs and
+    only fetch PRs which were updated since the last run.
+
+    Use the PR_DISCOVERY value in the config to find PRs by the configured
+    users with the Search API, rather than listing every PR of each repo.
+
+    Use the PR_BACKEND value in the config to fetch PRs with the GraphQL API,
+    or with the REST API using the async client to process several repos at
+    once, instead of the REST API with PyGithub. The rows are the same for
+    each.
+
+    Use the ENTITY_STORE_MODE value in the config to save the fetched repos,
+    PRs and users to the entity store, or to report on the stored ones
+    instead of using the API.
+
+    Rows are written as they are produced, in the configured output format,
+    with a checkpoint after each repo. If the report fails, run it again to
+    skip the repos which were already written.
     """
     if config.MIN_DATE:
         print(f"PR updates min date: {config.MIN_DATE}")
     else:
         print("No PR updates min date set")
+    if config.MAX_DATE:
+        print(f"PR updates max date: {config.MAX_DATE}")
     print()
 
-    out_data = []
-    for repo in lib.get_repos():
-        print(f"REPO: {repo.name}")
+    lib.prefetch_names()
 
-        for pr in repo.get_pulls(state=config.PR_STATE):
-            if config.MIN_DATE and pr.updated_at < config.MIN_DATE:
-                print(
-                    f"Skipping PRs which were updated before the"
-                    f" configured min cuttoff date: {config.MIN_DATE}"
-                )
-                break
+    filters = {
+        "usernames": sorted(config.USERNAMES or []),
+        "state": config.PR_STATE,
+        "min_date": str(config.MIN_DATE),
+        "max_date": str(config.MAX_DATE),
+        "backend": config.PR_BACKEND,
+        "discovery": config.PR_DISCOVERY,
+        "columns": list(COLUMNS),
+    }
+    column_types = {
+        column: kind for column, kind in COLUMN_TYPES.items() if column in COLUMNS
+    }
 
-            author = pr.user
-            if not config.USERNAMES or author.login in config.USERNAMES:
-                print(f"PR #{pr.number} - author: @{author.login}")
-                try:
-                    out_row = to_row(repo, author, pr)
-                except Exception:
-                    # Keep the report generation robust by logging and skipping
-                    # over any errors. Create a bug issue in the aggre-git repo
-                    # on GitHub so that the error will be addressed.
-                    print("Could not fetch or parse the PR.")
-                    traceback.print_exc()
-                    print("---")
-                else:
-                    out_data.append(out_row)
-            else:
-                print(f"PR #{pr.number} - skipping")
+    with open_writer(config.PR_CSV_PATH, COLUMNS, column_types, filters) as writer:
+        with PROFILER.span("get_repos"):
+            repos = lib.get_repos()
+        repos = unwritten_repos(writer, PROFILER.iter_span("get_repos", repos))
 
-    header = (
-        "Repo Owner",
-        "Repo Name",
-        "Repo URL",
-        "PR ID",
-        "PR Title",
-        "PR From Branch",
-        "PR To Branch",
-        "Author",
-        "PR URL",
-        "Jira Ticket",
-        "Status",
-        "Merged/Closed WOY",
-        "Merged/Closed Date",
-        "PR Updated At",
-        "PR Created At",
-        "Latest Commit At",
-        "Oldest Commit At",
-        "Days Between Commits",
-        "Latest Commit Author",
-        "Oldest Commit Author",
-        "Commits",
-        "Changed Files",
-        "Added Lines",
-        "Deleted Lines",
-        "Changed Lines",
-        "Comments",
-        "Merged By",
-        "Reviewers",
-    ) + Review.get_states()
+        if ENTITY_STORE.reading:
+            for repo in repos:
+                writer.write_repo(repo.full_name, stored_rows(repo))
+        elif config.PR_BACKEND == "async":
+            for repo, rows in async_repo_rows(repos):
+                writer.write_repo(repo.full_name, rows)
+        elif config.PR_DISCOVERY == "search":
+            repos = list(repos)
+            found = search_prs(repos)
+            for repo in repos:
+                writer.write_repo(repo.full_name, searched_rows(repo, found))
+        else:
+            for repo in repos:
+                writer.write_repo(repo.full_name, repo_rows(repo))
 
-    lib.write_csv(config.PR_CSV_PATH, header, out_data)
+        print()
+        print(SCHEDULER.summary())
+        print(SCHEDULER.usage())
+        print(lib.DISPLAY_NAMES.summary())
+        print(fetch_plan.COMPLETIONS.summary())
+        print(CAPTURE.summary())
+        lib.save_names()
+
+    print()
+    print(PROFILER.summary())
+    PROFILER.save_trace("pr_report")
 
 
 if __name__ == "__main__":
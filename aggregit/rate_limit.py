@@ -4,6 +4,10 @@ Rate limit report.
 
 Get rate limiting status and reset time for the configured GitHub API token.
 
+This is a view onto the state of the rate limit scheduler in `lib.scheduler`,
+which every request made with `CONN` updates. The rate limit endpoint is
+requested to refresh the values, since nothing else is requested here.
+
 Check in the browser using your browser user rather than a token.
     https://developer.github.com/v3/rate_limit/
     "Note: Accessing this endpoint does not count against your REST API rate
@@ -13,13 +17,25 @@ import datetime
 import time
 
 from lib.connection import CONN
+from lib.scheduler import SCHEDULER
 
 
 def main():
     """
     Main command-line function.
     """
-    reset_time = datetime.datetime.fromtimestamp(CONN.rate_limiting_resettime)
+    CONN.get_rate_limit()
+    status = SCHEDULER.status()
+
+    if (
+        status["reset_time"] is None
+        or status["remaining"] is None
+        or not status["limit"]
+    ):
+        print("Rate limit is unknown or disabled for this API.")
+        return
+
+    reset_time = datetime.datetime.fromtimestamp(status["reset_time"])
     wait = reset_time - datetime.datetime.now()
 
     print(f"Reset time: {reset_time.time()}")
@@ -27,11 +43,16 @@ def main():
     print()
 
     while True:
-        remaining, total = CONN.rate_limiting
+        status = SCHEDULER.status()
+        remaining, total = status["remaining"], status["limit"]
+        if remaining is None or not total:
+            print("Rate limit is unknown or disabled for this API.")
+            return
         percent = remaining / total
         print(f"Remaining : {remaining:,d} / {total:,d} ({percent:3.2%})")
         print("Waiting...")
         time.sleep(5)
+        CONN.get_rate_limit()
 
 
 if __name__ == "__main__":
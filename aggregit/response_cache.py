@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Response cache report.
+
+Show the size of the on-disk cache of API responses, or remove responses from
+it. See `lib.cache` for how the cache works.
+
+Usage:
+    $ ./response_cache.py
+    $ ./response_cache.py prune
+    $ ./response_cache.py purge
+"""
+import sys
+
+from lib.cache import BYTES_PER_MB, RESPONSE_CACHE
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    action = args[0] if args else None
+
+    if action == "purge":
+        RESPONSE_CACHE.purge()
+        print(f"Purged cache: {RESPONSE_CACHE.directory}")
+    elif action == "prune":
+        removed = RESPONSE_CACHE.prune()
+        print(f"Removed   : {removed:,d}")
+    elif action is not None:
+        raise ValueError(f"Expected one of 'prune' or 'purge' but got: {action!r}")
+
+    count, total_size = RESPONSE_CACHE.size()
+    print(f"Directory : {RESPONSE_CACHE.directory}")
+    print(f"Responses : {count:,d}")
+    print(f"Size      : {total_size / BYTES_PER_MB:,.1f} MB")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Sharded report script.
+
+Run the PR or commit report in several processes, with the configured repos
+split between them, then merge their outputs into the same report which a
+single process would write. This is for orgs with hundreds of repos, where one
+process is limited by the time spent parsing responses and building objects,
+as well as by waiting on requests.
+
+Usage:
+    $ ./sharded_report.py pr_report
+    $ ./sharded_report.py commit_report WORKERS
+
+The default is a worker for each CPU.
+
+The repos are listed once and split into contiguous shards, one for each
+worker, so that joining the outputs in shard order gives the rows in the same
+order as a single process. Each worker is a new process with its own
+connection. Workers take the configured `ACCESS_TOKENS` in turn, and the
+configured request rate is split between the workers which use the same token.
+The response cache is shared. The display names of any configured orgs are
+fetched once before the workers start, and each worker starts from a copy of
+the stored display names, which are merged back once the workers finish.
+
+Each worker writes its output, stores, trace and log to a directory for its
+shard in `var/shards`. If a worker fails, the others still finish and the
+report is not merged. Run it again with the same workers to continue each
+shard from its last completed repo.
+
+Note that the commit report only skips commits which were seen in an earlier
+repo of the same shard, so repos which share history, such as forks, can give
+more rows than in a single process.
+"""
+import contextlib
+import importlib
+import multiprocessing
+import os
+import sys
+
+from etc import config
+
+REPORTS = {
+    "pr_report": "PR_CSV_PATH",
+    "commit_report": "COMMIT_CSV_PATH",
+}
+# Paths which are kept apart for each shard, so that workers do not write to
+# the same files.
+SHARD_PATHS = (
+    "PR_CSV_PATH",
+    "COMMIT_CSV_PATH",
+    "PR_STORE_PATH",
+    "COMMIT_INDEX_PATH",
+    "CAPTURE_PATH",
+    "NAME_CACHE_PATH",
+)
+
+
+def split_shards(items, count):
+    """
+    Split items into at most a count of contiguous shards, of nearly equal
+    size.
+
+    >>> split_shards([1, 2, 3, 4, 5], 2)
+    [[1, 2, 3], [4, 5]]
+    >>> split_shards([1, 2], 3)
+    [[1], [2]]
+    """
+    count = max(min(count, len(items)), 1)
+    size, extra = divmod(len(items), count)
+
+    shards = []
+    start = 0
+    for index in range(count):
+        end = start + size + (index < extra)
+        shards.append(items[start:end])
+        start = end
+
+    return shards
+
+
+def shard_values(index, count):
+    """
+    Return the config values for the worker of a shard.
+
+    All values of the config are copied, so that the worker runs with the same
+    config as this process. Then the token, request rate and paths are set for
+    the shard.
+
+    :param index: Index of the shard.
+    :param count: Count of shards.
+
+    :return: dict of config names and values.
+    """
+    values = {
+        name: getattr(config, name)
+        for name in dir(config)
+        if name.isupper() and not name.startswith("_")
+    }
+
+    tokens = config.ACCESS_TOKENS
+    token_index = index % len(tokens)
+    sharing = len(range(token_index, count, len(tokens)))
+    values["ACCESS_TOKEN"] = tokens[token_index]
+    values["ACCESS_TOKENS"] = [tokens[token_index]]
+    values["RATE_LIMIT_PER_MINUTE"] = config.RATE_LIMIT_PER_MINUTE / sharing
+    values["RATE_LIMIT_BURST"] = max(config.RATE_LIMIT_BURST // sharing, 1)
+
+    directory = os.path.join(config.SHARD_DIR, str(index))
+    values["OUTPUT_PATH"] = directory
+    for name in SHARD_PATHS:
+        values[name] = os.path.join(directory, os.path.basename(values[name]))
+
+    # Names of org members are fetched once by the runner.
+    values["NAME_CACHE_ORGS"] = []
+
+    return values
+
+
+def run_shard(report, values, repos):
+    """
+    Run a report in this process for a shard of repos, with the printed
+    output going to a log file in the shard's directory.
+
+    :param report: Name of the report module, e.g. "pr_report".
+    :param values: dict of config values for the shard.
+    :param repos: List of the raw data of the repos in the shard.
+    """
+    for name, value in values.items():
+        setattr(config, name, value)
+    config.SHARD_REPOS = repos
+
+    os.makedirs(config.OUTPUT_PATH, exist_ok=True)
+    log_path = os.path.join(config.OUTPUT_PATH, f"{report}.log")
+
+    # The report is imported after the config is set, as the connection is
+    # created with the token on import.
+    module = importlib.import_module(report)
+
+    with open(log_path, "w") as f_out, contextlib.redirect_stdout(f_out):
+        module.main()
+
+
+def main(args):
+    """
+    Main command-line function.
+    """
+    if not args or args[0] not in REPORTS:
+        raise ValueError(f"Expected one of {list(REPORTS)!r} as the report")
+    report = args[0]
+    workers = int(args[1]) if len(args) > 1 else os.cpu_count() or 1
+
+    # Imported here rather than at the top, so that a worker process which
+    # imports this module does not create a connection before its config is
+    # set.
+    import lib
+    from lib.writers import merge_outputs, output_path
+
+    # Read the data as listed, as `raw_data` would request each repo again.
+    repos = [repo._rawData for repo in lib.get_repos()]
+    shards = split_shards(repos, workers)
+    print(f"Repos: {len(repos):,d} - shards: {len(shards)}")
+
+    lib.prefetch_names()
+    lib.DISPLAY_NAMES.save()
+
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index, shard in enumerate(shards):
+        values = shard_values(index, len(shards))
+        if lib.DISPLAY_NAMES.path:
+            os.makedirs(values["OUTPUT_PATH"], exist_ok=True)
+            lib.DISPLAY_NAMES.save(values["NAME_CACHE_PATH"])
+        process = context.Process(target=run_shard, args=(report, values, shard))
+        process.start()
+        processes.append((process, values))
+
+    paths = []
+    failed = []
+    for index, (process, values) in enumerate(processes):
+        process.join()
+        print(
+            f"Shard {index}: {len(shards[index]):,d} repos - exit code {process.exitcode}"
+        )
+        if process.exitcode:
+            failed.append(index)
+        paths.append(output_path(values[REPORTS[report]]))
+        if lib.DISPLAY_NAMES.path:
+            lib.DISPLAY_NAMES.merge(values["NAME_CACHE_PATH"])
+
+    # Names fetched by a failed shard are kept too.
+    lib.DISPLAY_NAMES.save()
+
+    if failed:
+        print(f"Failed shards: {failed} - see the logs in {config.SHARD_DIR}")
+        print("Run again with the same workers to continue.")
+
+        return 1
+
+    path = merge_outputs(paths, getattr(config, REPORTS[report]))
+    print(f"Wrote {path}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))